@@ -0,0 +1,36 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# with 'bucketed_history' enabled for cassandra storage, room history is read from messages_by_time_bucket, which is
+# partitioned by (room, day), and only the days in message_days_by_target are queried; run this once after enabling
+# it to copy the messages stored before that (and to add the days of messages stored by versions without
+# message_days_by_target):
+#
+#   DINO_ENVIRONMENT=<env> python bin/backfill_history_buckets.py
+
+import logging
+import time
+
+from dino.environ import env
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+logger = logging.getLogger('backfill_history_buckets.py')
+
+driver = getattr(env.storage, 'driver', None)
+if driver is None or not hasattr(driver, 'backfill_time_buckets'):
+    logger.error('storage is not cassandra, nothing to backfill')
+else:
+    before = time.time()
+    logger.info('backfilling messages_by_time_bucket and message_days_by_target...')
+    n_copied = driver.backfill_time_buckets()
+    logger.info('done! copied %s messages in %.2fs' % (n_copied, time.time() - before))
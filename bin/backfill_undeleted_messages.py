@@ -0,0 +1,34 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# the undeleted messages of each user used to be found by filtering messages_by_from_user_id, but are now read from
+# the undeleted_messages_by_user table; run this once after upgrading to add the messages stored before the upgrade:
+#
+#   DINO_ENVIRONMENT=<env> python bin/backfill_undeleted_messages.py
+
+import logging
+import time
+
+from dino.environ import env
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+logger = logging.getLogger('backfill_undeleted_messages.py')
+
+driver = getattr(env.storage, 'driver', None)
+if driver is None or not hasattr(driver, 'backfill_undeleted_messages'):
+    logger.error('storage is not cassandra, nothing to backfill')
+else:
+    before = time.time()
+    logger.info('backfilling undeleted_messages_by_user...')
+    n_added = driver.backfill_undeleted_messages()
+    logger.info('done! added %s messages in %.2fs' % (n_added, time.time() - before))
@@ -0,0 +1,68 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+import sys
+import time
+
+from dino.utils.blacklist import WordMatcher
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+# roughly english letter frequencies, so that words share prefixes like real ones do
+LETTERS = 'etaoinshrdlcumwfgypbvkjxqz'
+WEIGHTS = [12, 9, 8, 8, 7, 7, 6, 6, 6, 4, 4, 3, 3, 2, 2, 2, 2, 2, 2, 2, 1, 1, .5, .3, .2, .1]
+
+N_MESSAGES = 2000
+WORDS_PER_MESSAGE = 15
+
+
+def random_word(min_length: int, max_length: int) -> str:
+    return ''.join(random.choices(LETTERS, WEIGHTS, k=random.randint(min_length, max_length)))
+
+
+def linear(blacklist: set, message: str) -> bool:
+    return any(word in message for word in blacklist)
+
+
+def run(n_words: int) -> None:
+    # most messages shouldn't contain any blacklisted word, since then the whole message has to be checked
+    blacklist = {random_word(6, 14) for _ in range(n_words)}
+    messages = [' '.join(random_word(2, 8) for _ in range(WORDS_PER_MESSAGE)) for _ in range(N_MESSAGES)]
+    avg_length = sum(len(message) for message in messages) / len(messages)
+
+    print('words: {}, messages: {}, avg. message length: {:.0f}'.format(len(blacklist), N_MESSAGES, avg_length))
+
+    start = time.time()
+    linear_results = [linear(blacklist, message) for message in messages]
+    print('[linear] avg time: {:.4f}ms'.format((time.time() - start) / N_MESSAGES * 1000))
+
+    start = time.time()
+    matcher = WordMatcher(blacklist)
+    build_time = time.time() - start
+
+    start = time.time()
+    matcher_results = [matcher.contains_any(message) for message in messages]
+    print('[matcher] avg time: {:.4f}ms, built in {:.2f}s'.format(
+        (time.time() - start) / N_MESSAGES * 1000, build_time))
+
+    if linear_results != matcher_results:
+        raise AssertionError('matcher and linear scan disagree')
+    print('messages with a blacklisted word: {:.1f}%'.format(100 * sum(matcher_results) / N_MESSAGES))
+    print()
+
+
+if __name__ == '__main__':
+    random.seed(1)
+    sizes = [int(size) for size in sys.argv[1:]] or [1000, 60000, 200000]
+    for size in sizes:
+        run(size)
@@ -0,0 +1,76 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# compares marking messages as read in the redis storage one command per message (how it used to be done) with an
+# HMGET and one pipeline; fakeredis has no network, so against a real redis the difference in round trips dominates:
+#
+#   python bin/benchmark_redis_acks.py [n_messages ...]
+
+import sys
+import time
+from uuid import uuid4 as uuid
+
+from dino.config import AckStatus
+from dino.config import RedisKeys
+from dino.storage.redis import StorageRedis
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+N_ROUNDS = 50
+RECEIVER_ID = '1234'
+ROOM_ID = '4321'
+
+
+def per_message(storage: StorageRedis, message_ids: set, status: int) -> int:
+    n_round_trips = 0
+    current = dict()
+    for message_id in message_ids:
+        ack = storage.redis.hget(RedisKeys.ack_for_user(RECEIVER_ID), message_id)
+        n_round_trips += 1
+        if ack is not None:
+            current[message_id] = int(float(str(ack, 'utf-8')))
+
+    for message_id in message_ids:
+        if current.get(message_id, -1) >= status:
+            continue
+        storage.redis.hset(RedisKeys.ack_for_user(RECEIVER_ID), message_id, str(status))
+        storage.redis.sadd(RedisKeys.ack_for_room(ROOM_ID), message_id)
+        n_round_trips += 2
+    return n_round_trips
+
+
+def batched(storage: StorageRedis, message_ids: set, status: int) -> int:
+    storage.mark_as_read(message_ids, RECEIVER_ID, ROOM_ID)
+    # one HMGET and one pipeline
+    return 2
+
+
+def run(n_messages: int) -> None:
+    storage = StorageRedis('mock')
+    print('messages: {}, rounds: {}'.format(n_messages, N_ROUNDS))
+
+    for name, mark in [('per message', per_message), ('batched', batched)]:
+        storage.redis.flushall()
+        n_round_trips = 0
+        start = time.time()
+        for _ in range(N_ROUNDS):
+            message_ids = {str(uuid()) for _ in range(n_messages)}
+            n_round_trips += mark(storage, message_ids, AckStatus.READ)
+        print('[{}] avg time: {:.3f}ms, round trips: {}'.format(
+            name, (time.time() - start) / N_ROUNDS * 1000, n_round_trips // N_ROUNDS))
+    print()
+
+
+if __name__ == '__main__':
+    sizes = [int(size) for size in sys.argv[1:]] or [10, 100, 1000]
+    for size in sizes:
+        run(size)
@@ -11,6 +11,8 @@ from kombu import Exchange
 from kombu import Queue
 from kombu.pools import producers
 
+from dino.endpoint.codec import decode
+
 logger = logging.getLogger(__name__)
 logging.getLogger('kafka').setLevel(logging.WARNING)
 logging.getLogger('kafka.conn').setLevel(logging.WARNING)
@@ -216,7 +218,7 @@ class KafkaReader(object):
         )
 
         try:
-            message_value = json.loads(message.value.decode('ascii'))
+            message_value = decode(message.value)
         except Exception as e:
             logger.error('could not decode message from kafka, dropping: {}'.format(str(e)))
             logger.exception(e)
@@ -0,0 +1,34 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# the redis storage used to keep the history of a room as a list of comma separated messages, but now keeps each
+# message in a hash and the message ids of a room in a sorted set; run this once after upgrading to move the history
+# stored before that (rooms not yet moved will have an empty history until this is run):
+#
+#   DINO_ENVIRONMENT=<env> python bin/migrate_redis_history.py
+
+import logging
+import time
+
+from dino.environ import env
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+logger = logging.getLogger('migrate_redis_history.py')
+
+if not hasattr(env.storage, 'migrate_history'):
+    logger.error('storage is not redis, nothing to migrate')
+else:
+    before = time.time()
+    logger.info('migrating redis history...')
+    n_migrated = env.storage.migrate_history()
+    logger.info('done! migrated %s messages in %.2fs' % (n_migrated, time.time() - before))
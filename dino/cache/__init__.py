@@ -27,6 +27,14 @@ class ICache(Interface):
         :return: true if still online, false otherwise
         """
 
+    def check_heartbeats(self, user_ids: list) -> set:
+        """
+        same as check_heartbeat() but for many users in one round trip
+
+        :param user_ids: a list of user uuids
+        :return: the set of user uuids that are still online
+        """
+
     def has_heartbeat(self, user_id: str) -> bool:
         """
         check if user has been authenticated to get a heartbeat
@@ -170,6 +178,31 @@ class ICache(Interface):
         :return: nothing
         """
 
+    def set_node_for_sid(self, sid: str, node: str) -> None:
+        """
+        remember which node a sid is connected to, so events for the user can be sent straight to that node
+
+        :param sid: the sid of the connection
+        :param node: the name of the internal queue of the node
+        :return: nothing
+        """
+
+    def get_nodes_for_sids(self, sids: list) -> list:
+        """
+        get the nodes the sids are connected to
+
+        :param sids: a list of sids
+        :return: a list of node queue names in the same order as the sids, with None for unknown sids
+        """
+
+    def remove_node_for_sid(self, sid: str) -> None:
+        """
+        forget the node of a sid, e.g. when it disconnects
+
+        :param sid: the sid of the connection
+        :return: nothing
+        """
+
     def get_sids_for_user(self, user_id: str) -> Union[None, list]:
         """
         get all sids for this user, or None if not cached
@@ -478,6 +511,71 @@ class ICache(Interface):
         :return: nothing
         """
 
+    def get_black_list_version(self) -> int:
+        """
+        get the version of the black list, which changes every time the black list is changed or reset, so users of
+        the black list know when they have to look at it again
+
+        :return: the version, or None if not known
+        """
+
+    def increase_black_list_version(self) -> None:
+        """
+        tell users of the black list that it has changed; done by the methods of the cache that change the black list,
+        call after changing it somewhere else
+
+        :return: nothing
+        """
+
+    def get_recent_history(self, room_id: str, limit: int) -> Union[list, None]:
+        """
+        get the cached latest messages of a room, in the same format as from IStorage.get_history()
+
+        :param room_id: the uuid of the room
+        :param limit: max number of messages to return
+        :return: the latest messages, newest first, or None if not cached
+        """
+
+    def get_recent_history_version(self, room_id: str) -> str:
+        """
+        get the current version of the cached history of a room; call before reading the history from the storage,
+        and pass it to set_recent_history() afterwards
+
+        :param room_id: the uuid of the room
+        :return: an opaque version string
+        """
+
+    def set_recent_history(self, room_id: str, messages: list, version: str, ttl: int=600) -> None:
+        """
+        cache the latest messages of a room, unless messages were added to or removed from the room since the version
+        was read, in which case the messages might already be outdated
+
+        :param room_id: the uuid of the room
+        :param messages: the latest messages, newest first, as returned by IStorage.get_history()
+        :param version: the version from get_recent_history_version() before reading the messages
+        :param ttl: seconds until the cached messages are read from the storage again
+        :return: nothing
+        """
+
+    def add_to_recent_history(self, room_id: str, message: dict, limit: int) -> None:
+        """
+        add a new message to the cached history of a room, if the history of that room is cached
+
+        :param room_id: the uuid of the room
+        :param message: the message, in the same format as from IStorage.get_history()
+        :param limit: max number of messages to keep
+        :return: nothing
+        """
+
+    def remove_recent_history(self, room_id: str=None) -> None:
+        """
+        remove the cached history of a room after messages in it were deleted or undeleted
+
+        :param room_id: the uuid of the room, or None to remove the cached history of all rooms, e.g. when the rooms
+        of the messages are not known
+        :return: nothing
+        """
+
     def get_black_list(self) -> set:
         """
         return the cached black list; a set of forbidden words
@@ -612,6 +710,23 @@ class ICache(Interface):
         :return: the name of the user
         """
 
+    def get_user_names(self, user_ids: list) -> dict:
+        """
+        get the names for many users at once, checking the in-memory cache first and then fetching the rest from redis
+        in a single round trip
+
+        :param user_ids: a list of user ids
+        :return: a dict of {user_id: user_name}, users without a cached name are not included
+        """
+
+    def set_user_names(self, user_names: dict) -> None:
+        """
+        set the names for many users at once in a single round trip
+
+        :param user_names: a dict of {user_id: user_name}
+        :return: nothing
+        """
+
     def set_user_name(self, user_id: str, user_name: str) -> None:
         """
         set the name of a user in the cache
@@ -761,6 +876,23 @@ class ICache(Interface):
         :return:
         """
 
+    def get_user_statuses(self, user_ids: list) -> dict:
+        """
+        get the statuses for many users at once, checking the in-memory cache first and then fetching the rest from
+        redis in a single round trip
+
+        :param user_ids: a list of user ids
+        :return: a dict of {user_id: status}, users without a cached status are not included
+        """
+
+    def set_user_statuses(self, statuses: dict) -> None:
+        """
+        set the statuses for many users at once in a single round trip
+
+        :param statuses: a dict of {user_id: status}
+        :return: nothing
+        """
+
     def user_check_status(self, user_id, other_status):
         """
 
@@ -811,6 +943,14 @@ class ICache(Interface):
         :return:
         """
 
+    def set_users_offline(self, user_ids: list) -> None:
+        """
+        set many users as offline at once, using a single round trip per batch of users
+
+        :param user_ids: a list of user ids
+        :return: nothing
+        """
+
     def set_user_online(self, user_id: str) -> None:
         """
 
@@ -818,6 +958,14 @@ class ICache(Interface):
         :return:
         """
 
+    def set_users_online(self, user_ids: list) -> None:
+        """
+        set many users as online at once, using a single round trip per batch of users
+
+        :param user_ids: a list of user ids
+        :return: nothing
+        """
+
     def set_user_status_invisible(self, user_id: str) -> None:
         """
         only sets the user status to invisible, used for when chaning visibility status while a user is offline
@@ -832,3 +980,11 @@ class ICache(Interface):
         :param user_id:
         :return:
         """
+
+    def set_users_invisible(self, user_ids: list) -> None:
+        """
+        set many users as invisible at once, using a single round trip per batch of users
+
+        :param user_ids: a list of user ids
+        :return: nothing
+        """
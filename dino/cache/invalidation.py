@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import logging
+import traceback
+
+from uuid import uuid4 as uuid
+
+import eventlet
+import redis
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHANNEL = 'cache:invalidation'
+
+
+class CacheInvalidationBus(object):
+    """
+    publishes changed keys on a redis pub/sub channel and evicts keys published by other workers from the local
+    memory cache, so that values can be cached in memory for a long time without going stale
+    """
+
+    def __init__(
+            self, memory_cache, host: str, port: int = 6379, db: int = 0, channel: str = DEFAULT_CHANNEL,
+            testing: bool = False
+    ):
+        self.cache = memory_cache
+        self.channel = channel
+        self.node_id = str(uuid())
+
+        if testing or host == 'mock':
+            from fakeredis import FakeStrictRedis
+            self.redis = FakeStrictRedis(host=host, port=port, db=db)
+        else:
+            self.redis = redis.Redis(connection_pool=redis.ConnectionPool(host=host, port=port, db=db))
+            eventlet.spawn_n(self.loop)
+
+    def publish(self, *keys) -> None:
+        if len(keys) == 0:
+            return
+
+        try:
+            self.redis.publish(self.channel, json.dumps({'node': self.node_id, 'keys': list(keys)}))
+        except Exception as e:
+            logger.error('could not publish cache invalidation for keys {}: {}'.format(str(keys), str(e)))
+            logger.exception(traceback.format_exc())
+
+    def on_message(self, data) -> None:
+        if isinstance(data, bytes):
+            data = str(data, 'utf-8')
+
+        payload = json.loads(data)
+
+        # already evicted locally when publishing
+        if payload.get('node') == self.node_id:
+            return
+
+        for key in payload.get('keys', list()):
+            self.cache.delete(key)
+
+    def loop(self):
+        while True:
+            try:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+
+                for message in pubsub.listen():
+                    if message.get('type') != 'message':
+                        continue
+
+                    try:
+                        self.on_message(message['data'])
+                    except Exception as e:
+                        logger.error('could not handle cache invalidation "{}": {}'.format(message, str(e)))
+
+            except InterruptedError:
+                logger.info('interrupted, exiting loop')
+                break
+            except Exception as e:
+                logger.error('cache invalidation subscription failed: {}'.format(str(e)))
+                logger.exception(traceback.format_exc())
+
+            # invalidations might have been missed while not subscribed
+            self.cache.flushall()
+            eventlet.sleep(1)
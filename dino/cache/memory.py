@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import sys
+import time
+import traceback
+
+from collections import OrderedDict
+from collections import defaultdict
+
+import eventlet
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 30
+DEFAULT_MAX_SIZE = 100000
+DEFAULT_SWEEP_INTERVAL = 30
+
+# don't walk deeper than this when estimating the size of nested values
+MAX_SIZE_DEPTH = 3
+
+
+def size_of(value, depth: int = 0) -> int:
+    """
+    approximate the memory used by a cached value; sys.getsizeof() is shallow, so walk into containers a few
+    levels deep to also count what they hold
+
+    :param value: the value to estimate the size for
+    :param depth: current depth, used when recursing
+    :return: estimated size in bytes
+    """
+    size = sys.getsizeof(value)
+    if depth >= MAX_SIZE_DEPTH:
+        return size
+
+    if isinstance(value, dict):
+        for k, v in value.items():
+            size += size_of(k, depth + 1) + size_of(v, depth + 1)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        for v in value:
+            size += size_of(v, depth + 1)
+    return size
+
+
+def family_of(key: str) -> str:
+    """
+    the key family is used for grouping stats, e.g. 'room:names-<room_id>-name' becomes 'room.names' and
+    'user:status:<user_id>' becomes 'user.status'
+
+    :param key: the cache key
+    :return: the family name of the key
+    """
+    try:
+        return '.'.join(str(key).split('-', 1)[0].split(':')[:2])
+    except Exception:
+        return 'unknown'
+
+
+class MemoryCache(object):
+    """
+    in-process LRU cache with a ttl per key, bounded by a max number of entries and optionally by an (approximate)
+    byte budget; expired entries are removed either when read or by the periodic sweep
+    """
+
+    def __init__(
+            self, env=None, max_size: int = DEFAULT_MAX_SIZE, max_bytes: int = None,
+            sweep_interval: float = DEFAULT_SWEEP_INTERVAL, start_sweeper: bool = False
+    ):
+        self.env = env
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+
+        # key -> (expires_at, value, size); ordered from least to most recently used
+        self.vals = OrderedDict()
+        self.n_bytes = 0
+
+        self.hits = defaultdict(int)
+        self.misses = defaultdict(int)
+        self.evictions = defaultdict(int)
+
+        if start_sweeper:
+            eventlet.spawn_after(func=self.loop, seconds=self.sweep_interval)
+
+    def loop(self):
+        while True:
+            try:
+                self.sweep()
+                self.report_stats()
+            except InterruptedError:
+                logger.info('interrupted, exiting loop')
+                break
+            except Exception as e:
+                logger.error('could not sweep memory cache: {}'.format(str(e)))
+                logger.exception(traceback.format_exc())
+            eventlet.sleep(self.sweep_interval)
+
+    def set(self, key, value, ttl=DEFAULT_TTL):
+        try:
+            size = 0
+            if self.max_bytes is not None:
+                size = size_of(key) + size_of(value)
+
+            self._remove(key)
+            self.vals[key] = (time.monotonic() + ttl, value, size)
+            self.n_bytes += size
+            self._evict_if_needed()
+        except Exception as e:
+            logger.warning('could not set key "{}" in memory cache: {}'.format(key, str(e)))
+
+    def get(self, key):
+        try:
+            entry = self.vals.get(key)
+            if entry is None:
+                self.misses[family_of(key)] += 1
+                return None
+
+            expires_at, value, _ = entry
+            if time.monotonic() > expires_at:
+                self._remove(key)
+                self.misses[family_of(key)] += 1
+                return None
+
+            self.vals.move_to_end(key)
+            self.hits[family_of(key)] += 1
+            return value
+        except Exception:
+            return None
+
+    def delete(self, key):
+        self._remove(key)
+
+    def flushall(self):
+        self.vals = OrderedDict()
+        self.n_bytes = 0
+
+    def sweep(self) -> int:
+        """
+        remove all expired entries
+
+        :return: the number of removed entries
+        """
+        now = time.monotonic()
+        expired = [key for key, entry in list(self.vals.items()) if entry[0] < now]
+        for key in expired:
+            self._remove(key)
+        return len(expired)
+
+    def report_stats(self) -> None:
+        """
+        send the hit/miss/eviction counts since the last report to the stats service and reset them
+        """
+        stats = getattr(self.env, 'stats', None)
+        if stats is None:
+            return
+
+        hits, misses, evictions = self.hits, self.misses, self.evictions
+        self.hits, self.misses, self.evictions = defaultdict(int), defaultdict(int), defaultdict(int)
+
+        for name, counts in [('hits', hits), ('misses', misses), ('evictions', evictions)]:
+            for family, count in counts.items():
+                stats.gauge('cache.memory.{}.{}'.format(family, name), count)
+
+        stats.gauge('cache.memory.size', len(self.vals))
+        if self.max_bytes is not None:
+            stats.gauge('cache.memory.bytes', self.n_bytes)
+
+    def _remove(self, key) -> None:
+        entry = self.vals.pop(key, None)
+        if entry is not None:
+            self.n_bytes -= entry[2]
+
+    def _is_full(self) -> bool:
+        if self.max_size is not None and len(self.vals) > self.max_size:
+            return True
+        return self.max_bytes is not None and self.n_bytes > self.max_bytes
+
+    def _evict_if_needed(self) -> None:
+        while len(self.vals) > 0 and self._is_full():
+            key, entry = self.vals.popitem(last=False)
+            self.n_bytes -= entry[2]
+            self.evictions[family_of(key)] += 1
@@ -11,8 +11,11 @@ from dino.config import ConfigKeys
 from dino.config import UserKeys
 from dino.config import RoleKeys
 from dino.cache import ICache
-from datetime import datetime
-from datetime import timedelta
+from dino.cache.memory import MemoryCache
+from dino.cache.memory import DEFAULT_TTL
+from dino.cache.memory import DEFAULT_MAX_SIZE
+from dino.cache.memory import DEFAULT_SWEEP_INTERVAL
+from dino.cache.invalidation import CacheInvalidationBus
 import redis
 
 __author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
@@ -22,41 +25,19 @@ TEN_MINUTES = 10*60
 FIVE_MINUTES = 5*60
 ONE_MINUTE = 60
 ONE_HOUR = 60*60
+FOUR_HOURS = 4*60*60
 TEN_SECONDS = 10
 
-logger = logging.getLogger(__name__)
-
+# max number of users to update presence for in a single pipeline
+PRESENCE_BATCH_SIZE = 500
 
-class MemoryCache(object):
-    def __init__(self):
-        self.vals = dict()
-
-    def set(self, key, value, ttl=30):
-        try:
-            expires_at = (datetime.utcnow() + timedelta(seconds=ttl)).timestamp()
-            self.vals[key] = (expires_at, value)
-        except:
-            pass
+# max number of heartbeats to check in a single pipeline
+HEARTBEAT_BATCH_SIZE = 1000
 
-    def get(self, key):
-        try:
-            if key not in self.vals:
-                return None
-            expires_at, value = self.vals[key]
-            now = datetime.utcnow().timestamp()
-            if now > expires_at:
-                del self.vals[key]
-                return None
-            return value
-        except:
-            return None
+# last entry of a cached recent history until it's full, so that the history of an empty room can be cached as well
+RECENT_HISTORY_MARKER = ''
 
-    def delete(self, key):
-        if key in self.vals:
-            del self.vals[key]
-
-    def flushall(self):
-        self.vals = dict()
+logger = logging.getLogger(__name__)
 
 
 @implementer(ICache)
@@ -71,7 +52,37 @@ class CacheRedis(object):
             self.redis_pool = redis.ConnectionPool(host=host, port=port, db=db)
             self.redis_instance = None
 
-        self.cache = MemoryCache()
+        testing = env.config.get(ConfigKeys.TESTING, False)
+        max_bytes = env.config.get(ConfigKeys.MEMORY_MAX_BYTES, domain=ConfigKeys.CACHE_SERVICE, default=None)
+
+        self.cache = MemoryCache(
+            env,
+            max_size=int(env.config.get(
+                ConfigKeys.MEMORY_MAX_SIZE, domain=ConfigKeys.CACHE_SERVICE, default=DEFAULT_MAX_SIZE)),
+            max_bytes=int(max_bytes) if max_bytes else None,
+            sweep_interval=float(env.config.get(
+                ConfigKeys.MEMORY_SWEEP_INTERVAL, domain=ConfigKeys.CACHE_SERVICE, default=DEFAULT_SWEEP_INTERVAL)),
+            start_sweeper=not testing
+        )
+
+        self.invalidation = None
+        self.invalidation_ttl = None
+
+        invalidation_host = env.config.get(ConfigKeys.INVALIDATION_HOST, domain=ConfigKeys.CACHE_SERVICE, default=None)
+        if invalidation_host is not None and len(str(invalidation_host).strip()) > 0:
+            invalidation_port = 6379
+            if ':' in invalidation_host:
+                invalidation_host, invalidation_port = invalidation_host.split(':', 1)
+
+            self.invalidation = CacheInvalidationBus(
+                self.cache,
+                host=invalidation_host,
+                port=int(invalidation_port),
+                db=int(env.config.get(ConfigKeys.INVALIDATION_DB, domain=ConfigKeys.CACHE_SERVICE, default=0)),
+                testing=testing
+            )
+            self.invalidation_ttl = float(env.config.get(
+                ConfigKeys.INVALIDATION_TTL, domain=ConfigKeys.CACHE_SERVICE, default=FOUR_HOURS))
 
     @property
     def redis(self):
@@ -95,6 +106,39 @@ class CacheRedis(object):
     def _del(self, key) -> None:
         self.cache.delete(key)
 
+    def _invalidate(self, *cache_keys) -> None:
+        """
+        evict the keys from the memory cache of all other workers; the caller updates the local copy itself
+        """
+        if self.invalidation is not None:
+            self.invalidation.publish(*cache_keys)
+
+    def _slow_ttl(self, ttl=DEFAULT_TTL):
+        """
+        values that only change through this class can be kept in memory for much longer when the other workers are
+        told about changes; without the invalidation bus the (short) default ttl is used
+        """
+        if self.invalidation is None:
+            return ttl
+        return self.invalidation_ttl + random.random()*self.invalidation_ttl/4
+
+    def _hset_and_invalidate(self, key: str, field: str, value, cache_key: str) -> None:
+        """
+        the setters are also used for populating the cache after a miss, so only broadcast if an existing value was
+        changed, otherwise the workers would keep evicting each other's fresh values
+        """
+        if self.invalidation is None:
+            self.redis.hset(key, field, value)
+            return
+
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hget(key, field)
+        pipe.hset(key, field, value)
+        previous, _ = pipe.execute()
+
+        if previous is not None and str(previous, 'utf-8') != str(value):
+            self._invalidate(cache_key)
+
     def add_heartbeat(self, user_id: str) -> None:
         redis_key = RedisKeys.heartbeat_user(user_id)
         self.redis.set(redis_key, user_id)
@@ -106,6 +150,23 @@ class CacheRedis(object):
             self.add_heartbeat(user_id)  # will reset the ttl
         return exists
 
+    def check_heartbeats(self, user_ids: list) -> set:
+        still_online = set()
+
+        for i in range(0, len(user_ids), HEARTBEAT_BATCH_SIZE):
+            batch = user_ids[i:i+HEARTBEAT_BATCH_SIZE]
+            pipe = self.redis.pipeline(transaction=False)
+
+            # expire only succeeds if the key still exists, so it both checks and resets the ttl
+            for user_id in batch:
+                pipe.expire(RedisKeys.heartbeat_user(user_id), ONE_MINUTE)
+
+            for user_id, exists in zip(batch, pipe.execute()):
+                if exists:
+                    still_online.add(user_id)
+
+        return still_online
+
     def has_heartbeat(self, user_id: str) -> bool:
         redis_key = RedisKeys.heartbeat_user(user_id)
         return self.redis.exists(redis_key)
@@ -177,6 +238,7 @@ class CacheRedis(object):
     def clear_default_rooms(self) -> None:
         redis_key = RedisKeys.default_rooms()
         self.cache.delete(redis_key)
+        self._invalidate(redis_key)
 
     def get_default_rooms(self) -> list:
         redis_key = RedisKeys.default_rooms()
@@ -198,9 +260,9 @@ class CacheRedis(object):
             return value
 
         values = self.redis.smembers(cache_key)
-        if value is not None:
+        if values is not None and len(values) > 0:
             decoded = {str(v, 'utf-8') for v in values}
-            self.cache.set(cache_key, decoded, ttl=TEN_MINUTES)
+            self.cache.set(cache_key, decoded, ttl=self._slow_ttl(TEN_MINUTES))
             return decoded
         return None
 
@@ -208,31 +270,144 @@ class CacheRedis(object):
         cache_key = RedisKeys.black_list()
         self.cache.delete(cache_key)
         self.redis.delete(cache_key)
+        self._invalidate(cache_key)
+        self.increase_black_list_version()
 
     def set_black_list(self, the_list: set) -> None:
+        """
+        only populates the cache after a miss, the list itself hasn't changed, so other workers are not told to evict
+        their copies and the version stays the same
+        """
         cache_key = RedisKeys.black_list()
-        self.cache.set(cache_key, the_list, ttl=TEN_MINUTES)
-        self.redis.delete(cache_key)
-        self.redis.sadd(cache_key, *the_list)
+        self.cache.set(cache_key, the_list, ttl=self._slow_ttl(TEN_MINUTES))
+
+        pipe = self.redis.pipeline()
+        pipe.delete(cache_key)
+        pipe.sadd(cache_key, *the_list)
+        pipe.execute()
 
     def remove_from_black_list(self, word: str) -> None:
         cache_key = RedisKeys.black_list()
-        the_cached_list = self.cache.get(cache_key)
-        the_cached_list.remove(word)
-        self.cache.set(cache_key, the_cached_list, ttl=60*10)
-        self.redis.srem(cache_key, word)
+        the_cached_list = self.get_black_list()
+        if the_cached_list is not None:
+            the_cached_list.discard(word)
+            self.cache.set(cache_key, the_cached_list, ttl=self._slow_ttl(TEN_MINUTES))
+            self.redis.srem(cache_key, word)
+        self._invalidate(cache_key)
+        self.increase_black_list_version()
 
     def add_to_black_list(self, word: str) -> None:
         cache_key = RedisKeys.black_list()
-        the_cached_list = self.cache.get(cache_key)
-        the_cached_list.add(word)
-        self.cache.set(cache_key, the_cached_list, ttl=60*10)
-        self.redis.sadd(cache_key, word)
+        the_cached_list = self.get_black_list()
+        if the_cached_list is not None:
+            # if it's not cached anywhere it will be read in full from the db next time, adding only this word to
+            # redis would make it look like the whole list
+            the_cached_list.add(word)
+            self.cache.set(cache_key, the_cached_list, ttl=self._slow_ttl(TEN_MINUTES))
+            self.redis.sadd(cache_key, word)
+        self._invalidate(cache_key)
+        self.increase_black_list_version()
+
+    def get_black_list_version(self) -> int:
+        cache_key = RedisKeys.black_list_version()
+        value = self.cache.get(cache_key)
+        if value is not None:
+            return value
+
+        value = self.redis.get(cache_key)
+        version = 0 if value is None else int(str(value, 'utf-8'))
+        self.cache.set(cache_key, version, ttl=self._slow_ttl(TEN_MINUTES))
+        return version
+
+    def increase_black_list_version(self) -> None:
+        cache_key = RedisKeys.black_list_version()
+        self.cache.set(cache_key, self.redis.incr(cache_key), ttl=self._slow_ttl(TEN_MINUTES))
+        self._invalidate(cache_key)
+
+    def get_recent_history(self, room_id: str, limit: int) -> Union[list, None]:
+        """
+        The cached history is only used if it was cached after the last call to remove_recent_history() without a
+        room id, so that call invalidates the history of all rooms at once.
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        # one more than the limit since the marker might still be at the end
+        pipe.lrange(RedisKeys.recent_history(room_id), 0, limit)
+        pipe.get(RedisKeys.recent_history_room_generation(room_id))
+        pipe.get(RedisKeys.recent_history_generation())
+        entries, room_generation, generation = pipe.execute()
+
+        if len(entries) == 0 or room_generation != (generation or b'0'):
+            return None
+
+        return [json.loads(str(entry, 'utf-8')) for entry in entries if len(entry) > 0][:limit]
+
+    def get_recent_history_version(self, room_id: str) -> str:
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.get(RedisKeys.recent_history_version(room_id))
+        pipe.get(RedisKeys.recent_history_generation())
+        return self._recent_history_version(*pipe.execute())
+
+    def _recent_history_version(self, version, generation) -> str:
+        return '%s:%s' % (
+            0 if version is None else str(version, 'utf-8'),
+            0 if generation is None else str(generation, 'utf-8'))
+
+    def set_recent_history(self, room_id: str, messages: list, version: str, ttl: int=TEN_MINUTES) -> None:
+        """
+        The version is checked and the history written in one transaction, watching the version keys, so if a
+        message is added or removed in between the history is not written.
+        """
+        version_key = RedisKeys.recent_history_version(room_id)
+        generation_key = RedisKeys.recent_history_generation()
+        generation = version.split(':', 1)[1]
+        redis_key = RedisKeys.recent_history(room_id)
+
+        with self.redis.pipeline() as pipe:
+            try:
+                pipe.watch(version_key, generation_key)
+                if self._recent_history_version(pipe.get(version_key), pipe.get(generation_key)) != version:
+                    # messages were added or removed while the history was read from the storage, it might be outdated
+                    return
+
+                pipe.multi()
+                pipe.delete(redis_key)
+                pipe.rpush(redis_key, *([json.dumps(message) for message in messages] + [RECENT_HISTORY_MARKER]))
+                pipe.expire(redis_key, ttl)
+                pipe.set(RedisKeys.recent_history_room_generation(room_id), generation)
+                pipe.expire(RedisKeys.recent_history_room_generation(room_id), ttl)
+                pipe.execute()
+            except redis.WatchError:
+                logger.debug('history of room %s changed while caching it, not caching it' % room_id)
+
+    def add_to_recent_history(self, room_id: str, message: dict, limit: int) -> None:
+        redis_key = RedisKeys.recent_history(room_id)
+        version_key = RedisKeys.recent_history_version(room_id)
+
+        pipe = self.redis.pipeline(transaction=False)
+        # only if the history is already cached, otherwise it would only have the messages since then
+        pipe.lpushx(redis_key, json.dumps(message))
+        pipe.ltrim(redis_key, 0, limit - 1)
+        pipe.incr(version_key)
+        pipe.expire(version_key, ONE_HOUR)
+        pipe.execute()
+
+    def remove_recent_history(self, room_id: str=None) -> None:
+        if room_id is None:
+            self.redis.incr(RedisKeys.recent_history_generation())
+            return
+
+        version_key = RedisKeys.recent_history_version(room_id)
+
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.delete(RedisKeys.recent_history(room_id))
+        pipe.incr(version_key)
+        pipe.expire(version_key, ONE_HOUR)
+        pipe.execute()
 
     def _set_ban_timestamp(self, key: str, user_id: str, timestamp: str) -> None:
         cache_key = '%s-%s' % (key, user_id)
-        self.cache.set(cache_key, timestamp)
-        self.redis.hset(key, user_id, timestamp)
+        self.cache.set(cache_key, timestamp, ttl=self._slow_ttl())
+        self._hset_and_invalidate(key, user_id, timestamp, cache_key)
 
     def set_global_ban_timestamp(self, user_id: str, duration: str, timestamp: str, username: str) -> None:
         key = RedisKeys.banned_users()
@@ -256,20 +431,21 @@ class CacheRedis(object):
         value = self.redis.hget(key, user_id)
         if value is not None:
             value = json.loads(str(value, 'utf-8'))
-            self.cache.set(cache_key, value, ttl=TEN_MINUTES + random.random()*FIVE_MINUTES)
+            self.cache.set(cache_key, value, ttl=self._slow_ttl(TEN_MINUTES + random.random()*FIVE_MINUTES))
         return value
 
     def set_user_roles(self, user_id: str, roles: dict) -> None:
         key = RedisKeys.user_roles()
         cache_key = '%s-%s' % (key, user_id)
-        self.redis.hset(key, user_id, json.dumps(roles))
-        self.cache.set(cache_key, roles, ttl=TEN_MINUTES + random.random()*FIVE_MINUTES)
+        self._hset_and_invalidate(key, user_id, json.dumps(roles), cache_key)
+        self.cache.set(cache_key, roles, ttl=self._slow_ttl(TEN_MINUTES + random.random()*FIVE_MINUTES))
 
     def reset_user_roles(self, user_id: str) -> None:
         key = RedisKeys.user_roles()
         cache_key = '%s-%s' % (key, user_id)
         self.redis.hdel(key, user_id)
         self.cache.delete(cache_key)
+        self._invalidate(cache_key)
 
     def get_admin_room(self) -> Union[str, None]:
         key = RedisKeys.admin_room()
@@ -289,11 +465,13 @@ class CacheRedis(object):
         key = RedisKeys.admin_room()
         self.redis.set(key, room_id)
         self.cache.set(key, room_id, ttl=EIGHT_HOURS_IN_SECONDS)
+        self._invalidate(key)
 
     def remove_admin_room(self) -> None:
         key = RedisKeys.admin_room()
         self.redis.delete(key)
         self.cache.delete(key)
+        self._invalidate(key)
 
     def _get_ban_timestamp(self, key: str, user_id: str) -> (str, str, str):
         cache_key = '%s-%s' % (key, user_id)
@@ -315,6 +493,7 @@ class CacheRedis(object):
     def reset_rooms_for_channel(self, channel_id: str) -> None:
         key = RedisKeys.rooms_for_channel_with_info(channel_id)
         self.cache.delete(key)
+        self._invalidate(key)
 
     def get_rooms_for_channel(self, channel_id: str) -> dict:
         key = RedisKeys.rooms_for_channel_with_info(channel_id)
@@ -400,6 +579,23 @@ class CacheRedis(object):
         all_sids = ','.join(list(set(all_sids)))
         self.redis.hset(key, user_id, all_sids)
 
+    def set_node_for_sid(self, sid: str, node: str) -> None:
+        # expires in case the disconnect is never handled; unknown sids makes events fall back to being broadcast
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.set(RedisKeys.node_for_sid(sid), node)
+        pipe.expire(RedisKeys.node_for_sid(sid), EIGHT_HOURS_IN_SECONDS)
+        pipe.execute()
+
+    def get_nodes_for_sids(self, sids: list) -> list:
+        if len(sids) == 0:
+            return list()
+
+        nodes = self.redis.mget([RedisKeys.node_for_sid(sid) for sid in sids])
+        return [None if node is None else str(node, 'utf-8') for node in nodes]
+
+    def remove_node_for_sid(self, sid: str) -> None:
+        self.redis.delete(RedisKeys.node_for_sid(sid))
+
     def get_user_for_sid(self, sid: str):
         sid_key = RedisKeys.user_id_for_sid()
         user_id = self.redis.hget(sid_key, sid)
@@ -437,6 +633,7 @@ class CacheRedis(object):
     def reset_users_in_room_for_role(self, room_id: str, role: str) -> None:
         key = RedisKeys.users_in_room_for_role(room_id, role)
         self.cache.delete(key)
+        self._invalidate(key)
 
     def get_users_in_channel_for_role(self, channel_id: str, role: str) -> dict:
         key = RedisKeys.users_in_channel_for_role(channel_id, role)
@@ -449,6 +646,7 @@ class CacheRedis(object):
     def reset_users_in_channel_for_role(self, channel_id: str, role: str) -> None:
         key = RedisKeys.users_in_channel_for_role(channel_id, role)
         self.cache.delete(key)
+        self._invalidate(key)
 
     def set_acls_in_channel_for_action(self, channel_id: str, action: str, acls: dict) -> None:
         key = RedisKeys.acls_in_channel_for_action(channel_id, action)
@@ -457,18 +655,22 @@ class CacheRedis(object):
     def reset_acls_in_channel_for_action(self, channel_id: str, action: str) -> None:
         key = RedisKeys.acls_in_channel_for_action(channel_id, action)
         self.cache.delete(key)
+        self._invalidate(key)
 
     def reset_acls_in_room_for_action(self, room_id: str, action: str) -> None:
         key = RedisKeys.acls_in_room_for_action(room_id, action)
         self.cache.delete(key)
+        self._invalidate(key)
 
     def reset_acls_in_channel(self, channel_id: str) -> None:
         key = RedisKeys.acls_in_channel(channel_id)
         self.cache.delete(key)
+        self._invalidate(key)
 
     def reset_acls_in_room(self, room_id: str) -> None:
         key = RedisKeys.acls_in_room(room_id)
         self.cache.delete(key)
+        self._invalidate(key)
 
     def set_all_acls_for_channel(self, channel_id: str, acls: dict) -> None:
         key = RedisKeys.acls_in_channel(channel_id)
@@ -489,6 +691,7 @@ class CacheRedis(object):
     def reset_channels_with_sort(self):
         key = RedisKeys.channels_with_sort()
         self.cache.delete(key)
+        self._invalidate(key)
 
     def get_channels_with_sort(self):
         key = RedisKeys.channels_with_sort()
@@ -511,6 +714,7 @@ class CacheRedis(object):
         cache_key = '%s-%s' % (key, room_name)
         self.cache.delete(cache_key)
         self.redis.hdel(key, room_name)
+        self._invalidate(cache_key)
 
     def get_room_id_for_name(self, channel_id: str, room_name: str) -> str:
         key = RedisKeys.room_id_for_name(channel_id)
@@ -524,14 +728,14 @@ class CacheRedis(object):
             return None
 
         value = str(value, 'utf-8')
-        self.cache.set(cache_key, value)
+        self.cache.set(cache_key, value, ttl=self._slow_ttl())
         return value
 
     def set_room_id_for_name(self, channel_id, room_name, room_id):
         key = RedisKeys.room_id_for_name(channel_id)
         cache_key = '%s-%s' % (key, room_name)
-        self.cache.set(cache_key, room_id)
-        self.redis.hset(key, room_name, room_id)
+        self.cache.set(cache_key, room_id, ttl=self._slow_ttl())
+        self._hset_and_invalidate(key, room_name, room_id, cache_key)
 
     def get_user_name(self, user_id: str) -> str:
         key = RedisKeys.user_names()
@@ -543,15 +747,50 @@ class CacheRedis(object):
         user_name = self.redis.hget(key, user_id)
         if user_name is not None:
             user_name = str(user_name, 'utf-8')
-            self.cache.set(cache_key, user_name)
+            self.cache.set(cache_key, user_name, ttl=self._slow_ttl())
             return user_name
         return user_name
 
+    def get_user_names(self, user_ids: list) -> dict:
+        key = RedisKeys.user_names()
+        user_names = dict()
+        not_cached = list()
+
+        for user_id in user_ids:
+            user_name = self.cache.get('%s-%s' % (key, user_id))
+            if user_name is None:
+                not_cached.append(user_id)
+            else:
+                user_names[user_id] = user_name
+
+        if len(not_cached) == 0:
+            return user_names
+
+        values = self.redis.hmget(key, not_cached)
+        for user_id, user_name in zip(not_cached, values):
+            if user_name is None or len(user_name) == 0:
+                continue
+
+            user_name = str(user_name, 'utf-8')
+            user_names[user_id] = user_name
+            self.cache.set('%s-%s' % (key, user_id), user_name, ttl=self._slow_ttl())
+
+        return user_names
+
+    def set_user_names(self, user_names: dict) -> None:
+        if user_names is None or len(user_names) == 0:
+            return
+
+        key = RedisKeys.user_names()
+        self.redis.hmset(key, user_names)
+        for user_id, user_name in user_names.items():
+            self.cache.set('%s-%s' % (key, user_id), user_name, ttl=self._slow_ttl())
+
     def set_user_name(self, user_id: str, user_name: str):
         key = RedisKeys.user_names()
         cache_key = '%s-%s' % (key, user_id)
-        self.redis.hset(key, user_id, user_name)
-        self.cache.set(cache_key, user_name)
+        self._hset_and_invalidate(key, user_id, user_name, cache_key)
+        self.cache.set(cache_key, user_name, ttl=self._slow_ttl())
 
     def get_room_exists(self, channel_id, room_id):
         key = RedisKeys.rooms(channel_id)
@@ -562,7 +801,7 @@ class CacheRedis(object):
 
         exists = self.redis.hexists(key, room_id)
         if exists == 1:
-            self.cache.set(cache_key, True)
+            self.cache.set(cache_key, True, ttl=self._slow_ttl())
             return True
         return None
 
@@ -571,22 +810,29 @@ class CacheRedis(object):
         cache_key = '%s-%s' % (key, channel_id)
         self.redis.hdel(key, channel_id)
         self.cache.delete(cache_key)
+        exists_cache_key = cache_key
 
         key = RedisKeys.channels()
         cache_key = '%s-name-%s' % (key, channel_id)
         self.cache.delete(cache_key)
         self.redis.hdel(key, channel_id)
 
+        self._invalidate(exists_cache_key, cache_key)
+
     def remove_room_exists(self, channel_id, room_id):
+        removed_cache_keys = list()
+
         key = RedisKeys.rooms(channel_id)
         cache_key = '%s-%s' % (key, room_id)
         self.cache.set(cache_key, None)
         self.redis.hdel(key, room_id)
+        removed_cache_keys.append(cache_key)
 
         key = RedisKeys.channel_for_rooms()
         cache_key = '%s-%s' % (key, room_id)
         self.cache.delete(cache_key)
         self.redis.hdel(key, room_id)
+        removed_cache_keys.append(cache_key)
 
         key = RedisKeys.room_roles(room_id)
         self.redis.delete(key)
@@ -603,6 +849,7 @@ class CacheRedis(object):
 
         self.cache.delete(cache_key)
         self.redis.hdel(key, room_id)
+        removed_cache_keys.append(cache_key)
 
         key = RedisKeys.room_id_for_name(channel_id)
         self.redis.hdel(key, room_id)
@@ -610,11 +857,14 @@ class CacheRedis(object):
         if room_name is not None:
             cache_key = '%s-%s' % (key, room_name)
             self.cache.delete(cache_key)
+            removed_cache_keys.append(cache_key)
 
         for role in RoleKeys.all_roles:
             key = RedisKeys.users_in_room_for_role(room_id, role)
             self.redis.delete(key)
 
+        self._invalidate(*removed_cache_keys)
+
     def set_room_exists(self, channel_id, room_id, room_name):
         key = RedisKeys.rooms(channel_id)
         cache_key = '%s-%s' % (key, room_id)
@@ -630,7 +880,7 @@ class CacheRedis(object):
     def set_channel_for_room(self, channel_id: str, room_id: str) -> None:
         key = RedisKeys.channel_for_rooms()
         cache_key = '%s-%s' % (key, room_id)
-        self.redis.hset(key, room_id, channel_id)
+        self._hset_and_invalidate(key, room_id, channel_id, cache_key)
         self.cache.set(cache_key, channel_id, ttl=EIGHT_HOURS_IN_SECONDS)
 
     def get_channel_exists(self, channel_id):
@@ -644,14 +894,14 @@ class CacheRedis(object):
         if value is None:
             return None
 
-        self.cache.set(cache_key, True)
+        self.cache.set(cache_key, True, ttl=self._slow_ttl())
         return True
 
     def set_channel_name(self, channel_id: str, channel_name: str) -> None:
         key = RedisKeys.channels()
         cache_key = '%s-name-%s' % (key, channel_id)
-        self.cache.set(cache_key, channel_name)
-        self.redis.hset(key, channel_id, channel_name)
+        self.cache.set(cache_key, channel_name, ttl=self._slow_ttl())
+        self._hset_and_invalidate(key, channel_id, channel_name, cache_key)
 
     def get_channel_name(self, channel_id: str) -> str:
         key = RedisKeys.channels()
@@ -665,7 +915,7 @@ class CacheRedis(object):
             return None
 
         value = str(value, 'utf-8')
-        self.cache.set(cache_key, value)
+        self.cache.set(cache_key, value, ttl=self._slow_ttl())
         return value
 
     def get_room_name(self, room_id: str) -> str:
@@ -680,14 +930,14 @@ class CacheRedis(object):
             return None
 
         value = str(value, 'utf-8')
-        self.cache.set(cache_key, value)
+        self.cache.set(cache_key, value, ttl=self._slow_ttl())
         return value
 
     def set_room_name(self, room_id: str, room_name: str) -> None:
         key = RedisKeys.room_name_for_id()
         cache_key = '%s-%s-name' % (key, room_id)
-        self.cache.set(cache_key, room_name, ttl=TEN_MINUTES + random.random()*FIVE_MINUTES)
-        self.redis.hset(key, room_id, room_name)
+        self.cache.set(cache_key, room_name, ttl=self._slow_ttl(TEN_MINUTES + random.random()*FIVE_MINUTES))
+        self._hset_and_invalidate(key, room_id, room_name, cache_key)
 
     def get_channel_for_room(self, room_id):
         key = RedisKeys.channel_for_rooms()
@@ -701,7 +951,7 @@ class CacheRedis(object):
             return None
 
         channel_id = str(channel_id, 'utf-8')
-        self.cache.set(cache_key, channel_id)
+        self.cache.set(cache_key, channel_id, ttl=self._slow_ttl())
         return channel_id
 
     def get_user_status(self, user_id: str):
@@ -712,9 +962,44 @@ class CacheRedis(object):
 
         return str(status, 'utf-8')
 
+    def get_user_statuses(self, user_ids: list) -> dict:
+        statuses = dict()
+        not_cached = list()
+
+        for user_id in user_ids:
+            status = self.cache.get(RedisKeys.user_status(user_id))
+            if status is None:
+                not_cached.append(user_id)
+            else:
+                statuses[user_id] = status
+
+        if len(not_cached) == 0:
+            return statuses
+
+        values = self.redis.mget([RedisKeys.user_status(user_id) for user_id in not_cached])
+        for user_id, status in zip(not_cached, values):
+            if status is None or len(status) == 0:
+                continue
+
+            status = str(status, 'utf-8')
+            statuses[user_id] = status
+            self.cache.set(RedisKeys.user_status(user_id), status, ttl=TEN_SECONDS)
+
+        return statuses
+
     def set_user_status(self, user_id: str, status: str) -> None:
         key = RedisKeys.user_status(user_id)
         self.redis.set(key, status)
+        self.cache.set(key, str(status), ttl=TEN_SECONDS)
+
+    def set_user_statuses(self, statuses: dict) -> None:
+        if statuses is None or len(statuses) == 0:
+            return
+
+        values = {RedisKeys.user_status(user_id): str(status) for user_id, status in statuses.items()}
+        self.redis.mset(values)
+        for key, status in values.items():
+            self.cache.set(key, status, ttl=TEN_SECONDS)
 
     def get_user_info(self, user_id: str) -> dict:
         key = RedisKeys.auth_key(user_id)
@@ -727,6 +1012,7 @@ class CacheRedis(object):
     def reset_user_info(self, user_id: str) -> None:
         key = RedisKeys.auth_key(user_id)
         self.cache.delete(key)
+        self._invalidate(key)
 
     def user_check_status(self, user_id, other_status):
         return self.get_user_status(user_id) == other_status
@@ -752,51 +1038,87 @@ class CacheRedis(object):
             logger.exception(traceback.format_exc())
             raise e  # force catch from caller
 
+    def _set_users_presence(self, user_ids: list, status: str, is_online: bool, in_multicast: bool) -> None:
+        """
+        update the online bitmap, online set, multicast set and status keys for all users in one round trip; not
+        using MULTI since it's not supported by nutcracker, and the keys might be on different backends anyway
+        """
+        user_ids = [str(user_id).strip() for user_id in user_ids]
+
+        for i in range(0, len(user_ids), PRESENCE_BATCH_SIZE):
+            batch = user_ids[i:i+PRESENCE_BATCH_SIZE]
+            pipe = self.redis.pipeline(transaction=False)
+
+            for user_id in batch:
+                pipe.setbit(RedisKeys.online_bitmap(), int(float(user_id)), 1 if is_online else 0)
+                pipe.set(RedisKeys.user_status(user_id), status)
+
+            if is_online:
+                pipe.sadd(RedisKeys.online_set(), *batch)
+            else:
+                pipe.srem(RedisKeys.online_set(), *batch)
+
+            if in_multicast:
+                pipe.sadd(RedisKeys.users_multi_cast(), *batch)
+            else:
+                pipe.srem(RedisKeys.users_multi_cast(), *batch)
+
+            pipe.execute()
+
+            for user_id in batch:
+                self.cache.set(RedisKeys.user_status(user_id), status)
+            self._invalidate(*[RedisKeys.user_status(user_id) for user_id in batch])
+
     def set_user_offline(self, user_id: str) -> None:
         try:
-            user_id_str = str(user_id).strip()
-            user_id_int = int(float(user_id))
-            self.cache.set(RedisKeys.user_status(user_id_str), UserKeys.STATUS_UNAVAILABLE)
-            self.redis.setbit(RedisKeys.online_bitmap(), user_id_int, 0)
-            self.redis.srem(RedisKeys.online_set(), user_id_str)
-            self.redis.srem(RedisKeys.users_multi_cast(), user_id_str)
-            self.redis.set(RedisKeys.user_status(user_id_str), UserKeys.STATUS_UNAVAILABLE)
+            self._set_users_presence([user_id], UserKeys.STATUS_UNAVAILABLE, is_online=False, in_multicast=False)
         except Exception as e:
             logger.error('could not set_user_offline(): %s' % str(e))
             logger.exception(traceback.format_exc())
             raise e  # force catch from caller
 
+    def set_users_offline(self, user_ids: list) -> None:
+        try:
+            self._set_users_presence(user_ids, UserKeys.STATUS_UNAVAILABLE, is_online=False, in_multicast=False)
+        except Exception as e:
+            logger.error('could not set_users_offline(): %s' % str(e))
+            logger.exception(traceback.format_exc())
+            raise e  # force catch from caller
+
     def set_user_online(self, user_id: str) -> None:
         try:
-            user_id_str = str(user_id).strip()
-            user_id_int = int(float(user_id))
-            self.cache.set(RedisKeys.user_status(user_id_str), UserKeys.STATUS_AVAILABLE)
-            self.redis.setbit(RedisKeys.online_bitmap(), user_id_int, 1)
-            self.redis.sadd(RedisKeys.online_set(), user_id_str)
-            self.redis.sadd(RedisKeys.users_multi_cast(), user_id_str)
-            self.redis.set(RedisKeys.user_status(user_id_str), UserKeys.STATUS_AVAILABLE)
+            self._set_users_presence([user_id], UserKeys.STATUS_AVAILABLE, is_online=True, in_multicast=True)
         except Exception as e:
             logger.error('could not set_user_online(): %s' % str(e))
             logger.exception(traceback.format_exc())
 
+    def set_users_online(self, user_ids: list) -> None:
+        try:
+            self._set_users_presence(user_ids, UserKeys.STATUS_AVAILABLE, is_online=True, in_multicast=True)
+        except Exception as e:
+            logger.error('could not set_users_online(): %s' % str(e))
+            logger.exception(traceback.format_exc())
+
     def set_user_status_invisible(self, user_id: str) -> None:
         try:
             user_id_str = str(user_id).strip()
             self.cache.set(RedisKeys.user_status(user_id_str), UserKeys.STATUS_INVISIBLE)
             self.redis.set(RedisKeys.user_status(user_id_str), UserKeys.STATUS_INVISIBLE)
+            self._invalidate(RedisKeys.user_status(user_id_str))
         except Exception as e:
             logger.error('could not set_user_status_invisible(): %s' % str(e))
             logger.exception(traceback.format_exc())
 
     def set_user_invisible(self, user_id: str) -> None:
         try:
-            user_id_str = str(user_id).strip()
-            user_id_int = int(float(user_id))
-            self.cache.set(RedisKeys.user_status(user_id_str), UserKeys.STATUS_INVISIBLE)
-            self.redis.setbit(RedisKeys.online_bitmap(), user_id_int, 0)
-            self.redis.srem(RedisKeys.online_set(), user_id_str)
-            self.redis.sadd(RedisKeys.users_multi_cast(), user_id_str)
-            self.redis.set(RedisKeys.user_status(user_id_str), UserKeys.STATUS_INVISIBLE)
+            self._set_users_presence([user_id], UserKeys.STATUS_INVISIBLE, is_online=False, in_multicast=True)
         except Exception as e:
             logger.error('could not set_user_invisible(): %s' % str(e))
             logger.exception(traceback.format_exc())
+
+    def set_users_invisible(self, user_ids: list) -> None:
+        try:
+            self._set_users_presence(user_ids, UserKeys.STATUS_INVISIBLE, is_online=False, in_multicast=True)
+        except Exception as e:
+            logger.error('could not set_users_invisible(): %s' % str(e))
+            logger.exception(traceback.format_exc())
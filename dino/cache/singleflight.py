@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import sys
+
+from eventlet.event import Event
+
+from dino.cache.memory import MemoryCache
+from dino.cache.memory import family_of
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STALE_TTL = 5*60
+DEFAULT_STALE_MAX_SIZE = 10000
+
+
+class SingleFlight(object):
+    """
+    makes sure only one greenlet at a time runs the loader for a key after a cache miss; other greenlets missing on
+    the same key wait for and share that result instead of running the same queries again
+
+    if stale values are enabled for a call, the last loaded value is returned directly to the waiters while the
+    loader is running, instead of having them block on it
+    """
+
+    def __init__(self, env=None, stale_ttl: float = DEFAULT_STALE_TTL, stale_max_size: int = DEFAULT_STALE_MAX_SIZE):
+        self.env = env
+        self.stale_ttl = stale_ttl
+        self.stale = MemoryCache(max_size=stale_max_size)
+
+        # key -> event the waiters block on until the loader for that key has finished
+        self.in_flight = dict()
+
+    def load(self, key: str, loader, serve_stale: bool = False):
+        event = self.in_flight.get(key)
+
+        if event is not None:
+            if serve_stale:
+                value = self.stale.get(key)
+                if value is not None:
+                    self._count(key, 'stale')
+                    return value
+
+            self._count(key, 'coalesced')
+            return event.wait()
+
+        event = Event()
+        self.in_flight[key] = event
+
+        try:
+            value = loader()
+        except Exception:
+            self.in_flight.pop(key, None)
+            event.send_exception(*sys.exc_info())
+            raise
+
+        if serve_stale:
+            self.stale.set(key, value, ttl=self.stale_ttl)
+
+        self.in_flight.pop(key, None)
+        event.send(value)
+        return value
+
+    def _count(self, key: str, name: str) -> None:
+        stats = getattr(self.env, 'stats', None)
+        if stats is None:
+            return
+
+        try:
+            stats.incr('cache.singleflight.{}.{}'.format(family_of(key), name))
+        except Exception as e:
+            logger.warning('could not count {} for key "{}": {}'.format(name, key, str(e)))
@@ -258,9 +258,52 @@ class ConfigKeys(object):
     TITLE = 'title'
     VERB = 'verb'
     SPAM_CLASSIFIER = 'spam_classifier'
+    SPAM_WORKERS = 'spam_workers'
+    SPAM_BATCH_SIZE = 'spam_batch_size'
+    SPAM_BATCH_WAIT = 'spam_batch_wait'
+    SPAM_TIMEOUT = 'spam_timeout'
     HEARTBEAT = 'heartbeat'
     TIMEOUT = 'timeout'
     INTERVAL = 'interval'
+    MEMORY_MAX_SIZE = 'memory_max_size'
+    MEMORY_MAX_BYTES = 'memory_max_bytes'
+    MEMORY_SWEEP_INTERVAL = 'memory_sweep_interval'
+    INVALIDATION_HOST = 'invalidation_host'
+    INVALIDATION_DB = 'invalidation_db'
+    INVALIDATION_TTL = 'invalidation_ttl'
+    STALE_WHILE_REVALIDATE = 'stale_while_revalidate'
+    STALE_TTL = 'stale_ttl'
+    BUCKETED_HISTORY = 'bucketed_history'
+    HISTORY_MAX_DAYS = 'history_max_days'
+    WRITE_BEHIND = 'write_behind'
+    WRITE_BEHIND_QUEUE_SIZE = 'write_behind_queue_size'
+    WRITE_BEHIND_BATCH_SIZE = 'write_behind_batch_size'
+    SPOOL_PATH = 'spool_path'
+    ACK_BATCH_WAIT = 'ack_batch_wait'
+    LOCAL_DC = 'local_dc'
+    COMPRESSION = 'compression'
+    EXECUTOR_THREADS = 'executor_threads'
+    REQUEST_TIMEOUT = 'request_timeout'
+    READ_CONSISTENCY = 'read_consistency'
+    WRITE_CONSISTENCY = 'write_consistency'
+    SPECULATIVE_DELAY = 'speculative_delay'
+    SPECULATIVE_ATTEMPTS = 'speculative_attempts'
+    CONSUMER_CONCURRENCY = 'consumer_concurrency'
+    PREFETCH_COUNT = 'prefetch_count'
+    ASYNC_PUBLISH = 'async'
+    LINGER_MS = 'linger_ms'
+    BATCH_SIZE = 'batch_size'
+    BUFFER_SIZE = 'buffer_size'
+    BUFFER_POLICY = 'buffer_policy'
+    MAX_BLOCK_MS = 'max_block_ms'
+    OUTBOX_PATH = 'outbox_path'
+    OUTBOX_MAX_SIZE = 'outbox_max_size'
+    OUTBOX_REPLAY_RATE = 'outbox_replay_rate'
+    OUTBOX_RETRY_INTERVAL = 'outbox_retry_interval'
+    OUTBOX_REPLAY_WINDOW = 'outbox_replay_window'
+    CODEC = 'codec'
+    RECENT_HISTORY_CACHE = 'cache'
+    RECENT_HISTORY_CACHE_TTL = 'cache_ttl'
 
     INSECURE = 'insecure'
     OAUTH_ENABLED = 'oauth_enabled'
@@ -286,6 +329,7 @@ class ConfigKeys(object):
     DEFAULT_LOG_LEVEL = 'INFO'
     DEFAULT_REDIS_HOST = 'localhost'
     DEFAULT_HISTORY_LIMIT = 500
+    DEFAULT_RECENT_HISTORY_CACHE_TTL = 10*60
     DEFAULT_HISTORY_STRATEGY = 'top'
 
     HISTORY_TYPE_UNREAD = 'unread'
@@ -315,6 +359,13 @@ class RedisKeys(object):
     RKEY_ROOM_ACL = 'room:acl:%s'  # room:acl:room_id
     RKEY_CHANNEL_ACL = 'channel:acl:%s'  # channel:acl:channel_id
     RKEY_ROOM_HISTORY = 'room:history:%s'  # room:history:room_id
+    RKEY_ROOM_MESSAGES = 'room:messages:%s'  # room:messages:room_id
+    RKEY_NODE_FOR_SID = 'sid:node:%s'  # sid:node:sid
+    RKEY_MESSAGE = 'message:%s'  # message:message_id
+    RKEY_RECENT_HISTORY = 'history:recent:%s'  # history:recent:room_id
+    RKEY_RECENT_HISTORY_VERSION = 'history:recent:version:%s'  # history:recent:version:room_id
+    RKEY_RECENT_HISTORY_ROOM_GENERATION = 'history:recent:generation:%s'  # history:recent:generation:room_id
+    RKEY_RECENT_HISTORY_GENERATION = 'history:recent:generation'
     RKEY_AUTH = 'user:auth:%s'  # user:auth:user_id
     RKEY_CHANNELS = 'channels'
     RKEY_CHANNELS_SORT = 'channels:sort'
@@ -330,6 +381,7 @@ class RedisKeys(object):
     RKEY_ACL_VALIDATION = 'acl:validation:%s'  # acl:validation:acl_type (e.g. acl:validation:gender)
     RKEY_USER_ROLES = 'users:roles'
     RKEY_BLACK_LIST = 'words:blacklist'
+    RKEY_BLACK_LIST_VERSION = 'words:blacklist:version'
     RKEY_NON_EPHEMERAL_ROOMS = 'rooms:nonephemeral'
     RKEY_DEFAULT_ROOMS = 'rooms:default'
     RKEY_ACKS_USER = 'acks:user:%s'
@@ -411,6 +463,10 @@ class RedisKeys(object):
     def black_list() -> str:
         return RedisKeys.RKEY_BLACK_LIST
 
+    @staticmethod
+    def black_list_version() -> str:
+        return RedisKeys.RKEY_BLACK_LIST_VERSION
+
     @staticmethod
     def user_roles() -> str:
         return RedisKeys.RKEY_USER_ROLES
@@ -510,6 +566,34 @@ class RedisKeys(object):
     def room_history(room_id: str) -> str:
         return RedisKeys.RKEY_ROOM_HISTORY % room_id
 
+    @staticmethod
+    def room_messages(room_id: str) -> str:
+        return RedisKeys.RKEY_ROOM_MESSAGES % room_id
+
+    @staticmethod
+    def message(message_id: str) -> str:
+        return RedisKeys.RKEY_MESSAGE % message_id
+
+    @staticmethod
+    def node_for_sid(sid: str) -> str:
+        return RedisKeys.RKEY_NODE_FOR_SID % sid
+
+    @staticmethod
+    def recent_history(room_id: str) -> str:
+        return RedisKeys.RKEY_RECENT_HISTORY % room_id
+
+    @staticmethod
+    def recent_history_version(room_id: str) -> str:
+        return RedisKeys.RKEY_RECENT_HISTORY_VERSION % room_id
+
+    @staticmethod
+    def recent_history_room_generation(room_id: str) -> str:
+        return RedisKeys.RKEY_RECENT_HISTORY_ROOM_GENERATION % room_id
+
+    @staticmethod
+    def recent_history_generation() -> str:
+        return RedisKeys.RKEY_RECENT_HISTORY_GENERATION
+
     @staticmethod
     def channel_acl(channel_id: str) -> str:
         return RedisKeys.RKEY_CHANNEL_ACL % channel_id
@@ -115,6 +115,14 @@ class IDatabase(Interface):
         :return: nothing
         """
 
+    def mark_spams_deleted_if_exists(self, message_ids: list) -> None:
+        """
+        mark many as deleted at once
+
+        :param message_ids: the uuids of the messages stored in the message store
+        :return: nothing
+        """
+
     def mark_spam_not_deleted_if_exists(self, message_id: str) -> None:
         """
         mark as not deleted
@@ -938,6 +946,15 @@ class IDatabase(Interface):
         :return: the user name
         """
 
+    def get_user_names(self, user_ids: list) -> dict:
+        """
+        get the names of many users at once, using a single cache lookup and a single query for the users not in the
+        cache
+
+        :param user_ids: a list of user ids
+        :return: a dict of {user_id: user_name}, users that can't be found are not included
+        """
+
     def get_owners_channel(self, channel_id: str) -> dict:
         """
         get all owners of a channel
@@ -1289,6 +1306,16 @@ class IDatabase(Interface):
         :return: the status
         """
 
+    def get_user_statuses(self, user_ids: list, skip_cache: bool = False) -> dict:
+        """
+        get the statuses of many users at once (online/offline/invisible), using a single cache lookup and a single
+        query for the users not in the cache
+
+        :param user_ids: a list of user ids
+        :param skip_cache: bypass the cache or not
+        :return: a dict of {user_id: status} for all the requested users
+        """
+
     def set_user_offline(self, user_id: str) -> None:
         """
         indicate a user is offline
@@ -1305,6 +1332,14 @@ class IDatabase(Interface):
         :return: nothing
         """
 
+    def set_users_online(self, user_ids: list) -> None:
+        """
+        indicate many users are online at once, e.g. when receiving a batch of heartbeats
+
+        :param user_ids: a list of user ids
+        :return: nothing
+        """
+
     def set_user_invisible(self, user_id: str, is_offline=False) -> None:
         """
         indicate a user is invisible
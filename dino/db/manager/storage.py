@@ -9,6 +9,7 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+from dino import utils
 from dino.config import ConfigKeys
 from dino.db.manager.base import BaseManager
 from dino.environ import GNEnvironment
@@ -47,13 +48,34 @@ class StorageManager(BaseManager):
         msg_ids = self.env.storage.get_undeleted_message_ids_for_user(user_id)
         return self.env.storage.get_messages(msg_ids)
 
+    def stream_all_messages_from_user(
+            self, user_id: str, from_time: str, to_time: str, page_size: int, cursor: str=None):
+        """
+        same as get_all_messages_from_user() but one page at a time, see stream_history()
+        """
+        from_time, to_time = self.format_time_range(from_time, to_time)
+        from_time_int = int(from_time.strftime('%s'))
+        to_time_int = int(to_time.strftime('%s'))
+
+        return self._pages(lambda page_cursor: self.env.storage.get_undeleted_messages_for_user_and_time_page(
+            user_id, from_time_int, to_time_int, page_size, page_cursor), cursor)
+
     def undelete_message(self, message_id: str) -> None:
         self.env.storage.undelete_message(message_id)
         self.env.db.mark_spam_not_deleted_if_exists(message_id)
+        utils.remove_recent_history()
 
     def delete_message(self, message_id: str) -> None:
         self.env.storage.delete_message(message_id)
         self.env.db.mark_spam_deleted_if_exists(message_id)
+        utils.remove_recent_history()
+
+    def delete_messages(self, message_ids: list) -> (int, int):
+        successes, failures = self.env.storage.delete_messages(message_ids)
+        self.env.db.mark_spams_deleted_if_exists(message_ids)
+        # the rooms of the messages are not known here
+        utils.remove_recent_history()
+        return successes, failures
 
     def find_history(self, room_id, user_id, from_time, to_time) -> (list, datetime, datetime):
         if is_blank(user_id) and is_blank(room_id):
@@ -71,6 +93,32 @@ class StorageManager(BaseManager):
 
         return history, from_time, to_time
 
+    def stream_history(self, room_id, user_id, from_time, to_time, page_size: int, cursor: str=None):
+        """
+        Same as find_history() but the history is fetched one page at a time when iterating over the returned
+        generator, so only one page is in memory at once. The arguments are validated before returning.
+
+        :return: a generator of tuples of a page of messages and the cursor for the next page; the cursor of the last
+        page is None, and any other cursor can be passed to a later call to continue from the following page
+        """
+        if is_blank(user_id) and is_blank(room_id):
+            raise RuntimeError('need user ID and/or room ID')
+
+        from_time, to_time = self.format_time_range(from_time, to_time)
+        from_time_int = int(from_time.strftime('%s'))
+        to_time_int = int(to_time.strftime('%s'))
+
+        return self._pages(lambda page_cursor: self.env.storage.get_history_page(
+            room_id, user_id, from_time_int, to_time_int, page_size, page_cursor), cursor)
+
+    def _pages(self, get_page, cursor: str):
+        while True:
+            messages, cursor = get_page(cursor)
+            yield messages, cursor
+
+            if cursor is None:
+                return
+
     def format_time_range(self, from_time: str=None, to_time: str=None):
         if not is_blank(from_time):
             try:
@@ -21,6 +21,7 @@ from typing import Union
 from uuid import uuid4 as uuid
 
 from activitystreams import Activity
+from sqlalchemy import and_
 from sqlalchemy import func
 from sqlalchemy import or_
 from sqlalchemy.orm.exc import StaleDataError
@@ -28,9 +29,12 @@ from sqlalchemy.orm.exc import UnmappedInstanceError
 from sqlalchemy.exc import IntegrityError
 from zope.interface import implementer
 
+from dino.cache.singleflight import SingleFlight
+from dino.cache.singleflight import DEFAULT_STALE_TTL
 from dino.config import ApiActions
 from dino.config import ApiTargets
 from dino.config import ConfigKeys
+from dino.config import RedisKeys
 from dino.config import RoleKeys
 from dino.config import UserKeys
 from dino.db import IDatabase
@@ -79,6 +83,9 @@ __author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
 
 logger = logging.getLogger(__name__)
 
+# keep the number of bound parameters per query below the limit of e.g. sqlite (999)
+MAX_IN_CLAUSE_SIZE = 500
+
 
 def with_session(view_func):
     @wraps(view_func)
@@ -104,6 +111,12 @@ class DatabaseRdbms(object):
         else:
             DatabaseRdbms.db = Database(env)
 
+        # coalesces concurrent cache misses for the same key into one query
+        self.single_flight = SingleFlight(env, stale_ttl=float(env.config.get(
+            ConfigKeys.STALE_TTL, domain=ConfigKeys.CACHE_SERVICE, default=DEFAULT_STALE_TTL)))
+        self.serve_stale = env.config.get(
+            ConfigKeys.STALE_WHILE_REVALIDATE, domain=ConfigKeys.CACHE_SERVICE, default=False)
+
     @with_session
     def _session(self, session):
         return session
@@ -485,6 +498,73 @@ class DatabaseRdbms(object):
         self.env.cache.set_user_status(user_id, status)
         return status
 
+    def get_user_statuses(self, user_ids: list, skip_cache: bool = False) -> dict:
+        @with_session
+        def _get_user_statuses(_user_ids: list, session=None) -> dict:
+            rows = session.query(UserStatus.uuid, UserStatus.status)\
+                .filter(UserStatus.uuid.in_(_user_ids))\
+                .all()
+            return {row.uuid: str(row.status) for row in rows}
+
+        user_ids = list(set(user_ids))
+        statuses = dict()
+
+        if not skip_cache:
+            statuses = dict(self.env.cache.get_user_statuses(user_ids) or dict())
+
+        not_cached = [user_id for user_id in user_ids if user_id not in statuses]
+        if len(not_cached) == 0:
+            return statuses
+
+        found = dict()
+        for i in range(0, len(not_cached), MAX_IN_CLAUSE_SIZE):
+            found.update(_get_user_statuses(not_cached[i:i+MAX_IN_CLAUSE_SIZE]))
+
+        not_cached_statuses = {
+            user_id: found.get(user_id, UserKeys.STATUS_UNAVAILABLE)
+            for user_id in not_cached
+        }
+
+        self.env.cache.set_user_statuses(not_cached_statuses)
+        statuses.update(not_cached_statuses)
+        return statuses
+
+    def set_users_online(self, user_ids: list) -> None:
+        @with_session
+        def _set_users_online(_user_ids: list, session=None):
+            user_statuses = session.query(UserStatus).filter(UserStatus.uuid.in_(_user_ids)).all()
+            existing = {user_status.uuid for user_status in user_statuses}
+
+            for user_status in user_statuses:
+                user_status.status = UserKeys.STATUS_AVAILABLE
+
+            for user_id in _user_ids:
+                if user_id in existing:
+                    continue
+
+                user_status = UserStatus()
+                user_status.uuid = user_id
+                user_status.status = UserKeys.STATUS_AVAILABLE
+                session.add(user_status)
+
+            session.commit()
+
+        user_ids = list(set(user_ids))
+        if len(user_ids) == 0:
+            return
+
+        self.env.cache.set_users_online(user_ids)
+
+        for i in range(0, len(user_ids), MAX_IN_CLAUSE_SIZE):
+            batch = user_ids[i:i+MAX_IN_CLAUSE_SIZE]
+            try:
+                _set_users_online(batch)
+            except (IntegrityError, StaleDataError) as e:
+                # another node might have created the status for one of the users at the same time
+                logger.warning('could not set users online in batch, will try one by one: %s' % str(e))
+                for user_id in batch:
+                    self.set_user_online(user_id)
+
     def set_user_invisible(self, user_id: str, is_offline=False) -> None:
         @with_session
         def _set_user_invisible(session=None):
@@ -641,65 +721,48 @@ class DatabaseRdbms(object):
         return dict()
 
     def rooms_for_channel(self, channel_id) -> dict:
+        @with_session
         @timeit(logger, 'on_rooms_for_channel')
-        def _rooms():
-            @with_session
-            @timeit(logger, 'on_rooms_for_channel_user_ids')
-            def _user_ids_and_room_data(session=None):
-                all_rooms = session.query(Rooms)\
-                    .join(Rooms.channel)\
-                    .outerjoin(Rooms.users)\
-                    .filter(Channels.uuid == channel_id)\
-                    .all()
-
-                unique_users = set()
-                room_info = dict()
-                for room in all_rooms:
-                    room_info[room.uuid] = dict()
-                    room_info[room.uuid]['name'] = room.name
-                    room_info[room.uuid]['sort_order'] = room.sort_order
-                    room_info[room.uuid]['ephemeral'] = room.ephemeral
-                    room_info[room.uuid]['admin'] = room.admin
-                    room_info[room.uuid]['users'] = [user.uuid for user in room.users]
-                    for user in room.users:
-                        unique_users.add(user.uuid)
-                return unique_users, room_info
-
-            @timeit(logger, 'on_rooms_for_channel_user_statuses')
-            def _user_statuses(_user_ids: set):
-                user_statuses = dict()
-                for user_id in _user_ids:
-                    user_statuses[user_id] = self.get_user_status(user_id)
-                return user_statuses
-
-            @timeit(logger, 'on_rooms_for_channel_get_the_rooms')
-            def _get_the_rooms(all_rooms: dict, user_statuses: dict):
-                rooms_with_n_users = dict()
-                for room_id in all_rooms.keys():
-                    visible_users = set()
-
-                    for user_id in all_rooms[room_id]['users']:
-                        if user_id in user_statuses and user_statuses[user_id] == UserKeys.STATUS_INVISIBLE:
-                            continue
-                        visible_users.add(user_id)
-
-                    rooms_with_n_users[room_id] = {
-                        'name': all_rooms[room_id]['name'],
-                        'sort_order': all_rooms[room_id]['sort_order'],
-                        'ephemeral': all_rooms[room_id]['ephemeral'],
-                        'admin': all_rooms[room_id]['admin'],
-                        'users': len(visible_users)
-                    }
-                return rooms_with_n_users
+        def _rooms(session=None):
+            # invisible users are matched by the join condition, so subtracting their count from the count of all
+            # users in the room gives the number of visible users without loading any users or statuses
+            rows = session.query(
+                    Rooms.uuid,
+                    Rooms.name,
+                    Rooms.sort_order,
+                    Rooms.ephemeral,
+                    Rooms.admin,
+                    func.count(Users.id) - func.count(UserStatus.id)
+                )\
+                .join(Rooms.channel)\
+                .outerjoin(Rooms.users)\
+                .outerjoin(UserStatus, and_(
+                    UserStatus.uuid == Users.uuid,
+                    UserStatus.status == int(UserKeys.STATUS_INVISIBLE)
+                ))\
+                .filter(Channels.uuid == channel_id)\
+                .group_by(Rooms.id, Rooms.uuid, Rooms.name, Rooms.sort_order, Rooms.ephemeral, Rooms.admin)\
+                .all()
 
-            # avoid overwriting the session variable
-            user_ids, room_data = _user_ids_and_room_data()
-            return _get_the_rooms(room_data, _user_statuses(user_ids))
+            return {
+                room_uuid: {
+                    'name': name,
+                    'sort_order': sort_order,
+                    'ephemeral': ephemeral,
+                    'admin': admin,
+                    'users': n_visible_users
+                } for room_uuid, name, sort_order, ephemeral, admin, n_visible_users in rows
+            }
+
+        def _load():
+            _rooms_for_channel = _rooms()
+            self.env.cache.set_rooms_for_channel(channel_id, _rooms_for_channel)
+            return _rooms_for_channel
 
         rooms = self.env.cache.get_rooms_for_channel(channel_id)
         if rooms is None:
-            rooms = _rooms()
-            self.env.cache.set_rooms_for_channel(channel_id, rooms)
+            rooms = self.single_flight.load(
+                RedisKeys.rooms_for_channel_with_info(channel_id), _load, serve_stale=self.serve_stale)
         return rooms
 
     @with_session
@@ -734,10 +797,7 @@ class DatabaseRdbms(object):
 
         @timeit(logger, 'on_users_in_room_user_statuses')
         def _user_statuses(user_ids: dict):
-            statuses = dict()
-            for user_id in user_ids.keys():
-                statuses[user_id] = self.get_user_status(user_id)
-            return statuses
+            return self.get_user_statuses(list(user_ids.keys()))
 
         def _visible_users(every_user_in_room: dict, statuses: dict) -> dict:
             visible_users = dict()
@@ -759,17 +819,26 @@ class DatabaseRdbms(object):
         if this_user_id is not None:
             is_super_user = self.is_super_user(this_user_id) or self.is_global_moderator(this_user_id)
 
-        if not skip_cache:
-            users = self.env.cache.get_users_in_room(room_id, is_super_user=is_super_user)
-            if users is not None:
-                return users.copy()
+        def _load():
+            all_users = _user_ids()
+            user_statuses = _user_statuses(all_users)
+            _users = _visible_users(all_users, user_statuses)
 
-        all_users = _user_ids()
-        user_statuses = _user_statuses(all_users)
-        users = _visible_users(all_users, user_statuses)
+            self.env.cache.set_users_in_room(room_id, _users, is_super_user=is_super_user)
+            return _users
 
-        self.env.cache.set_users_in_room(room_id, users, is_super_user=is_super_user)
-        return users
+        if skip_cache:
+            return _load()
+
+        users = self.env.cache.get_users_in_room(room_id, is_super_user=is_super_user)
+        if users is not None:
+            return users.copy()
+
+        if is_super_user:
+            key = RedisKeys.users_in_room_incl_invisible(room_id)
+        else:
+            key = RedisKeys.users_in_room_only_visible(room_id)
+        return self.single_flight.load(key, _load).copy()
 
     def room_contains(self, room_id: str, user_id: str) -> bool:
         self.get_room_name(room_id)
@@ -887,9 +956,12 @@ class DatabaseRdbms(object):
         if channels is not None:
             return channels
 
-        channels = _channels()
-        self.env.cache.set_channels_with_sort(channels)
-        return channels
+        def _load():
+            _channels_with_sort = _channels()
+            self.env.cache.set_channels_with_sort(_channels_with_sort)
+            return _channels_with_sort
+
+        return self.single_flight.load(RedisKeys.channels_with_sort(), _load, serve_stale=self.serve_stale)
 
     @with_session
     def channel_name_exists(self, channel_name: str, session=None) -> bool:
@@ -1834,12 +1906,15 @@ class DatabaseRdbms(object):
 
         self.get_room_name(room_id)
 
+        def _load():
+            _acls_for_action = _acls()
+            self.env.cache.set_acls_in_room_for_action(room_id, action, _acls_for_action)
+            return _acls_for_action
+
         value = self.env.cache.get_acls_in_room_for_action(room_id, action)
         if value is not None:
             return value
-        value = _acls()
-        self.env.cache.set_acls_in_room_for_action(room_id, action, value)
-        return value
+        return self.single_flight.load(RedisKeys.acls_in_room_for_action(room_id, action), _load)
 
     def get_acls_in_channel_for_action(self, channel_id: str, action: str):
         @with_session
@@ -1864,12 +1939,15 @@ class DatabaseRdbms(object):
                 acls[found_acl.acl_type] = found_acl.acl_value
             return acls
 
+        def _load():
+            _acls_for_action = _acls()
+            self.env.cache.set_acls_in_channel_for_action(channel_id, action, _acls_for_action)
+            return _acls_for_action
+
         value = self.env.cache.get_acls_in_channel_for_action(channel_id, action)
         if value is not None:
             return value
-        value = _acls()
-        self.env.cache.set_acls_in_channel_for_action(channel_id, action, value)
-        return value
+        return self.single_flight.load(RedisKeys.acls_in_channel_for_action(channel_id, action), _load)
 
     def _format_spam(self, spam: Spams) -> dict:
         if spam is None:
@@ -1898,6 +1976,15 @@ class DatabaseRdbms(object):
             session.add(spam)
             session.commit()
 
+    @with_session
+    def mark_spams_deleted_if_exists(self, message_ids: list, session=None) -> None:
+        message_ids = list(message_ids)
+        for i in range(0, len(message_ids), MAX_IN_CLAUSE_SIZE):
+            session.query(Spams)\
+                .filter(Spams.message_id.in_(message_ids[i:i+MAX_IN_CLAUSE_SIZE]))\
+                .update({Spams.message_deleted: True}, synchronize_session=False)
+        session.commit()
+
     @with_session
     def mark_spam_not_deleted_if_exists(self, message_id: str, session=None) -> None:
         spam = session.query(Spams).filter(Spams.message_id == message_id).first()
@@ -2192,6 +2279,32 @@ class DatabaseRdbms(object):
 
         return user_name
 
+    def get_user_names(self, user_ids: list) -> dict:
+        @with_session
+        def _get_user_names(_user_ids: list, session=None) -> dict:
+            rows = session.query(Users.uuid, Users.name)\
+                .filter(Users.uuid.in_(_user_ids))\
+                .all()
+            return {
+                row.uuid: row.name for row in rows
+                if row.name is not None and len(row.name.strip()) > 0
+            }
+
+        user_ids = list(set(user_ids))
+        user_names = dict(self.env.cache.get_user_names(user_ids) or dict())
+
+        not_cached = [user_id for user_id in user_ids if user_id not in user_names]
+        if len(not_cached) == 0:
+            return user_names
+
+        found = dict()
+        for i in range(0, len(not_cached), MAX_IN_CLAUSE_SIZE):
+            found.update(_get_user_names(not_cached[i:i+MAX_IN_CLAUSE_SIZE]))
+
+        self.env.cache.set_user_names(found)
+        user_names.update(found)
+        return user_names
+
     def _get_users_with_role(self, roles, role_key):
         if roles is None or len(roles) == 0:
             return dict()
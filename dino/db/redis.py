@@ -96,6 +96,9 @@ class DatabaseRedis(object):
     def mark_spam_deleted_if_exists(self, message_id: str) -> None:
         return
 
+    def mark_spams_deleted_if_exists(self, message_ids: list) -> None:
+        return
+
     def mark_spam_not_deleted_if_exists(self, message_id: str) -> None:
         return
 
@@ -140,6 +143,7 @@ class DatabaseRedis(object):
 
     def add_words_to_blacklist(self, words: list) -> None:
         self.redis.sadd(RedisKeys.black_list(), words)
+        self.env.cache.increase_black_list_version()
 
     def get_users_roles(self, user_ids: list) -> None:
         raise NotImplementedError('not available in redis implementation of db interface')
@@ -206,11 +210,9 @@ class DatabaseRedis(object):
 
     def get_online_admins(self) -> list:
         admins = self.get_super_users()
+        statuses = self.get_user_statuses(list(admins.keys()))
         return [
-            user_id for user_id, status in zip(
-                    admins.keys(),
-                    [self.get_user_status(user_id) for user_id in admins.keys()]
-            )
+            user_id for user_id, status in statuses.items()
             if status in [
                 UserKeys.STATUS_AVAILABLE,
                 UserKeys.STATUS_CHAT,
@@ -1062,6 +1064,17 @@ class DatabaseRedis(object):
             raise NoSuchUserException(user_id)
         return str(name, 'utf-8')
 
+    def get_user_names(self, user_ids: list) -> dict:
+        user_names = dict()
+        if len(user_ids) == 0:
+            return user_names
+
+        values = self.redis.hmget(RedisKeys.user_names(), user_ids)
+        for user_id, user_name in zip(user_ids, values):
+            if user_name is not None:
+                user_names[user_id] = str(user_name, 'utf-8')
+        return user_names
+
     def _get_users_with_role(self, roles: dict, role_key: str):
         if roles is None or len(roles) == 0:
             return dict()
@@ -1249,6 +1262,20 @@ class DatabaseRedis(object):
             return UserKeys.STATUS_UNAVAILABLE
         return str(status, 'utf-8')
 
+    def get_user_statuses(self, user_ids: list, skip_cache: bool = False) -> dict:
+        statuses = dict(self.env.cache.get_user_statuses(user_ids) or dict())
+        not_cached = [user_id for user_id in user_ids if user_id not in statuses]
+        if len(not_cached) == 0:
+            return statuses
+
+        values = self.redis.mget([RedisKeys.user_status(user_id) for user_id in not_cached])
+        for user_id, status in zip(not_cached, values):
+            if status is None:
+                statuses[user_id] = UserKeys.STATUS_UNAVAILABLE
+            else:
+                statuses[user_id] = str(status, 'utf-8')
+        return statuses
+
     def set_user_offline(self, user_id: str) -> None:
         self.env.cache.set_user_offline(user_id)
 
@@ -1256,6 +1283,13 @@ class DatabaseRedis(object):
         self.env.cache.set_user_online(user_id)
         self.redis.set(RedisKeys.user_status(user_id), UserKeys.STATUS_AVAILABLE)
 
+    def set_users_online(self, user_ids: list) -> None:
+        if len(user_ids) == 0:
+            return
+
+        self.env.cache.set_users_online(user_ids)
+        self.redis.mset({RedisKeys.user_status(user_id): UserKeys.STATUS_AVAILABLE for user_id in user_ids})
+
     def set_user_invisible(self, user_id: str, is_offline=False) -> None:
         if is_offline:
             self.env.cache.setUser_status_invisible(user_id)
@@ -9,6 +9,7 @@ from kombu.pools import producers
 
 from dino import environ
 from dino.config import ConfigKeys
+from dino.endpoint.codec import get_codec
 from dino.utils.decorators import locked_method
 
 
@@ -34,12 +35,24 @@ class BasePublisher(ABC):
         self.queue_connection = None
         self.queue = None
         self.exchange = None
+        self.codec = get_codec(env.config.get(ConfigKeys.CODEC, domain=self.domain_key, default=None))
+
+        # set by PubSub if events that can't be published are kept in an outbox
+        self.outbox = None
         self.message_type = 'external' if self.is_external_queue else 'internal'
 
     def error_callback(self, exc, interval) -> None:
         self.logger.warning('could not connect to MQ (interval: %s): %s' % (str(interval), str(exc)))
 
-    def try_publish(self, message):
+    def node_queue_name(self):
+        """
+        the name of the queue this node consumes, that other nodes can publish to directly with publish(routing_key=)
+        """
+        if self.queue is None:
+            return None
+        return self.queue.name
+
+    def try_publish(self, message, routing_key: str=None):
         self.logger.info('sending "{}" with "{}"'.format(self.message_type, str(self.queue_connection)))
 
         with producers[self.queue_connection].acquire(block=False) as producer:
@@ -50,14 +63,25 @@ class BasePublisher(ABC):
                 max_retries=3
             )
 
+            if routing_key is not None:
+                # the default exchange delivers the message only to the queue with the same name as the routing key
+                amqp_publish(message, exchange='', routing_key=routing_key, serializer=self.codec.name)
+                return
+
             amqp_publish(
                 message,
                 exchange=self.exchange,
-                declare=[self.exchange, self.queue]
+                declare=[self.exchange, self.queue],
+                serializer=self.codec.name
             )
 
-    def publish(self, message: dict) -> None:
-        if self.recently_sent_has(message['id']):
+    def publish(self, message: dict, routing_key: str=None) -> None:
+        """
+        :param message: the message to publish
+        :param routing_key: the queue name of a node to send the message only to that node, instead of to the
+        exchange; the same message can be sent to several nodes this way
+        """
+        if routing_key is None and self.recently_sent_has(message['id']):
             self.logger.debug('ignoring external event with verb %s and id %s, already sent' %
                          (message['verb'], message['id']))
             return
@@ -69,12 +93,13 @@ class BasePublisher(ABC):
 
         for current_try in range(n_tries):
             try:
-                self.try_publish(message)
+                self.try_publish(message, routing_key=routing_key)
 
                 self.env.stats.incr('publish.external.count')
                 self.env.stats.timing('publish.external.time', (time.time()-start)*1000)
                 failed = False
-                self.update_recently_sent(message['id'])
+                if routing_key is None:
+                    self.update_recently_sent(message['id'])
                 break
 
             except Exception as pe:
@@ -97,6 +122,21 @@ class BasePublisher(ABC):
                 self.message_type, message['verb'], message['id'])
             )
 
+    def publish_and_wait(self, messages: list, timeout: float=None) -> int:
+        """
+        same as publish(), but for several events, and only returns when they have been published, e.g. when
+        replaying events from the outbox
+
+        :param timeout: max seconds to wait for the queue, if the publisher doesn't wait by itself
+        :return: how many of the events, counting from the first one, were published
+        """
+        for n_published, message in enumerate(messages):
+            try:
+                self.publish(message)
+            except PublishException:
+                return n_published
+        return len(messages)
+
     def get_port(self):
         args = sys.argv
         for a in ['--bind', '-b']:
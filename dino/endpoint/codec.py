@@ -0,0 +1,180 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import logging
+from typing import Union
+
+from kombu import serialization
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+logger = logging.getLogger(__name__)
+
+CODEC_JSON = 'json'
+CODEC_ORJSON = 'orjson'
+CODEC_MSGPACK = 'msgpack'
+
+# byte transports (kafka) get a header of MAGIC, WIRE_VERSION and the codec id in front of the payload; json is
+# sent without a header, so consumers that don't know about codecs (or older nodes) can still read it
+MAGIC = 0xd1
+WIRE_VERSION = 1
+HEADER_SIZE = 3
+
+
+class Codec(object):
+    """
+    Encodes events for the queues. On the kombu transports (amqp/redis) the codec is registered as a kombu serializer
+    and identified by the content type of the message; on kafka it's identified by the header of the value.
+    """
+    name = None
+    codec_id = None
+    content_type = None
+
+    def encode(self, message: dict) -> bytes:
+        raise NotImplementedError()
+
+    def decode(self, data: bytes) -> dict:
+        raise NotImplementedError()
+
+
+class JsonCodec(Codec):
+    name = CODEC_JSON
+    codec_id = 0
+    content_type = 'application/json'
+
+    def encode(self, message: dict) -> bytes:
+        return json.dumps(message).encode('utf-8')
+
+    def decode(self, data: bytes) -> dict:
+        return json.loads(data.decode('utf-8'))
+
+
+class OrjsonCodec(Codec):
+    name = CODEC_ORJSON
+    codec_id = 1
+    content_type = 'application/x-orjson'
+
+    def __init__(self):
+        import orjson
+        self.orjson = orjson
+
+    def encode(self, message: dict) -> bytes:
+        return self.orjson.dumps(message, option=self.orjson.OPT_NON_STR_KEYS)
+
+    def decode(self, data: bytes) -> dict:
+        return self.orjson.loads(data)
+
+
+class MsgpackCodec(Codec):
+    name = CODEC_MSGPACK
+    codec_id = 2
+    content_type = 'application/x-msgpack'
+
+    def __init__(self):
+        import msgpack
+        self.msgpack = msgpack
+
+    def encode(self, message: dict) -> bytes:
+        return self.msgpack.packb(message, use_bin_type=True)
+
+    def decode(self, data: bytes) -> dict:
+        return self.msgpack.unpackb(data, raw=False)
+
+
+CODECS = {
+    CODEC_JSON: JsonCodec,
+    CODEC_ORJSON: OrjsonCodec,
+    CODEC_MSGPACK: MsgpackCodec,
+}
+
+# name => codec instance, for the codecs that could be created
+_loaded = dict()
+
+
+def get_codec(name: str=None) -> Codec:
+    """
+    :param name: name of the codec, json if None or blank
+    :return: the codec; json if the library for the codec isn't installed
+    """
+    if name is None or len(name.strip()) == 0:
+        name = CODEC_JSON
+
+    if name in _loaded:
+        return _loaded[name]
+
+    if name not in CODECS:
+        raise RuntimeError('unknown codec "{}"; available codecs are [{}]'.format(name, ','.join(sorted(CODECS))))
+
+    try:
+        codec = CODECS[name]()
+    except ImportError as e:
+        logger.warning('could not use codec "{}", using json: {}'.format(name, str(e)))
+        return get_codec(CODEC_JSON)
+
+    if name != CODEC_JSON:
+        # kombu already has its own json serializer
+        serialization.register(
+            codec.name, codec.encode, codec.decode, content_type=codec.content_type, content_encoding='binary')
+
+    _loaded[name] = codec
+    return codec
+
+
+def load_codecs() -> None:
+    """
+    make every codec that can be created available to kombu consumers, so events are decoded no matter which codec
+    the node that sent them uses
+    """
+    for name in CODECS:
+        get_codec(name)
+
+
+def _codec_for_id(codec_id: int) -> Codec:
+    for name, codec_class in CODECS.items():
+        if codec_class.codec_id != codec_id:
+            continue
+
+        codec = get_codec(name)
+        if codec.name != name:
+            raise RuntimeError('codec "{}" is not installed'.format(name))
+        return codec
+
+    raise RuntimeError('unknown codec id {}'.format(codec_id))
+
+
+def encode(message: dict, codec: Codec) -> bytes:
+    """
+    encode for byte transports, with a header unless json is used
+    """
+    if codec.codec_id == JsonCodec.codec_id:
+        return codec.encode(message)
+    return bytes([MAGIC, WIRE_VERSION, codec.codec_id]) + codec.encode(message)
+
+
+def decode(data: Union[bytes, str, dict]) -> dict:
+    """
+    decode from byte transports, using the codec in the header, or json if there's no header
+    """
+    if isinstance(data, dict):
+        return data
+
+    if isinstance(data, str):
+        return json.loads(data)
+
+    if len(data) < HEADER_SIZE or data[0] != MAGIC:
+        return get_codec(CODEC_JSON).decode(data)
+
+    if data[1] > WIRE_VERSION:
+        raise RuntimeError('unsupported wire version {} (newest known is {})'.format(data[1], WIRE_VERSION))
+
+    return _codec_for_id(data[2]).decode(data[HEADER_SIZE:])
@@ -0,0 +1,79 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import sys
+import time
+import zlib
+
+import eventlet
+from eventlet.greenpool import GreenPool
+from eventlet.queue import LightQueue
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = 8
+
+
+class PartitionedDispatcher(object):
+    """
+    Handles tasks concurrently in a green pool, but tasks with the same key one at a time and in the order they were
+    dispatched, by always handing tasks with the same key to the same partition.
+
+    Each partition is a queue with one green thread taking tasks from it, so a slow task only holds up the tasks
+    behind it in the same partition instead of all of them.
+    """
+
+    def __init__(self, env, concurrency: int=DEFAULT_CONCURRENCY):
+        self.env = env
+        self.concurrency = concurrency
+        self.partitions = [LightQueue() for _ in range(concurrency)]
+        self.n_pending = 0
+
+        self.pool = GreenPool(size=concurrency)
+        for partition in self.partitions:
+            self.pool.spawn_n(self.run, partition)
+
+    def dispatch(self, key: str, name: str, func, *args) -> None:
+        """
+        :param key: tasks with the same key are handled in order, e.g. the room or user the task is for
+        :param name: what kind of task this is, used for the stats, e.g. the verb of the activity
+        :param func: the function to call with the args
+        """
+        self.n_pending += 1
+        self.partition_for(key).put((name, time.time(), func, args))
+
+    def partition_for(self, key: str) -> LightQueue:
+        # hash() of strings is randomized per process, this is stable across restarts which makes debugging easier
+        return self.partitions[zlib.crc32(str(key).encode('utf-8')) % self.concurrency]
+
+    def run(self, partition: LightQueue) -> None:
+        while True:
+            name, queued_at, func, args = partition.get()
+            before = time.time()
+
+            try:
+                func(*args)
+            except Exception as e:
+                logger.error('could not handle %s task: %s' % (name, str(e)))
+                logger.exception(e)
+                self.env.capture_exception(sys.exc_info())
+
+            self.env.stats.timing('queue.internal.%s.time' % name, (time.time() - before) * 1000)
+            self.env.stats.timing('queue.internal.%s.wait' % name, (before - queued_at) * 1000)
+            self.n_pending -= 1
+
+    def wait_until_done(self) -> None:
+        while self.n_pending > 0:
+            eventlet.sleep(0.01)
@@ -1,20 +1,61 @@
 import logging
-import random
+import time
 import traceback
 
+import eventlet
+from eventlet.semaphore import Semaphore
+
 from dino import environ
 from dino.config import ConfigKeys
+from dino.endpoint import codec
 from dino.endpoint.base import BasePublisher
+from dino.endpoint.base import PublishException
 
 logger = logging.getLogger(__name__)
 
+BUFFER_POLICY_DROP = 'drop'
+BUFFER_POLICY_BLOCK = 'block'
+
+DEFAULT_BUFFER_SIZE = 10000
+DEFAULT_LINGER_MS = 20
+DEFAULT_BATCH_SIZE = 64 * 1024
+
+# how long send() may wait for metadata or for room in the producer's buffer; the default in kafka-python is 60s
+DEFAULT_MAX_BLOCK_MS = 100
+
 
 class KafkaPublisher(BasePublisher):
+    """
+    With 'async' enabled for the external queue, publish() doesn't wait for kafka to acknowledge the event. Events are
+    batched by the producer (linger_ms/batch_size, optionally compressed), and the result is handled in a callback
+    when the batch has been sent; events that fail are republished on the internal queue, same as when the
+    synchronous publishing fails, or added to the outbox if there is one. The internal publisher retries with sleeps,
+    so failed events are republished in a new green thread instead of in the producer's callback.
+
+    At most buffer_size events are waiting to be acknowledged; when full, new events are either dropped (added to the
+    outbox if there is one) or wait for room depending on buffer_policy ('drop' or 'block'). send() waits at most
+    max_block_ms when kafka is unavailable, so with the 'drop' policy publishing never holds up the caller for long,
+    and it's done directly instead of in a new green thread (see non_blocking).
+    """
+
     def __init__(self, env, is_external_queue: bool):
         super().__init__(env, is_external_queue, queue_type='kafka', logger=logger)
 
-        eq_host = env.config.get(ConfigKeys.HOST, domain=self.domain_key, default=None)
-        eq_queue = env.config.get(ConfigKeys.QUEUE, domain=self.domain_key, default=None)
+        conf = env.config
+        self.is_async = conf.get(ConfigKeys.ASYNC_PUBLISH, domain=self.domain_key, default=False)
+        self.buffer_size = int(conf.get(ConfigKeys.BUFFER_SIZE, domain=self.domain_key, default=DEFAULT_BUFFER_SIZE))
+        self.buffer_policy = conf.get(ConfigKeys.BUFFER_POLICY, domain=self.domain_key, default=BUFFER_POLICY_DROP)
+        self.in_flight = Semaphore(value=self.buffer_size)
+
+        # callers can publish in their own green thread without being held up
+        self.non_blocking = self.is_async and self.buffer_policy == BUFFER_POLICY_DROP
+
+        if self.buffer_policy not in {BUFFER_POLICY_DROP, BUFFER_POLICY_BLOCK}:
+            raise RuntimeError('unknown buffer policy "{}", use "{}" or "{}"'.format(
+                self.buffer_policy, BUFFER_POLICY_DROP, BUFFER_POLICY_BLOCK))
+
+        eq_host = conf.get(ConfigKeys.HOST, domain=self.domain_key, default=None)
+        eq_queue = conf.get(ConfigKeys.QUEUE, domain=self.domain_key, default=None)
 
         if eq_host is None or len(eq_host) == 0 or (type(eq_host) == str and len(eq_host.strip()) == 0):
             logging.warning('blank external host specified, not setting up external publishing')
@@ -27,16 +68,128 @@ class KafkaPublisher(BasePublisher):
         if type(eq_host) == str:
             eq_host = [eq_host]
 
-        from kafka import KafkaProducer
-        import json
+        producer_args = dict()
+        if self.is_async:
+            producer_args['linger_ms'] = int(conf.get(
+                ConfigKeys.LINGER_MS, domain=self.domain_key, default=DEFAULT_LINGER_MS))
+            producer_args['batch_size'] = int(conf.get(
+                ConfigKeys.BATCH_SIZE, domain=self.domain_key, default=DEFAULT_BATCH_SIZE))
+            producer_args['max_block_ms'] = int(conf.get(
+                ConfigKeys.MAX_BLOCK_MS, domain=self.domain_key, default=DEFAULT_MAX_BLOCK_MS))
+
+        compression = conf.get(ConfigKeys.COMPRESSION, domain=self.domain_key, default=None)
+        if compression is not None and len(compression.strip()) > 0:
+            producer_args['compression_type'] = compression
 
         self.queue = eq_queue
-        self.queue_connection = KafkaProducer(
-            bootstrap_servers=eq_host,
-            value_serializer=lambda v: json.dumps(v).encode('utf-8'))
-        logger.info('setting up pubsub for type "{}: and host(s) "{}"'.format(self.queue_type, ','.join(eq_host)))
+        self.queue_connection = self.create_producer(eq_host, producer_args)
+        logger.info('setting up pubsub for type "{}: and host(s) "{}" (async: {})'.format(
+            self.queue_type, ','.join(eq_host), self.is_async))
+
+    def create_producer(self, hosts: list, producer_args: dict):
+        from kafka import KafkaProducer
 
-    def try_publish(self, message):
+        def create(**kwargs):
+            return KafkaProducer(
+                bootstrap_servers=hosts,
+                value_serializer=lambda v: codec.encode(v, self.codec),
+                **kwargs)
+
+        try:
+            return create(**producer_args)
+        except AssertionError as e:
+            # kafka-python asserts that the library for the compression codec is installed, e.g. lz4 or zstandard
+            if 'compression_type' not in producer_args:
+                raise
+            logger.warning('could not use compression "{}", publishing uncompressed: {}'.format(
+                producer_args.pop('compression_type'), str(e)))
+            return create(**producer_args)
+
+    def publish(self, message: dict, routing_key: str=None) -> None:
+        if not self.is_async:
+            return super().publish(message, routing_key=routing_key)
+
+        if self.recently_sent_has(message['id']):
+            self.logger.debug('ignoring external event with verb %s and id %s, already sent' %
+                              (message['verb'], message['id']))
+            return
+
+        if not self.in_flight.acquire(blocking=self.buffer_policy == BUFFER_POLICY_BLOCK):
+            if self.outbox is not None:
+                self.outbox.add(message)
+                return
+
+            self.env.stats.incr('publish.external.dropped')
+            return
+
+        try:
+            future = self.try_publish(message)
+        except Exception as e:
+            self.in_flight.release()
+            self.logger.error('failed to publish external: %s' % str(e))
+            self.logger.exception(traceback.format_exc())
+            self.env.stats.incr('publish.error')
+            raise PublishException()
+
+        self.update_recently_sent(message['id'])
+        future.add_callback(self.on_delivered, time.time())
+        future.add_errback(self.on_failed, message)
+
+    def on_delivered(self, sent_at: float, metadata) -> None:
+        self.in_flight.release()
+        self.env.stats.incr('publish.external.count')
+        self.env.stats.timing('publish.external.time', (time.time() - sent_at) * 1000)
+
+    def publish_and_wait(self, messages: list, timeout: float=None) -> int:
+        if not self.is_async:
+            return super().publish_and_wait(messages, timeout=timeout)
+
+        # not checking if recently sent, since the id is remembered when sending, not when delivered
+        futures = list()
+        for message in messages:
+            try:
+                futures.append(self.try_publish(message))
+            except Exception as e:
+                self.logger.error('failed to publish external event %s: %s' % (message.get('id'), str(e)))
+                self.env.stats.incr('publish.error')
+                break
+
+        # the producer sends the events in batches, so only wait after all of them have been sent
+        deadline = None if timeout is None else time.time() + timeout
+        for n_published, (message, future) in enumerate(zip(messages, futures)):
+            try:
+                future.get(timeout=None if deadline is None else max(0, deadline - time.time()))
+            except Exception as e:
+                self.logger.error('failed to publish external event %s: %s' % (message.get('id'), str(e)))
+                self.env.stats.incr('publish.error')
+                return n_published
+
+            self.update_recently_sent(message['id'])
+            self.env.stats.incr('publish.external.count')
+
+        return len(futures)
+
+    def on_failed(self, message: dict, exception) -> None:
+        self.in_flight.release()
+        self.logger.error('failed to publish external event %s: %s' % (message.get('id'), str(exception)))
+        self.env.stats.incr('publish.error')
+
+        if self.outbox is not None:
+            self.outbox.add(message)
+            return
+
+        eventlet.spawn_n(self.republish_internally, message)
+
+    def republish_internally(self, message: dict) -> None:
+        try:
+            self.logger.error('republishing to internal queue')
+            self.env.internal_publisher.publish(message)
+        except Exception as e:
+            self.logger.error('could not republish to internal queue: %s' % str(e))
+            self.logger.exception(traceback.format_exc())
+            environ.env.capture_exception(e)
+
+    def try_publish(self, message, routing_key: str=None):
         if self.env.enrichment_manager is not None:
             message = self.env.enrichment_manager.handle(message)
 
@@ -59,5 +212,5 @@ class KafkaPublisher(BasePublisher):
             environ.env.capture_exception(partition_e)
 
         # for kafka, the queue_connection is the KafkaProducer and queue is the topic name
-        self.queue_connection.send(
+        return self.queue_connection.send(
             topic=self.queue, value=message, key=topic_key)
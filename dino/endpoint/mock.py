@@ -9,11 +9,11 @@ class MockPublisher(BasePublisher):
     def __init__(self, env, is_external_queue: bool):
         super().__init__(env, is_external_queue, queue_type='mock', logger=logger)
 
-    def try_publish(self, message):
+    def try_publish(self, message, routing_key: str=None):
         self.logger.info('sending "{}" with "{}"'.format(self.message_type, str(self.queue_connection)))
 
-    def publish(self, message: dict) -> None:
-        if self.recently_sent_has(message['id']):
+    def publish(self, message: dict, routing_key: str=None) -> None:
+        if routing_key is None and self.recently_sent_has(message['id']):
             self.logger.debug(
                 'ignoring external event with verb {} and id {}, already sent'.format(
                     message['verb'], message['id']))
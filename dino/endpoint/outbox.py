@@ -0,0 +1,152 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import sys
+from collections import Counter
+from collections import deque
+from itertools import islice
+
+import eventlet
+
+from dino.config import ConfigKeys
+from dino.utils.spool import Spool
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_SIZE = 100000
+DEFAULT_REPLAY_RATE = 1000
+DEFAULT_RETRY_INTERVAL = 5
+DEFAULT_REPLAY_WINDOW = 100
+
+# seconds to wait for the queue to acknowledge a window of replayed events
+DEFAULT_PUBLISH_TIMEOUT = 10
+
+
+class Outbox(object):
+    """
+    Keeps external events that could not be published in a local spool, and publishes them again in a background
+    green thread when the external queue is reachable again.
+
+    After a failed publish the outbox is 'failing' until an event from it has been published again; while failing,
+    new events are added directly instead of each one waiting for the publisher's retries first. Events are replayed
+    at most replay_rate per second, so a long outage doesn't flood the queue when it comes back. At most max_size
+    events are kept, after that new events are dropped.
+
+    Events are replayed in windows of up to replay_window events; an asynchronous publisher sends the whole window
+    before waiting for the queue to acknowledge it, instead of waiting for each event in turn. An event is only
+    removed from the spool once the queue has acknowledged it.
+
+    The spool is synced to disk once per window instead of on every append, and events left in it after a restart
+    are published again, so an event might be published twice.
+    """
+
+    def __init__(
+            self, env, path: str, max_size: int=DEFAULT_MAX_SIZE, replay_rate: float=DEFAULT_REPLAY_RATE,
+            retry_interval: float=DEFAULT_RETRY_INTERVAL, publish_timeout: float=DEFAULT_PUBLISH_TIMEOUT,
+            replay_window: int=DEFAULT_REPLAY_WINDOW
+    ):
+        self.env = env
+        self.publish_timeout = publish_timeout
+        self.replay_window = replay_window
+        self.max_size = max_size
+        self.replay_wait = 1 / replay_rate
+        self.retry_interval = retry_interval
+        self.failing = False
+
+        # (spool segment, event)
+        self.entries = deque()
+        self.spool = Spool(path, 'outbox')
+        self.recover()
+
+        if not self.env.config.get(ConfigKeys.TESTING, False):
+            eventlet.spawn_n(self.run)
+
+    def recover(self) -> None:
+        events = self.spool.recover()
+        if len(events) == 0:
+            return
+
+        logger.info('recovering %s unpublished external events from outbox' % len(events))
+        for event in events:
+            self.add(event)
+        self.spool.remove_recovered()
+
+    def is_failing(self) -> bool:
+        return self.failing
+
+    def size(self) -> int:
+        return len(self.entries)
+
+    def add(self, message: dict) -> bool:
+        """
+        :return: False if the outbox is full and the event was dropped
+        """
+        self.failing = True
+
+        if len(self.entries) >= self.max_size:
+            logger.error('outbox is full, dropping external event %s' % message.get('id'))
+            self.env.stats.incr('publish.outbox.dropped')
+            return False
+
+        self.entries.append((self.spool.append(message), message))
+        self.env.stats.gauge('publish.outbox.size', len(self.entries))
+        return True
+
+    def run(self) -> None:
+        while True:
+            try:
+                if not self.replay():
+                    eventlet.sleep(self.retry_interval)
+            except Exception as e:
+                logger.error('could not replay outbox: %s' % str(e))
+                logger.exception(e)
+                self.env.capture_exception(sys.exc_info())
+                eventlet.sleep(self.retry_interval)
+
+    def replay(self) -> bool:
+        """
+        publish the oldest events in the outbox, at most replay_window of them
+
+        :return: False if there was nothing to publish or not all of the events could be published
+        """
+        if len(self.entries) == 0:
+            return False
+
+        self.spool.sync()
+        window = list(islice(self.entries, self.replay_window))
+
+        try:
+            n_published = self.env.external_publisher.publish_and_wait(
+                [message for _, message in window], timeout=self.publish_timeout)
+        except Exception as e:
+            logger.error('could not replay events from outbox: %s' % str(e))
+            n_published = 0
+
+        for _ in range(n_published):
+            self.entries.popleft()
+            self.env.stats.incr('publish.outbox.replayed')
+        for segment, n_entries in Counter(segment for segment, _ in window[:n_published]).items():
+            self.spool.done(segment, n_entries)
+
+        self.env.stats.gauge('publish.outbox.size', len(self.entries))
+
+        if n_published < len(window):
+            logger.warning('external queue still unavailable, %s events in outbox' % len(self.entries))
+            self.failing = True
+            return False
+
+        self.failing = False
+        eventlet.sleep(self.replay_wait * n_published)
+        return True
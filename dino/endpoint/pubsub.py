@@ -10,10 +10,16 @@ from dino.endpoint.base import PublishException
 
 logger = logging.getLogger(__name__)
 
+# internal events about one user (activity.object.id) that only need to be handled by the nodes the user is on; bans
+# are still broadcast, since the ban is created (and sent to the external queue) by whichever node handles it, and
+# that has to happen even if the user is not connected or the node the user was on is gone
+DIRECTED_VERBS = {'kick'}
+
 
 class PubSub(object):
     def __init__(self, env):
         self.env = env
+        self.outbox = None
 
         if len(self.env.config) == 0 or self.env.config.get(ConfigKeys.TESTING, False):
             self.env.publish = PubSub.mock_publish
@@ -74,11 +80,44 @@ class PubSub(object):
                     ext_queue_type)
             )
 
+        self._setup_outbox(conf, env)
+
+    def _setup_outbox(self, conf, env):
+        outbox_path = conf.get(ConfigKeys.OUTBOX_PATH, domain=ConfigKeys.EXTERNAL_QUEUE, default=None)
+        if outbox_path is None or len(outbox_path.strip()) == 0:
+            return
+
+        from dino.endpoint.outbox import Outbox
+        from dino.endpoint.outbox import DEFAULT_MAX_SIZE
+        from dino.endpoint.outbox import DEFAULT_REPLAY_RATE
+        from dino.endpoint.outbox import DEFAULT_RETRY_INTERVAL
+        from dino.endpoint.outbox import DEFAULT_REPLAY_WINDOW
+
+        self.outbox = Outbox(
+            env, outbox_path,
+            max_size=int(conf.get(
+                ConfigKeys.OUTBOX_MAX_SIZE, domain=ConfigKeys.EXTERNAL_QUEUE, default=DEFAULT_MAX_SIZE)),
+            replay_rate=float(conf.get(
+                ConfigKeys.OUTBOX_REPLAY_RATE, domain=ConfigKeys.EXTERNAL_QUEUE, default=DEFAULT_REPLAY_RATE)),
+            retry_interval=float(conf.get(
+                ConfigKeys.OUTBOX_RETRY_INTERVAL, domain=ConfigKeys.EXTERNAL_QUEUE, default=DEFAULT_RETRY_INTERVAL)),
+            replay_window=int(conf.get(
+                ConfigKeys.OUTBOX_REPLAY_WINDOW, domain=ConfigKeys.EXTERNAL_QUEUE, default=DEFAULT_REPLAY_WINDOW))
+        )
+
+        # async publishers find out about failed events after publish() has returned
+        self.env.external_publisher.outbox = self.outbox
+
     def do_publish(self, message: dict, external: bool=None):
         logger.debug('publish: verb %s id %s external? %s' % (message['verb'], message['id'], str(external or False)))
         if external is None or not external:
             external = False
 
+        # publishers that don't wait for the queue don't need a green thread per event
+        if external and getattr(self.env.external_publisher, 'non_blocking', False):
+            self._do_publish_external(message)
+            return
+
         # avoid hanging clients
         eventlet.spawn(self._do_publish_async, message, external)
 
@@ -89,11 +128,24 @@ class PubSub(object):
             return self._do_publish_internal(message)
 
     def _do_publish_external(self, message: dict):
+        if self.outbox is not None and self.outbox.is_failing():
+            # the external queue is down, don't wait for the retries, the outbox will publish it when it's back
+            self.outbox.add(message)
+            return None
+
         try:
             return self.env.external_publisher.publish(message)
         except PublishException:
+            if self.outbox is not None:
+                logger.error('failed to publish external event multiple times! Adding it to the outbox')
+                self.outbox.add(message)
+                return None
+
             logger.error('failed to publish external event multiple times! Republishing to internal queue')
-            return self.env.internal_publisher.publish(message)
+
+            # the internal publisher retries with sleeps, and this might be the client's green thread
+            eventlet.spawn_n(self._republish_internal, message)
+            return None
         except Exception as e:
             logger.error('could not publish message "%s", because: %s' % (str(message), str(e)))
             logger.exception(traceback.format_exc())
@@ -101,9 +153,26 @@ class PubSub(object):
             environ.env.capture_exception(sys.exc_info())
         return None
 
+    def _republish_internal(self, message: dict) -> None:
+        try:
+            self.env.internal_publisher.publish(message)
+        except Exception as e:
+            logger.error('could not republish message "%s" to internal queue: %s' % (str(message), str(e)))
+            logger.exception(traceback.format_exc())
+            self.env.stats.incr('publish.error')
+            environ.env.capture_exception(sys.exc_info())
+
     def _do_publish_internal(self, message: dict):
         try:
-            return self.env.internal_publisher.publish(message)
+            nodes = self._nodes_for(message)
+            if nodes is None:
+                return self.env.internal_publisher.publish(message)
+
+            message['directed'] = True
+            for node in nodes:
+                self.env.internal_publisher.publish(message, routing_key=node)
+            self.env.stats.incr('publish.internal.directed')
+            return None
         except Exception as e:
             logger.error('could not publish message "%s", because: %s' % (str(message), str(e)))
             logger.exception(traceback.format_exc())
@@ -111,6 +180,28 @@ class PubSub(object):
             environ.env.capture_exception(sys.exc_info())
         return None
 
+    def _nodes_for(self, message: dict):
+        """
+        the nodes to send the message to directly, or None if it should be broadcast to all nodes; events that were
+        already sent around (having a revision) are always broadcast, since they're the fallback for when the
+        presence registry was wrong
+        """
+        from dino import utils
+
+        if message.get('verb') not in DIRECTED_VERBS or 'revision' in message:
+            return None
+
+        user_id = message.get('object', dict()).get('id')
+        if user_id is None:
+            return None
+
+        try:
+            return utils.get_nodes_for_user_id(user_id)
+        except Exception as e:
+            logger.error('could not get nodes for user %s, will broadcast: %s' % (user_id, str(e)))
+            logger.exception(traceback.format_exc())
+            return None
+
     @staticmethod
     def mock_publish(message, external=False):
         pass
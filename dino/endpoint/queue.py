@@ -141,10 +141,23 @@ class QueueHandler(object):
         target_id = activity.target.id
         environ.env.out_of_scope_emit('message', data, room=target_id, json=True, namespace='/ws', broadcast=True)
 
+    def user_is_connected_to_this_node(self, activity: Activity) -> bool:
+        namespace = activity.target.url or '/ws'
+        user_id = activity.object.id
+
+        # every connection joins the room with the same name as the user id when logging in
+        try:
+            return user_id in self.socketio.server.manager.rooms[namespace]
+        except KeyError:
+            return False
+
     def send_event_to_other_node(self, data: dict) -> None:
         logger.info('user is not on this node, will publish on queue for other nodes to try')
         self.update_recently_delegated_events(data['id'])
 
+        # broadcast this time, since the presence registry was wrong about where the user is
+        data.pop('directed', None)
+
         if 'revision' not in data:
             data['revision'] = 0
         else:
@@ -155,17 +168,10 @@ class QueueHandler(object):
     def handle_local_node_events(self, data: dict, activity: Activity):
         # do this first, since ban might occur even if user is not connected
         if activity.verb == 'ban':
-            user_is_on_node = True
-
-            # delegate so we don't end up re-reading this event before adding to ignore list
-            if not self.user_is_on_this_node(activity):
-                self.send_event_to_other_node(data)
-                user_is_on_node = False
-
             self.create_ban_even_if_not_on_this_node(activity)
 
-            # no need to continue if the user is not on this node; event already delegated
-            if not user_is_on_node:
+            # no need to continue if the user is not on this node
+            if not self.user_is_on_this_node(activity):
                 return
 
             try:
@@ -175,6 +181,11 @@ class QueueHandler(object):
                 logger.exception(traceback.format_exc())
 
         elif activity.verb == 'kick':
+            # events sent straight to this node are not seen by the other nodes, so if the user has moved on since
+            # the lookup, let the other nodes try; broadcast events have already reached all nodes
+            if data.get('directed', False) and not self.user_is_connected_to_this_node(activity):
+                self.send_event_to_other_node(data)
+
             try:
                 self.handle_kick(activity)
             except Exception as e:
@@ -202,12 +213,11 @@ class QueueHandler(object):
         if activity.id in self.recently_handled_events_set:
             logger.info('ignoring event with id %s since we already handled it on this node' % activity.id)
             return
-        if 'revision' in data:
-            if data['revision'] > 3:
-                logger.warning('dropping event {} ({}) since it has revision {}; being sent around too much'.format(
-                    activity.verb, activity.id, data['revision']
-                ))
-                logger.warning('event was : {}'.format(str(data)))
+        if 'revision' in data and data['revision'] > 3:
+            logger.warning('dropping event {} ({}) since it has revision {}; being sent around too much'.format(
+                activity.verb, activity.id, data['revision']
+            ))
+            logger.warning('event was : {}'.format(str(data)))
             return
 
         logger.debug('got internally published event with verb %s id %s' % (activity.verb, activity.id))
@@ -295,13 +305,15 @@ class QueueHandler(object):
 
     def ban_globally(self, data: dict, act: Activity, rooms: dict, user_id: str, user_sids: list, namespace: str) -> None:
         try:
+            before = time.time()
             message_ids = self.env.storage.get_undeleted_message_ids_for_user(user_id)
-            for message_id in message_ids:
-                self.env.storage.delete_message(message_id)
+            logger.info('about to delete %s messages for user %s (fetching IDs took %.2fs)' % (len(message_ids), user_id, time.time()-before))
         except Exception as e:
-            logger.error('could not delete messages for user %s: %s' % (user_id, str(e)))
-            logger.exception(traceback.format_exc(e))
+            logger.error('could not get undeleted messages for user %s: %s' % (user_id, str(e)))
+            logger.exception(traceback.format_exc())
             self.env.capture_exception(sys.exc_info())
+        else:
+            self.delete_messages(user_id, message_ids)
 
         try:
             if len(rooms) == 0:
@@ -326,36 +338,26 @@ class QueueHandler(object):
             logger.exception(traceback.format_exc())
             self.env.capture_exception(sys.exc_info())
             return
-        self.delete_messages(user_id, messages)
+        self.delete_messages(user_id, messages, room_id=room_id)
 
-    def delete_messages(self, user_id: str, messages: list) -> None:
+    def delete_messages(self, user_id: str, messages: list, room_id: str=None) -> None:
         if messages is None or len(messages) == 0:
             return
 
         before = time.time()
         successes, failures = self.try_to_delete_messages(messages)
+        utils.remove_recent_history(room_id)
         elapsed = time.time() - before
         logger.info('finished deleting %s messages (%s/%s successes) for user %s (deletion took %.2fs)' %
                     (len(messages), successes, len(messages), user_id, elapsed))
 
     def try_to_delete_messages(self, messages) -> (int, int):
         try:
-            failures = 0
-            successes = 0
-
-            for message_id in messages:
-                try:
-                    self.env.storage.delete_message(message_id)
-                    successes += 1
-                except Exception as e:
-                    logger.error('could not delete message with id %s because: %s' % (message_id, str(e)))
-                    logger.exception(traceback.format_exc())
-                    self.env.capture_exception(sys.exc_info())
-                    failures += 1
-            return successes, failures
-        except Exception as e2:
-            logger.error('could not delete messages: %s' % str(e2))
+            return self.env.storage.delete_messages(messages)
+        except Exception as e:
+            logger.error('could not delete messages: %s' % str(e))
             logger.exception(traceback.format_exc())
+            self.env.capture_exception(sys.exc_info())
 
         return 0, len(messages)
 
@@ -10,6 +10,7 @@ from typing import Union
 from uuid import uuid4 as uuid
 
 from activitystreams.models.activity import Activity
+from eventlet.semaphore import Semaphore
 from flask_socketio import disconnect
 from kombu.mixins import ConsumerMixin
 
@@ -25,18 +26,34 @@ from dino.forms import LoginForm
 from dino.server import app, socketio
 from dino.utils.handlers import GracefulInterruptHandler
 from dino.endpoint.queue import QueueHandler
+from dino.endpoint import codec
+from dino.endpoint.dispatcher import PartitionedDispatcher
+from dino.endpoint.dispatcher import DEFAULT_CONCURRENCY
 
 logger = logging.getLogger(__name__)
 queue_handler = QueueHandler(socketio, environ.env)
 
+DEFAULT_PREFETCH_COUNT = 100
+
 
 class Worker(ConsumerMixin):
-    def __init__(self, connection, signal_handler: GracefulInterruptHandler):
+    def __init__(
+            self, connection, signal_handler: GracefulInterruptHandler, dispatcher: PartitionedDispatcher,
+            prefetch_count: int=DEFAULT_PREFETCH_COUNT
+    ):
         self.connection = connection
         self.signal_handler = signal_handler
+        self.dispatcher = dispatcher
+        self.prefetch_count = prefetch_count
+        self.ack_lock = Semaphore(value=1)
 
     def get_consumers(self, consumer, channel):
-        return [consumer(queues=[environ.env.internal_publisher.queue], callbacks=[self.process_task])]
+        task_consumer = consumer(queues=[environ.env.internal_publisher.queue], callbacks=[self.process_task])
+
+        # limits how many unacked messages the broker hands out, i.e. how many are queued in the dispatcher
+        if self.prefetch_count is not None and self.prefetch_count > 0:
+            task_consumer.qos(prefetch_count=self.prefetch_count)
+        return [task_consumer]
 
     def on_iteration(self):
         if self.signal_handler.interrupted:
@@ -44,17 +61,55 @@ class Worker(ConsumerMixin):
 
     def process_task(self, body, message):
         try:
-            queue_handler.handle_server_activity(body, as_parser.parse(body))
+            # kombu has usually decoded the body already using the content type; if not, decode it the same way as
+            # events from kafka
+            body = codec.decode(body)
+            activity = as_parser.parse(body)
         except Exception as e:
             logger.error('could not parse server message: "%s", message was: %s' % (str(e), body))
             environ.env.capture_exception(sys.exc_info())
-        message.ack()
+            message.ack()
+            return
+
+        self.dispatcher.dispatch(
+            partition_key(activity), activity.verb or 'unknown', self.handle_task, body, activity, message)
+
+    def handle_task(self, body: dict, activity: Activity, message) -> None:
+        try:
+            queue_handler.handle_server_activity(body, activity)
+        finally:
+            # acked after handling, so messages not handled yet are redelivered if the node goes away; only one
+            # green thread writes on the channel at a time
+            with self.ack_lock:
+                try:
+                    message.ack()
+                except Exception as e:
+                    logger.warning('could not ack message %s (connection was reset?): %s' % (activity.id, str(e)))
+
+
+def partition_key(activity: Activity) -> str:
+    """
+    events for the same user (bans/kicks) or the same room are handled in the order they were received
+    """
+    if activity.verb in {'ban', 'kick'} and activity.object is not None and activity.object.id is not None:
+        return activity.object.id
+    if activity.target is not None and activity.target.id is not None:
+        return activity.target.id
+    return activity.id or ''
 
 
 def consume():
     if len(environ.env.config) == 0 or environ.env.config.get(ConfigKeys.TESTING, False):
         return
 
+    dispatcher = PartitionedDispatcher(environ.env, concurrency=int(environ.env.config.get(
+        ConfigKeys.CONSUMER_CONCURRENCY, domain=ConfigKeys.QUEUE, default=DEFAULT_CONCURRENCY)))
+    prefetch_count = int(environ.env.config.get(
+        ConfigKeys.PREFETCH_COUNT, domain=ConfigKeys.QUEUE, default=DEFAULT_PREFETCH_COUNT))
+
+    # other nodes might use another codec than this one, e.g. during a rolling upgrade
+    codec.load_codecs()
+
     with GracefulInterruptHandler() as interrupt_handler:
         while True:
             with environ.env.internal_publisher.queue_connection as conn:
@@ -62,7 +117,8 @@ def consume():
                     logger.info('setting up consumer "{}"'.format(
                         str(environ.env.internal_publisher.queue_connection)))
 
-                    environ.env.consume_worker = Worker(conn, interrupt_handler)
+                    environ.env.consume_worker = Worker(
+                        conn, interrupt_handler, dispatcher, prefetch_count=prefetch_count)
                     environ.env.consume_worker.run()
                 except KeyboardInterrupt:
                     return
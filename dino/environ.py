@@ -192,6 +192,7 @@ class GNEnvironment(object):
         if skip_init:
             return
         self.storage = None
+        self.storage_writer = None
         self.cache = None
         self.stats = None
         self.observer = None
@@ -642,12 +643,48 @@ def init_storage_engine(gn_env: GNEnvironment) -> None:
         strategy = storage_engine.get(ConfigKeys.STRATEGY, None)
         replication = storage_engine.get(ConfigKeys.REPLICATION, None)
         key_space = gn_env.config.get(ConfigKeys.ENVIRONMENT, 'dino')
-        gn_env.storage = CassandraStorage(storage_hosts, replications=replication, strategy=strategy, key_space=key_space)
+        bucketed_history = storage_engine.get(ConfigKeys.BUCKETED_HISTORY, False)
+        history_max_days = storage_engine.get(ConfigKeys.HISTORY_MAX_DAYS, None)
+        ack_batch_wait = storage_engine.get(ConfigKeys.ACK_BATCH_WAIT, None)
+        gn_env.storage = CassandraStorage(
+            storage_hosts, replications=replication, strategy=strategy, key_space=key_space,
+            bucketed_history=bucketed_history, history_max_days=history_max_days, ack_batch_wait=ack_batch_wait,
+            local_dc=storage_engine.get(ConfigKeys.LOCAL_DC, None),
+            compression=storage_engine.get(ConfigKeys.COMPRESSION, None),
+            executor_threads=storage_engine.get(ConfigKeys.EXECUTOR_THREADS, None),
+            request_timeout=storage_engine.get(ConfigKeys.REQUEST_TIMEOUT, None),
+            read_consistency=storage_engine.get(ConfigKeys.READ_CONSISTENCY, None),
+            write_consistency=storage_engine.get(ConfigKeys.WRITE_CONSISTENCY, None),
+            speculative_delay=storage_engine.get(ConfigKeys.SPECULATIVE_DELAY, None),
+            speculative_attempts=storage_engine.get(ConfigKeys.SPECULATIVE_ATTEMPTS, None))
         gn_env.storage.init()
     else:
         raise RuntimeError('unknown storage engine type "%s"' % storage_type)
 
 
+@timeit(logger, 'init storage writer')
+def init_storage_writer(gn_env: GNEnvironment) -> None:
+    if len(gn_env.config) == 0 or gn_env.config.get(ConfigKeys.TESTING, False):
+        # assume we're testing
+        return
+
+    if not gn_env.config.get(ConfigKeys.WRITE_BEHIND, domain=ConfigKeys.STORAGE, default=False):
+        return
+
+    from dino.storage.writer import StorageWriter
+    from dino.storage.writer import DEFAULT_QUEUE_SIZE
+    from dino.storage.writer import DEFAULT_BATCH_SIZE
+
+    gn_env.storage_writer = StorageWriter(
+        gn_env,
+        queue_size=int(gn_env.config.get(
+            ConfigKeys.WRITE_BEHIND_QUEUE_SIZE, domain=ConfigKeys.STORAGE, default=DEFAULT_QUEUE_SIZE)),
+        batch_size=int(gn_env.config.get(
+            ConfigKeys.WRITE_BEHIND_BATCH_SIZE, domain=ConfigKeys.STORAGE, default=DEFAULT_BATCH_SIZE)),
+        spool_path=gn_env.config.get(ConfigKeys.SPOOL_PATH, domain=ConfigKeys.STORAGE, default=None)
+    )
+
+
 @timeit(logger, 'init db service')
 def init_database(gn_env: GNEnvironment):
     if len(gn_env.config) == 0 or gn_env.config.get(ConfigKeys.TESTING, False):
@@ -1077,6 +1114,7 @@ def initialize_env(dino_env):
         init_admin_and_admin_room(dino_env)
         init_acl_validators(dino_env)
         init_storage_engine(dino_env)
+        init_storage_writer(dino_env)
         init_spam_service(dino_env)
         init_service_config(dino_env)
 
@@ -14,5 +14,8 @@ class IHeartbeatManager(ABC):
     def add_heartbeat(self, user_id: str) -> None:
         raise NotImplementedError()
 
+    def add_heartbeats(self, user_ids: list) -> None:
+        raise NotImplementedError()
+
     def get_all_expired_user_ids(self):
         raise NotImplementedError()
@@ -1,3 +1,4 @@
+import math
 import time
 import traceback
 
@@ -8,8 +9,6 @@ import sys
 from activitystreams import parse as parse_to_as
 
 from eventlet.semaphore import Semaphore
-from datetime import datetime as dt
-from datetime import timedelta
 
 from dino.config import ConfigKeys
 from dino.endpoint.base import locked_method
@@ -20,16 +19,33 @@ logger = logging.getLogger(__name__)
 
 
 class HeartbeatManager(IHeartbeatManager):
+    """
+    keeps track of when heartbeats expire using a hashed timing wheel; each slot is one tick (the check interval)
+    and the wheel spans the whole timeout, so a tick only has to look at the users expiring in that slot instead of
+    scanning every user with a heartbeat
+    """
+
     def __init__(self, env: GNEnvironment):
         self._lock = Semaphore(value=1)
         self.env = env
-        self.to_check = dict()
         self.heartbeat_sids = set()
 
         self.expire_second = env.config.get(ConfigKeys.TIMEOUT, domain=ConfigKeys.HEARTBEAT, default=300)
         self.sleep_time = env.config.get(ConfigKeys.INTERVAL, domain=ConfigKeys.HEARTBEAT, default=20)
 
-        eventlet.spawn_after(func=self.loop, seconds=10)
+        self.expire_ticks = int(math.ceil(float(self.expire_second) / float(self.sleep_time)))
+        self.n_slots = self.expire_ticks + 1
+
+        # user_id -> the tick the heartbeat expires on; the user is also in the wheel slot for that tick
+        self.to_check = dict()
+        self.wheel = [set() for _ in range(self.n_slots)]
+        self.current_tick = self._now_tick()
+
+        if not env.config.get(ConfigKeys.TESTING, False):
+            eventlet.spawn_after(func=self.loop, seconds=10)
+
+    def _now_tick(self) -> int:
+        return int(time.monotonic() / float(self.sleep_time))
 
     def loop(self):
         while True:
@@ -47,11 +63,14 @@ class HeartbeatManager(IHeartbeatManager):
                 time.sleep(1)
 
     def check_heartbeats(self, user_ids: list) -> None:
-        for user_id in user_ids:
-            still_online = self.env.cache.check_heartbeat(user_id)
+        if len(user_ids) == 0:
+            return
 
-            if still_online:
-                self.add_heartbeat(user_id)
+        still_online = self.env.cache.check_heartbeats(user_ids) or set()
+        self.add_heartbeats([user_id for user_id in user_ids if user_id in still_online])
+
+        for user_id in user_ids:
+            if user_id in still_online:
                 continue
 
             hb_sid = 'hb-{}'.format(user_id)
@@ -73,23 +92,45 @@ class HeartbeatManager(IHeartbeatManager):
 
     @locked_method
     def has_heartbeat(self, user_id: str) -> bool:
-        return user_id in self.to_check.keys()
+        return user_id in self.to_check
 
     @locked_method
     def add_heartbeat(self, user_id: str) -> None:
-        self.to_check[user_id] = dt.utcnow()
+        self._add_heartbeat(user_id, self._now_tick() + self.expire_ticks)
+
+    @locked_method
+    def add_heartbeats(self, user_ids: list) -> None:
+        expires_on = self._now_tick() + self.expire_ticks
+        for user_id in user_ids:
+            self._add_heartbeat(user_id, expires_on)
+
+    def _add_heartbeat(self, user_id: str, expires_on: int) -> None:
+        previous = self.to_check.get(user_id)
+        if previous is not None:
+            self.wheel[previous % self.n_slots].discard(user_id)
+
+        self.to_check[user_id] = expires_on
+        self.wheel[expires_on % self.n_slots].add(user_id)
 
     @locked_method
     def get_all_expired_user_ids(self):
         expired = list()
-        not_yet_expired = dict()
-        now_time = dt.utcnow() - timedelta(seconds=self.expire_second)
+        now_tick = self._now_tick()
+
+        # if the loop fell more than a full turn behind, every slot only has to be visited once
+        first_tick = max(self.current_tick + 1, now_tick - self.n_slots + 1)
+
+        for tick in range(first_tick, now_tick + 1):
+            slot = self.wheel[tick % self.n_slots]
+            if len(slot) == 0:
+                continue
 
-        for user_id, add_time in self.to_check.items():
-            if add_time < now_time:
-                expired.append(user_id)
-            else:
-                not_yet_expired[user_id] = add_time
+            # when lagging behind, heartbeats added since the last tick might be due a full turn later
+            due = [user_id for user_id in slot if self.to_check[user_id] <= now_tick]
+            for user_id in due:
+                slot.discard(user_id)
+                del self.to_check[user_id]
+            expired.extend(due)
 
-        self.to_check = not_yet_expired.copy()
-        return expired.copy()
+        self.current_tick = max(self.current_tick, now_tick)
+        return expired
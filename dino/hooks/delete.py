@@ -12,6 +12,7 @@
 from activitystreams import Activity
 
 from dino import environ
+from dino import utils
 
 __author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
 
@@ -28,9 +29,12 @@ class OnDeleteHooks(object):
             room_id = activity.object.id
             environ.env.storage.delete_messages_in_room(room_id, clear_body=False)
         else:
+            room_id = activity.target.id
             message_id = activity.object.id
             environ.env.storage.delete_message(message_id, clear_body=False)
 
+        utils.remove_recent_history(room_id)
+
     @staticmethod
     def broadcast_deletion(arg: tuple) -> None:
         data, activity = arg
@@ -58,6 +58,7 @@ class OnDisconnectHooks(object):
                     return
                 environ.env.leave_room(current_sid)
                 environ.env.db.remove_sid_for_user(user_id, current_sid)
+                utils.remove_node_for_sid(current_sid)
 
                 all_sids = utils.get_sids_for_user_id(user_id)
                 if all_sids is None:
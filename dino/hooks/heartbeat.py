@@ -65,6 +65,59 @@ class OnHeartbeatHooks(object):
             environ.env.cache.set_user_invisible(user_id)
 
 
+class OnHeartbeatsHooks(object):
+    """
+    same as OnHeartbeatHooks but for a whole batch of heartbeats at once; the argument is a tuple of a dict of
+    {user_id: user_name} for all users in the batch, and a list of the user ids that didn't have a heartbeat before
+    """
+
+    @staticmethod
+    def update_sessions(arg: tuple) -> None:
+        user_names, new_user_ids = arg
+
+        # the session only changes on the first heartbeat, the sid is always the same
+        for user_id in new_user_ids:
+            try:
+                utils.create_or_update_user(user_id, user_names[user_id])
+                utils.add_sid_for_user_id(user_id, 'hb-{}'.format(user_id))
+            except Exception as e:
+                logger.error('could not update session for heartbeat user {}: {}'.format(user_id, str(e)))
+                logger.exception(traceback.format_exc())
+                environ.env.capture_exception(sys.exc_info())
+
+    @staticmethod
+    def publish_activities(arg: tuple) -> None:
+        user_names, new_user_ids = arg
+
+        # only publish 'login' activity on the first heartbeat; the heartbeats have already been added when this is
+        # called, so new_user_ids is what tells if it's the first one
+        for user_id in new_user_ids:
+            activity_json = utils.activity_for_login(
+                user_id, user_names[user_id], encode_attachments=False, heartbeat_sid=True)
+            environ.env.publish(activity_json, external=True)
+
+    @staticmethod
+    def set_users_online_if_not_previously_invisible(arg: tuple) -> None:
+        user_names, new_user_ids = arg
+        user_ids = list(user_names.keys())
+
+        user_statuses = utils.get_user_statuses(user_ids)
+        environ.env.cache.check_heartbeats(user_ids)
+
+        for user_id in new_user_ids:
+            if utils.is_super_user(user_id) or utils.is_global_moderator(user_id):
+                logger.info('op {} ({}) signed in; user status is currently set to {}'.format(
+                    user_id, user_names[user_id], user_statuses.get(user_id)))
+
+        online = [user_id for user_id in user_ids if user_statuses.get(user_id) != UserKeys.STATUS_INVISIBLE]
+        invisible = [user_id for user_id in user_ids if user_statuses.get(user_id) == UserKeys.STATUS_INVISIBLE]
+
+        if len(online) > 0:
+            environ.env.db.set_users_online(online)
+        if len(invisible) > 0:
+            environ.env.cache.set_users_invisible(invisible)
+
+
 @environ.env.observer.on('on_heartbeat')
 def _on_heartbeat_publish_activity(arg: tuple) -> None:
     OnHeartbeatHooks.update_session(arg)
@@ -73,3 +126,10 @@ def _on_heartbeat_publish_activity(arg: tuple) -> None:
     OnHeartbeatHooks.publish_activity(arg)
 
     OnHeartbeatHooks.set_user_online_if_not_previously_invisible(arg)
+
+
+@environ.env.observer.on('on_heartbeats')
+def _on_heartbeats_publish_activity(arg: tuple) -> None:
+    OnHeartbeatsHooks.update_sessions(arg)
+    OnHeartbeatsHooks.publish_activities(arg)
+    OnHeartbeatsHooks.set_users_online_if_not_previously_invisible(arg)
@@ -52,6 +52,7 @@ class OnLoginHooks(object):
         sid = environ.env.request.sid
         utils.create_or_update_user(user_id, user_name)
         utils.add_sid_for_user_id(user_id, sid)
+        utils.set_node_for_sid(sid)
 
         environ.env.join_room(user_id)
         environ.env.join_room(environ.env.request.sid)
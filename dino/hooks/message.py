@@ -9,8 +9,6 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-from typing import Union
-
 from dino import environ
 from dino import utils
 from dino.config import ConfigKeys
@@ -60,9 +58,14 @@ class OnMessageHooks(object):
                 send(data, _room=room_id)
 
         @timeit(logger, 'on_message_hooks_store')
-        def store(deleted=False) -> Union[str, None]:
+        def store(deleted=False) -> None:
+            if environ.env.storage_writer is not None:
+                # written behind, so the broadcast doesn't have to wait for the storage
+                environ.env.storage_writer.store(data, activity, deleted=deleted)
+                return
+
             try:
-                message_id = environ.env.storage.store_message(activity, deleted=deleted)
+                environ.env.storage.store_message(activity, deleted=deleted)
             except Exception as e:
                 logger.error('could not store message %s because: %s' % (activity.id, str(e)))
                 logger.error(str(data))
@@ -70,21 +73,9 @@ class OnMessageHooks(object):
                 environ.env.capture_exception(sys.exc_info())
                 return
 
-            if not environ.env.config.get(ConfigKeys.DELIVERY_GUARANTEE, False) or \
-                    activity.target.object_type != 'private':
-                return
-
-            owners = environ.env.db.get_owners_room(activity.target.id)
-            environ.env.storage.mark_as_read({activity.id}, activity.actor.id, activity.target.id)
-            if owners is None or len(owners) == 0:
-                return
-
-            for receiver_id in owners:
-                if activity.actor.id == receiver_id:
-                    continue
-                environ.env.storage.mark_as_unacked(activity.id, receiver_id, activity.target.id)
-
-            return message_id
+            utils.mark_as_unacked_for_owners(activity)
+            if not deleted:
+                utils.add_to_recent_history(activity)
 
         def check_spam():
             def remove_emojis(text):
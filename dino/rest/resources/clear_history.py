@@ -56,17 +56,7 @@ class ClearHistoryResource(BaseResource):
         logger.info('about to delete %s messages for user %s (fetching IDs took %.2fs)' % (len(messages), user_id, time.time()-before))
 
         before = time.time()
-        failures = 0
-        successes = 0
-
-        for message_id in messages:
-            try:
-                self.storage_manager.delete_message(message_id)
-                successes += 1
-            except Exception as e:
-                logger.error('could not delete message with id %s because: %s' % (message_id, str(e)))
-                logger.exception(traceback.format_exc())
-                failures += 1
+        successes, failures = self.storage_manager.delete_messages(messages)
 
         logger.info('finished deleting %s message for user %s (deletion took %.2fs)' % (len(messages), user_id, time.time()-before))
 
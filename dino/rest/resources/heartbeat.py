@@ -1,5 +1,3 @@
-import activitystreams
-
 import logging
 import traceback
 import sys
@@ -9,7 +7,6 @@ from dino import utils
 from dino.utils.decorators import timeit
 from dino.db.manager import UserManager
 from dino.rest.resources.base import BaseResource
-from dino.exceptions import NoSuchUserException
 
 from flask import request
 from eventlet.greenpool import GreenPool
@@ -62,34 +59,21 @@ class HeartbeatResource(BaseResource):
         return json
 
     @timeit(logger, 'on_rest_auth')
-    def _do_post(self, json: dict):
+    def _do_post(self, json: list):
         logger.debug('POST request: %s' % str(json))
-        for user_id in json:
-            try:
-                self.heartbeat_user(user_id)
-            except Exception as e:
-                self.env.capture_exception(sys.exc_info())
-                logger.error('could not auth user %s: %s' % (user_id, str(e)))
-
-    def heartbeat_user(self, user_id: str):
-        try:
-            data = {
-                'actor': {
-                    'id': user_id,
-                    'displayName': utils.get_user_name_for(user_id)
-                },
-                'verb': 'heartbeat'
-            }
-
-            environ.env.heartbeat.add_heartbeat(user_id)
-            environ.env.observer.emit('on_heartbeat', (data, activitystreams.parse(data)))
-        except ValueError as e:
-            logger.error('invalid auth for user %s: %s' % (user_id, str(e)))
-            self.env.capture_exception(sys.exc_info())
-        except NoSuchUserException as e:
-            logger.error('no such user %s: %s' % (user_id, str(e)))
-            self.env.capture_exception(sys.exc_info())
-        except Exception as e:
-            logger.error('could not auth user %s: %s' % (user_id, str(e)))
-            logger.error(traceback.format_exc())
-            self.env.capture_exception(sys.exc_info())
+
+        user_ids = list({str(user_id) for user_id in json})
+        user_names = utils.get_user_names_for(user_ids)
+
+        for user_id in user_ids:
+            if user_id not in user_names:
+                logger.error('no such user %s' % user_id)
+
+        if len(user_names) == 0:
+            return
+
+        # has to be checked before adding the new heartbeats
+        new_user_ids = [user_id for user_id in user_names if not self.env.heartbeat.has_heartbeat(user_id)]
+
+        self.env.heartbeat.add_heartbeats(list(user_names.keys()))
+        self.env.observer.emit('on_heartbeats', (user_names, new_user_ids))
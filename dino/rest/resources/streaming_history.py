@@ -0,0 +1,139 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import logging
+import traceback
+from itertools import chain
+
+from flask import request
+from flask import Response
+from flask_restful import Resource
+
+from dino.admin.orm import storage_manager
+from dino.utils import b64e
+
+logger = logging.getLogger(__name__)
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+
+
+class BaseStreamingHistoryResource(Resource):
+    """
+    Streams history as newline delimited json instead of returning it as one json body, fetching it from the storage
+    one page at a time, so exporting a lot of history doesn't need more memory than exporting a little.
+
+    Each message is one line, and after each page there's a line with the cursor for the next page, e.g.
+    {"cursor": "AAoAC..."}; the cursor is null after the last page. If the export is interrupted it can be continued
+    by sending the last received cursor in the "cursor" field of the request. If fetching a page fails after the
+    response has started, the last line is {"error": "..."}.
+    """
+
+    def __init__(self):
+        self.request = request
+
+    def stream(self):
+        try:
+            the_json = self.validate_json()
+            logger.debug('request: %s' % str(the_json))
+
+            pages = self.pages(the_json, self.page_size(the_json))
+
+            # fetch the first page before starting the response, so invalid parameters or cursors get an error status
+            first_page = next(pages)
+        except Exception as e:
+            logger.error('could not stream history: %s' % str(e))
+            logger.exception(traceback.format_exc())
+            return {'status_code': 500, 'data': str(e)}
+
+        return Response(self.lines(chain([first_page], pages)), mimetype='application/x-ndjson')
+
+    def lines(self, pages):
+        try:
+            for messages, cursor in pages:
+                for message in messages:
+                    message['from_user_name'] = b64e(message['from_user_name'])
+                    message['body'] = b64e(message['body'])
+                    message['target_name'] = b64e(message['target_name'])
+                    message['channel_name'] = b64e(message['channel_name'])
+                    yield json.dumps(message) + '\n'
+
+                yield json.dumps({'cursor': cursor}) + '\n'
+        except Exception as e:
+            logger.error('could not stream history: %s' % str(e))
+            logger.exception(traceback.format_exc())
+            yield json.dumps({'error': str(e)}) + '\n'
+
+    def page_size(self, the_json: dict) -> int:
+        try:
+            page_size = int(the_json.get('page_size', DEFAULT_PAGE_SIZE))
+        except (TypeError, ValueError):
+            raise ValueError('invalid page_size "%s"' % the_json.get('page_size'))
+
+        if page_size < 1 or page_size > MAX_PAGE_SIZE:
+            raise ValueError('page_size needs to be in the interval [1, %s]' % MAX_PAGE_SIZE)
+        return page_size
+
+    def pages(self, the_json: dict, page_size: int):
+        raise NotImplementedError()
+
+    def validate_json(self):
+        try:
+            the_json = self.request.get_json(silent=True)
+        except Exception as e:
+            logger.error('error: %s' % str(e))
+            logger.exception(traceback.format_exc())
+            raise ValueError('invalid json')
+
+        if the_json is None:
+            logger.error('empty request body')
+            raise ValueError('empty request body')
+
+        return the_json
+
+
+class StreamingHistoryResource(BaseStreamingHistoryResource):
+    """
+    same parameters as HistoryResource, plus the optional "cursor" and "page_size"
+    """
+
+    def get(self):
+        return self.stream()
+
+    def pages(self, the_json: dict, page_size: int):
+        return storage_manager.stream_history(
+            the_json.get('room_id', ''),
+            the_json.get('user_id'),
+            the_json.get('from_time'),
+            the_json.get('to_time'),
+            page_size,
+            the_json.get('cursor'))
+
+
+class StreamingFullHistoryResource(BaseStreamingHistoryResource):
+    """
+    same parameters as FullHistoryResource, plus the optional "cursor" and "page_size"
+    """
+
+    def post(self):
+        return self.stream()
+
+    def pages(self, the_json: dict, page_size: int):
+        return storage_manager.stream_all_messages_from_user(
+            the_json.get('user_id'),
+            the_json.get('from_time'),
+            the_json.get('to_time'),
+            page_size,
+            the_json.get('cursor'))
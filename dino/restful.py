@@ -29,6 +29,8 @@ from dino.rest.resources.clear_history import ClearHistoryResource
 from dino.rest.resources.blacklist import BlacklistResource
 from dino.rest.resources.send import SendResource
 from dino.rest.resources.full_history import FullHistoryResource
+from dino.rest.resources.streaming_history import StreamingHistoryResource
+from dino.rest.resources.streaming_history import StreamingFullHistoryResource
 from dino.hooks import *
 
 import os
@@ -111,4 +113,6 @@ api.add_resource(BroadcastResource, '/broadcast')
 api.add_resource(SendResource, '/send')
 api.add_resource(SetStatusResource, '/status')
 api.add_resource(FullHistoryResource, '/full-history')
+api.add_resource(StreamingHistoryResource, '/history/stream')
+api.add_resource(StreamingFullHistoryResource, '/full-history/stream')
 api.add_resource(HeartbeatResource, '/heartbeat')
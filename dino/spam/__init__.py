@@ -0,0 +1,16 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# nothing in this package may import dino.environ (directly or through dino.utils), since the spam workers run it
+# in their own processes, and importing dino.environ would initialize a whole new environment in each of them
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
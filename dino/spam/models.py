@@ -0,0 +1,68 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import logging
+
+from scipy import sparse
+from sklearn.externals import joblib
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+logger = logging.getLogger(__name__)
+
+TRANSFORMERS = ['transformer_1a.pkl', 'transformer_1b.pkl', 'transformer_2.pkl']
+CLASSIFIERS = ['classifier_1.pkl', 'classifier_2.pkl', 'classifier_3.pkl']
+
+
+class SpamModels(object):
+    """
+    The transformers and classifiers used to predict spam, without any dependency on the environment so that they
+    can be used both in the server process and in the spam workers (dino.spam.worker).
+
+    Everything works on batches of messages; transforming and predicting a batch at once is much cheaper than
+    doing it one message at a time, since most of the time for a single message is overhead in sklearn/xgboost.
+    """
+
+    def __init__(self, root_path: str):
+        if root_path == '':
+            root_path = '.'
+
+        model_path = root_path + '/models/'
+
+        logger.info('loading TF-IDF and PCA transformers...')
+        self.tfidf_char = joblib.load(model_path + 'transformer_1a.pkl')
+        self.tfidf_word = joblib.load(model_path + 'transformer_1b.pkl')
+        self.pca = joblib.load(model_path + 'transformer_2.pkl')
+
+        logger.info('loading models...')
+        self.xgb = joblib.load(model_path + 'classifier_1.pkl')
+        self.rfc = joblib.load(model_path + 'classifier_2.pkl')
+        self.svc = joblib.load(model_path + 'classifier_3.pkl')
+
+        size = sum(os.path.getsize(model_path + name) for name in TRANSFORMERS + CLASSIFIERS)
+        logger.info('done loading, memory size: {} MB'.format('%.2f' % (size / 1024 / 1024)))
+
+    def transform(self, messages: list):
+        x = sparse.hstack((self.tfidf_char.transform(messages), self.tfidf_word.transform(messages))).A
+        return self.pca.transform(x)
+
+    def predict(self, x) -> list:
+        """
+        :param x: the transformed messages
+        :return: a list of (xgb, rfc, svc) predictions, one tuple for each message
+        """
+        return list(zip(
+            self.xgb.predict_proba(x)[:, 1],
+            self.rfc.predict_proba(x)[:, 1],
+            self.svc.predict(x)
+        ))
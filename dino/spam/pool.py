@@ -0,0 +1,181 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import os
+import sys
+import time
+
+import eventlet
+from eventlet.event import Event
+from eventlet.green import subprocess
+from eventlet.queue import Empty
+from eventlet.queue import LightQueue
+from eventlet.queue import Queue
+
+import dino
+from dino.spam.worker import read_frame
+from dino.spam.worker import write_frame
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_BATCH_WAIT = 0.01
+DEFAULT_TIMEOUT = 1.0
+
+
+class SpamWorker(object):
+    """
+    A spam worker process (dino.spam.worker) with the models loaded. The pipes are green, so waiting for a prediction
+    doesn't block the hub, and the transforming/predicting doesn't use the cpu of the server process.
+    """
+
+    def __init__(self, root_path: str):
+        self.root_path = root_path
+        self.process = None
+
+    def start(self) -> None:
+        # the worker only needs to be able to import the dino package, not the rest of the environment
+        python_path = os.path.dirname(os.path.dirname(os.path.abspath(dino.__file__)))
+        if 'PYTHONPATH' in os.environ:
+            python_path += os.pathsep + os.environ['PYTHONPATH']
+
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'dino.spam.worker', self.root_path],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            env=dict(os.environ, PYTHONPATH=python_path)
+        )
+        logger.info('started spam worker with pid {}'.format(self.process.pid))
+
+    def stop(self) -> None:
+        if self.process is None:
+            return
+
+        try:
+            self.process.kill()
+            self.process.wait()
+        except OSError:
+            pass
+        self.process = None
+
+    def predict(self, messages: list) -> list:
+        if self.process is None or self.process.poll() is not None:
+            self.start()
+
+        try:
+            write_frame(self.process.stdin, messages)
+            predictions, error = read_frame(self.process.stdout)
+        except (EOFError, OSError):
+            # restarted on the next batch
+            self.stop()
+            raise
+
+        if error is not None:
+            raise RuntimeError('spam worker could not predict: {}'.format(error))
+        return predictions
+
+
+class SpamBatcher(object):
+    """
+    Queues messages and predicts them in batches on the workers, either when batch_size messages have been queued,
+    or batch_wait seconds after the first message in the batch was queued, whichever comes first.
+
+    A batch is only formed when a worker is free to take it, so when all workers are busy the queue grows and the
+    next batches will be full, which is where batching gives the most throughput.
+    """
+
+    def __init__(
+            self, env, workers: list, batch_size: int=DEFAULT_BATCH_SIZE,
+            batch_wait: float=DEFAULT_BATCH_WAIT, timeout: float=DEFAULT_TIMEOUT
+    ):
+        self.env = env
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.timeout = timeout
+
+        self.queue = LightQueue()
+
+        # maxsize 0 makes it a channel, the batcher waits until a worker takes the batch
+        self.batches = Queue(0)
+
+        eventlet.spawn_n(self.batch_loop)
+        for worker in self.workers:
+            eventlet.spawn_n(self.worker_loop, worker)
+
+    def predict(self, message: str):
+        """
+        :return: the (xgb, rfc, svc) predictions for the message, or None if it couldn't be predicted in time
+        """
+        done = Event()
+        self.queue.put((message, done))
+
+        with eventlet.Timeout(self.timeout, False):
+            return done.wait()
+
+        logger.warning('spam prediction timed out after {}s, {} messages queued'.format(
+            self.timeout, self.queue.qsize()))
+        self.env.stats.incr('spam.timeout')
+        return None
+
+    def next_batch(self) -> list:
+        batch = [self.queue.get()]
+        deadline = time.time() + self.batch_wait
+
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except Empty:
+                break
+
+        return batch
+
+    def batch_loop(self) -> None:
+        while True:
+            try:
+                self.batches.put(self.next_batch())
+            except Exception as e:
+                logger.error('could not create spam batch: {}'.format(str(e)))
+                logger.exception(e)
+                self.env.capture_exception(sys.exc_info())
+
+    def worker_loop(self, worker) -> None:
+        while True:
+            batch = self.batches.get()
+            self.predict_batch(worker, batch)
+
+    def predict_batch(self, worker, batch: list) -> None:
+        before = time.time()
+
+        try:
+            predictions = worker.predict([message for message, _ in batch])
+        except Exception as e:
+            logger.error('could not predict spam batch of size {}: {}'.format(len(batch), str(e)))
+            logger.exception(e)
+            self.env.capture_exception(sys.exc_info())
+
+            for _, done in batch:
+                done.send_exception(e)
+            return
+
+        self.env.stats.timing('spam.batch', (time.time() - before) * 1000)
+        self.env.stats.gauge('spam.batch.size', len(batch))
+
+        for (_, done), prediction in zip(batch, predictions):
+            done.send(prediction)
@@ -0,0 +1,80 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import os
+import pickle
+import struct
+import sys
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct('>I')
+
+
+def write_frame(f, obj) -> None:
+    data = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+    f.write(HEADER.pack(len(data)) + data)
+    f.flush()
+
+
+def read_frame(f):
+    """
+    :return: the unpickled object, or raises EOFError if the other side has closed the pipe
+    """
+    header = _read_exactly(f, HEADER.size)
+    data = _read_exactly(f, HEADER.unpack(header)[0])
+    return pickle.loads(data)
+
+
+def _read_exactly(f, size: int) -> bytes:
+    data = b''
+    while len(data) < size:
+        chunk = f.read(size - len(data))
+        if not chunk:
+            raise EOFError('pipe closed after {} of {} bytes'.format(len(data), size))
+        data += chunk
+    return data
+
+
+def run(root_path: str) -> None:
+    """
+    Read batches of messages from stdin and write the predictions for each batch to stdout, until stdin is closed.
+    The server process starts one of these for each spam worker (dino.spam.pool.SpamWorker).
+    """
+    # the models (xgboost especially) print to stdout, which would corrupt the frames, so keep the real stdout for
+    # the frames and send everything else to stderr
+    frames_out = os.fdopen(os.dup(1), 'wb')
+    os.dup2(2, 1)
+    frames_in = sys.stdin.buffer
+
+    from dino.spam.models import SpamModels
+    models = SpamModels(root_path)
+
+    while True:
+        try:
+            messages = read_frame(frames_in)
+        except EOFError:
+            return
+
+        try:
+            write_frame(frames_out, (models.predict(models.transform(messages)), None))
+        except Exception as e:
+            logger.exception(e)
+            write_frame(frames_out, (None, '{}: {}'.format(type(e).__name__, str(e))))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    run(sys.argv[1] if len(sys.argv) > 1 else '.')
@@ -23,6 +23,15 @@ class IStorage(Interface):
         :return: nothing
         """
 
+    def store_messages(self, activities: list, deleted=False) -> None:
+        """
+        save many messages at once, e.g. when the messages are written behind by dino.storage.writer.StorageWriter
+
+        :param activities: the activities of the messages to store
+        :param deleted: if the messages should be stored as deleted
+        :return: nothing
+        """
+
     def get_message(self, message_id: str) -> dict:
         """
         get the message with the given ID
@@ -76,6 +85,28 @@ class IStorage(Interface):
         :return: a list of messages
         """
 
+    def get_history_page(
+            self, room_id: str, from_user_id: str, from_time: int, to_time: int, page_size: int,
+            cursor: str=None) -> (list, str):
+        """
+        get one page of the history in a time slice for a room and/or user, for exporting history without loading
+        all of it into memory
+
+        :param room_id: the room uuid, or None for messages sent by the user in any room
+        :param from_user_id: only messages sent by this user, or None for all messages in the room
+        :param from_time: only messages sent after this time stamp
+        :param to_time: only messages sent before this time stamp
+        :param page_size: max number of messages in the page
+        :param cursor: the cursor returned with the previous page, or None for the first page
+        :return: a tuple of the messages and the cursor for the next page (None if this was the last page)
+        """
+
+    def get_undeleted_messages_for_user_and_time_page(
+            self, user_id: str, from_time: int, to_time: int, page_size: int, cursor: str=None) -> (list, str):
+        """
+        get one page of the un-deleted messages sent by a user in a time slice, see get_history_page()
+        """
+
     def get_unread_history(self, room_id: str, time_stamp: int, limit: int = 100) -> list:
         """
         get unread history after a certain timestamp for a room
@@ -93,3 +124,12 @@ class IStorage(Interface):
         :param message_id: the uuid of the message to delete
         :return: nothing
         """
+
+    def delete_messages(self, message_ids: list, room_id: str=None) -> (int, int):
+        """
+        delete many messages at once, e.g. when banning a user; messages that fail to be deleted are retried
+
+        :param message_ids: the uuids of the messages to delete
+        :param room_id: the uuid of the room the messages were sent to, if the storage needs it
+        :return: a tuple of the number of deleted messages and the number of messages that could not be deleted
+        """
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import sys
+import time
+
+import eventlet
+from eventlet.semaphore import Semaphore
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WAIT = 0.05
+DEFAULT_MAX_PENDING = 2000
+
+
+class AckBatcher(object):
+    """
+    Collects ack status updates for a short while and writes them together, instead of reading and writing the acks
+    of every message separately as soon as they're updated.
+
+    Updates for the same user and message within the window are coalesced into one, keeping the highest status, e.g.
+    a message being marked as unacked when stored and then as received and read by the receiver shortly after is only
+    written once. Updates are written after at most 'wait' seconds, or as soon as 'max_pending' updates are waiting.
+
+    Only one batch is written at a time; writing reads the current acks to not downgrade them, so two batches written
+    at the same time could both read the same acks and the older update be written last.
+    """
+
+    def __init__(self, env, write_acks, wait: float=DEFAULT_WAIT, max_pending: int=DEFAULT_MAX_PENDING):
+        """
+        :param env: the environment, used for stats
+        :param write_acks: called with a dict of (receiver_id, message_id) => (status, target_id) to write
+        :param wait: max number of seconds to wait for more updates before writing
+        :param max_pending: write as soon as this many updates are waiting
+        """
+        self.env = env
+        self.write_acks = write_acks
+        self.wait = wait
+        self.max_pending = max_pending
+
+        # (receiver_id, message_id) => (status, target_id)
+        self.pending = dict()
+        self.scheduled = False
+        self.flushing = Semaphore()
+
+    def add(self, message_ids: set, receiver_id: str, target_id: str, status: int) -> None:
+        for message_id in message_ids:
+            key = (receiver_id, message_id)
+            current = self.pending.get(key)
+
+            if current is not None:
+                self.env.stats.incr('storage.acks.coalesced')
+                # don't downgrade status
+                if current[0] >= status:
+                    continue
+
+            self.pending[key] = (status, target_id)
+
+        if len(self.pending) >= self.max_pending:
+            eventlet.spawn_n(self.flush)
+        elif not self.scheduled:
+            self.scheduled = True
+            eventlet.spawn_after(self.wait, self.flush)
+
+    def flush(self) -> None:
+        with self.flushing:
+            self._flush()
+
+    def _flush(self) -> None:
+        self.scheduled = False
+        if len(self.pending) == 0:
+            return
+
+        pending, self.pending = self.pending, dict()
+        before = time.time()
+
+        try:
+            self.write_acks(pending)
+        except Exception as e:
+            logger.error('could not write %s acks: %s' % (len(pending), str(e)))
+            logger.exception(e)
+            self.env.stats.incr('storage.acks.failed')
+            self.env.capture_exception(sys.exc_info())
+            return
+
+        self.env.stats.timing('storage.acks.flush', (time.time() - before) * 1000)
+        self.env.stats.gauge('storage.acks.batch.size', len(pending))
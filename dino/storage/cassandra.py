@@ -12,12 +12,17 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import binascii
 import logging
+import time
+from base64 import urlsafe_b64decode
+from base64 import urlsafe_b64encode
 
 from zope.interface import implementer
 from activitystreams.models.activity import Activity
 
 from dino.storage import IStorage
+from dino.storage.acks import AckBatcher
 from dino.config import ConfigKeys
 from dino.config import AckStatus
 from dino.utils import b64d
@@ -28,13 +33,27 @@ __author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
 
 logger = logging.getLogger(__name__)
 
+# the ids are deleted in rounds of this size, so progress can be logged when deleting many thousands of messages
+DELETE_ROUND_SIZE = 2000
+
+# how many times to retry deleting the messages that failed, and how long to wait before the first retry (doubled
+# for every following retry)
+DELETE_RETRIES = 3
+DELETE_RETRY_WAIT = 0.5
+
 
 @implementer(IStorage)
 class CassandraStorage(object):
     driver = None
     session = None
 
-    def __init__(self, hosts: list, replications=None, strategy=None, key_space='dino'):
+    def __init__(
+            self, hosts: list, replications=None, strategy=None, key_space='dino',
+            bucketed_history: bool=False, history_max_days: int=None, ack_batch_wait: float=None,
+            local_dc: str=None, compression=None, executor_threads: int=None, request_timeout: float=None,
+            read_consistency: str=None, write_consistency: str=None, speculative_delay: float=None,
+            speculative_attempts: int=None
+    ):
         if replications is None:
             replications = 2
         if strategy is None:
@@ -44,32 +63,110 @@ class CassandraStorage(object):
         self.key_space = key_space
         self.strategy = strategy
         self.replications = replications
+        self.bucketed_history = bucketed_history
+        self.history_max_days = history_max_days
+        self.delete_retry_wait = DELETE_RETRY_WAIT
+        self.ack_batch_wait = ack_batch_wait
+        self.acks = None
+        self.local_dc = local_dc
+        self.compression = compression
+        self.executor_threads = executor_threads
+        self.request_timeout = request_timeout
+        self.read_consistency = read_consistency
+        self.write_consistency = write_consistency
+        self.speculative_delay = speculative_delay
+        self.speculative_attempts = speculative_attempts
         self.validate(hosts, replications, strategy)
 
     def init(self):
-        from cassandra.cluster import Cluster
         from dino.storage.cassandra_driver import Driver
-        cluster = Cluster(self.hosts)
-        self.driver = Driver(cluster.connect(), self.key_space, self.strategy, self.replications)
+        from dino.storage.cassandra_driver import DEFAULT_HISTORY_MAX_DAYS
+
+        history_max_days = self.history_max_days
+        if history_max_days is None:
+            history_max_days = DEFAULT_HISTORY_MAX_DAYS
+
+        cluster = self._create_cluster()
+        self.driver = Driver(
+            cluster.connect(), self.key_space, self.strategy, self.replications,
+            bucketed_history=self.bucketed_history, history_max_days=int(history_max_days),
+            read_consistency=self._consistency(self.read_consistency),
+            write_consistency=self._consistency(self.write_consistency))
         self.driver.init()
 
+        if self.ack_batch_wait is not None and float(self.ack_batch_wait) > 0:
+            self.acks = AckBatcher(environ.env, self._write_acks, wait=float(self.ack_batch_wait))
+
+    def _create_cluster(self):
+        from cassandra.cluster import Cluster
+        from cassandra.cluster import ExecutionProfile
+        from cassandra.cluster import EXEC_PROFILE_DEFAULT
+        from cassandra.connection import locally_supported_compressions
+        from cassandra.policies import ConstantSpeculativeExecutionPolicy
+        from cassandra.policies import DCAwareRoundRobinPolicy
+        from cassandra.policies import TokenAwarePolicy
+
+        # send each statement straight to a replica of its partition, and only to nodes in the local dc (if not
+        # set, the driver uses the dc of the first contact point)
+        profile = ExecutionProfile(
+            load_balancing_policy=TokenAwarePolicy(DCAwareRoundRobinPolicy(local_dc=self.local_dc)))
+
+        if self.request_timeout is not None:
+            profile.request_timeout = float(self.request_timeout)
+
+        # only applies to statements marked as idempotent, see cassandra_driver.IDEMPOTENT_WRITES
+        if self.speculative_delay is not None and float(self.speculative_delay) > 0:
+            profile.speculative_execution_policy = ConstantSpeculativeExecutionPolicy(
+                delay=float(self.speculative_delay), max_attempts=int(self.speculative_attempts or 1))
+
+        cluster_args = {'execution_profiles': {EXEC_PROFILE_DEFAULT: profile}}
+
+        compression = self.compression
+        if compression is not None:
+            if isinstance(compression, str) and compression not in locally_supported_compressions:
+                # e.g. the lz4 package not installed; any other supported compression is better than failing
+                logger.warning('compression "%s" is not supported locally (supported: %s), using default' % (
+                    compression, ','.join(locally_supported_compressions.keys()) or 'none'))
+                compression = True
+            cluster_args['compression'] = compression
+
+        if self.executor_threads is not None:
+            cluster_args['executor_threads'] = int(self.executor_threads)
+
+        return Cluster(self.hosts, **cluster_args)
+
+    def _consistency(self, name: str):
+        from cassandra import ConsistencyLevel
+
+        if name is None:
+            return None
+        if name.upper() not in ConsistencyLevel.name_to_value:
+            raise ValueError('unknown consistency level "%s", valid levels are: %s' % (
+                name, ', '.join(ConsistencyLevel.name_to_value.keys())))
+        return ConsistencyLevel.name_to_value[name.upper()]
+
     @timeit(logger, 'on_message_hooks_store')
     def store_message(self, activity: Activity, deleted=False) -> None:
-        message = b64d(activity.object.content)
-        actor_name = b64d(activity.actor.display_name)
-        self.driver.msg_insert(
-                msg_id=activity.id,
-                from_user_id=activity.actor.id,
-                from_user_name=actor_name,
-                target_id=activity.target.id,
-                target_name=activity.target.display_name,
-                body=message,
-                domain=activity.target.object_type,
-                sent_time=activity.published,
-                channel_id=activity.object.url,
-                channel_name=activity.object.display_name,
-                deleted=deleted
-        )
+        self.driver.msg_insert(**self._insert_args(activity, deleted))
+
+    @timeit(logger, 'on_cassandra_store_messages')
+    def store_messages(self, activities: list, deleted=False) -> None:
+        self.driver.msgs_insert([self._insert_args(activity, deleted) for activity in activities])
+
+    def _insert_args(self, activity: Activity, deleted: bool) -> dict:
+        return {
+            'msg_id': activity.id,
+            'from_user_id': activity.actor.id,
+            'from_user_name': b64d(activity.actor.display_name),
+            'target_id': activity.target.id,
+            'target_name': activity.target.display_name,
+            'body': b64d(activity.object.content),
+            'domain': activity.target.object_type,
+            'sent_time': activity.published,
+            'channel_id': activity.object.url,
+            'channel_name': activity.object.display_name,
+            'deleted': deleted
+        }
 
     def get_statuses(self, message_ids: set, receiver_id: str) -> dict:
         rows = self.driver.get_acks_for(message_ids, receiver_id)
@@ -78,29 +175,36 @@ class CassandraStorage(object):
         return {row.message_id: int(row.status) for row in rows}
 
     def _mark_as_status(self, message_ids: set, receiver_id: str, target_id: str, status: int):
-        rows = self.driver.get_acks_for(message_ids, receiver_id)
+        if self.acks is not None:
+            # coalesced with other updates and written shortly
+            self.acks.add(message_ids, receiver_id, target_id, status)
+            return
 
-        if rows is None or len(rows.current_rows) == 0:
-            current_acks = dict()
-        else:
-            current_acks = {row.message_id: int(row.status) for row in rows}
+        self._write_acks({(receiver_id, message_id): (status, target_id) for message_id in message_ids})
 
-        to_update = list()
-        to_add = list()
+    def _write_acks(self, acks: dict) -> None:
+        """
+        :param acks: a dict of (receiver_id, message_id) => (status, target_id)
+        """
+        message_ids_by_receiver = dict()
+        for receiver_id, message_id in acks.keys():
+            message_ids_by_receiver.setdefault(receiver_id, set()).add(message_id)
 
-        for message_id in message_ids:
-            if message_id not in current_acks:
-                to_add.append(message_id)
-                continue
-                # don't downgrade status
-            if current_acks.get(message_id) >= status:
+        current_acks = {
+            (row.for_user_id, row.message_id): int(row.status)
+            for row in self.driver.get_acks_for_many(message_ids_by_receiver)
+        }
+
+        to_write = list()
+        for (receiver_id, message_id), (status, target_id) in acks.items():
+            # don't downgrade status
+            current_status = current_acks.get((receiver_id, message_id))
+            if current_status is not None and current_status >= status:
                 continue
-            to_update.append(message_id)
+            to_write.append((receiver_id, message_id, status, target_id))
 
-        if len(to_update) > 0:
-            self.driver.update_acks_with_status(message_ids, receiver_id, status)
-        if len(to_add) > 0:
-            self.driver.add_acks_with_status(message_ids, receiver_id, target_id, status)
+        if len(to_write) > 0:
+            self.driver.set_acks_with_status(to_write)
 
     @timeit(logger, 'on_cassandra_mark_as_received')
     def mark_as_received(self, message_ids: set, receiver_id: str, target_id: str) -> None:
@@ -128,6 +232,13 @@ class CassandraStorage(object):
             return list()
         return [self._row_to_json(row) for row in rows]
 
+    @timeit(logger, 'on_cassandra_get_undeleted_messages_for_user_and_time_page')
+    def get_undeleted_messages_for_user_and_time_page(
+            self, user_id: str, from_time: int, to_time: int, page_size: int, cursor: str=None) -> (list, str):
+        rows = self.driver.msgs_select_non_deleted_for_user_and_time_page(
+            user_id, from_time, to_time, page_size, self._paging_state(cursor))
+        return [self._row_to_json(row) for row in rows.current_rows], self._cursor(rows.paging_state)
+
     @timeit(logger, 'on_cassandra_get_undeleted_message_ids_for_user')
     def get_undeleted_message_ids_for_user(self, user_id: str):
         rows = self.driver.msgs_select_non_deleted_for_user(user_id)
@@ -146,15 +257,38 @@ class CassandraStorage(object):
     def delete_message(self, message_id: str, room_id: str=None, clear_body: bool=True) -> None:
         self.driver.msg_delete(message_id, clear_body=clear_body)
 
+    @timeit(logger, 'on_cassandra_delete_messages')
+    def delete_messages(self, message_ids: list, room_id: str=None, clear_body: bool=True) -> (int, int):
+        message_ids = list(set(message_ids))
+        n_total = len(message_ids)
+        failed = list()
+
+        for i in range(0, n_total, DELETE_ROUND_SIZE):
+            failed.extend(self.driver.msgs_delete(message_ids[i:i+DELETE_ROUND_SIZE], clear_body=clear_body))
+            logger.info('deleted %s/%s messages (%s failed)' % (min(i+DELETE_ROUND_SIZE, n_total), n_total, len(failed)))
+
+        retry_wait = self.delete_retry_wait
+        for retry in range(DELETE_RETRIES):
+            if len(failed) == 0:
+                break
+
+            logger.warning('retrying deletion of %s messages (retry %s/%s)' % (len(failed), retry+1, DELETE_RETRIES))
+            time.sleep(retry_wait)
+            retry_wait *= 2
+            failed = list(self.driver.msgs_delete(failed, clear_body=clear_body))
+
+        if len(failed) > 0:
+            logger.error('could not delete %s/%s messages: %s' % (len(failed), n_total, ','.join(failed)))
+
+        return n_total - len(failed), len(failed)
+
     @timeit(logger, 'on_cassandra_delete_message')
     def delete_messages_in_room(self, room_id: str=None, clear_body: bool=False) -> None:
         rows = self.driver.msgs_select(room_id, limit=500)
         if rows is None or len(rows.current_rows) == 0:
             return
 
-        msg_ids = [row.message_id for row in rows]
-        for msg_id in msg_ids:
-            self.driver.msg_delete(msg_id, clear_body=clear_body)
+        self.delete_messages([row.message_id for row in rows], clear_body=clear_body)
 
     @timeit(logger, 'on_cassandra_undelete_message')
     def undelete_message(self, message_id: str) -> None:
@@ -237,6 +371,43 @@ class CassandraStorage(object):
             msgs.append(self._row_to_json(row))
         return msgs
 
+    @timeit(logger, 'on_cassandra_get_history_page')
+    def get_history_page(
+            self, room_id: str, from_user_id: str, from_time: int, to_time: int, page_size: int,
+            cursor: str=None) -> (list, str):
+        paging_state = self._paging_state(cursor)
+
+        if room_id is not None and len(room_id.strip()) > 0:
+            if from_user_id is not None and len(from_user_id.strip()) > 0:
+                rows = self.driver.msgs_select_from_user_to_target_time_slice_page(
+                    from_user_id, room_id, from_time, to_time, page_size, paging_state)
+            else:
+                rows = self.driver.msgs_select_time_slice_page(room_id, from_time, to_time, page_size, paging_state)
+            msgs = [self._row_to_json(row) for row in rows.current_rows]
+        else:
+            # no time range on this view without the room, so a page might have fewer than page_size messages, or
+            # none, even if there are more pages
+            rows = self.driver.msgs_select_from_user_page(from_user_id, page_size, paging_state)
+            msgs = [
+                self._row_to_json(row) for row in rows.current_rows
+                if from_time <= row.time_stamp <= to_time
+            ]
+
+        return msgs, self._cursor(rows.paging_state)
+
+    def _cursor(self, paging_state: bytes) -> str:
+        if paging_state is None:
+            return None
+        return urlsafe_b64encode(paging_state).decode('ascii')
+
+    def _paging_state(self, cursor: str) -> bytes:
+        if cursor is None or len(cursor.strip()) == 0:
+            return None
+        try:
+            return urlsafe_b64decode(cursor.encode('ascii'))
+        except (binascii.Error, UnicodeEncodeError):
+            raise ValueError('invalid cursor "%s"' % cursor)
+
     @timeit(logger, 'on_cassandra_get_history')
     def get_history(self, room_id: str, limit: int=100) -> list:
         rows = self.driver.msgs_select_latest_non_deleted(room_id, limit)
@@ -13,6 +13,7 @@
 # limitations under the License.
 
 import logging
+import time
 import pytz
 
 from datetime import datetime
@@ -21,6 +22,11 @@ from zope.interface import implementer
 
 from cassandra.cluster import ResultSet
 from cassandra.cluster import Session
+from cassandra.concurrent import execute_concurrent
+from cassandra.concurrent import execute_concurrent_with_args
+from cassandra.query import BatchStatement
+from cassandra.query import BatchType
+from cassandra.query import SimpleStatement
 from cassandra.query import ValueSequence
 
 from dino.storage.cassandra_interface import IDriver
@@ -30,6 +36,39 @@ __author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
 
 logger = logging.getLogger(__name__)
 
+# max number of requests in flight at the same time when deleting many messages
+DELETE_CONCURRENCY = 50
+
+# number of message ids in the IN clause when looking up the messages to delete
+DELETE_LOOKUP_BATCH_SIZE = 100
+
+# max number of acks in one unlogged batch; all acks in a batch are for the same user, i.e. the same partition
+ACKS_BATCH_SIZE = 100
+
+# page size when scanning the messages table to backfill undeleted_messages_by_user or messages_by_time_bucket
+BACKFILL_FETCH_SIZE = 1000
+
+# the history of a room is partitioned by day with bucketed history
+BUCKET_SECONDS = 24*60*60
+
+# how many days back to look for history (not used for explicit time slices), and how many buckets to query at once
+DEFAULT_HISTORY_MAX_DAYS = 180
+BUCKETS_PER_QUERY = 7
+
+# time slices with messages on more days than this are read with one range query on messages_by_time_stamp instead of
+# per day
+MAX_TIME_SLICE_BUCKETS = 31
+
+# writes that can safely be retried or speculatively executed: writing them again late, after other writes to the same
+# rows, doesn't change the result. Selects always can. Most writes can't, e.g. a late ack update could overwrite a
+# newer status, and a late message insert could set deleted=false again after the message was deleted, or re-add the
+# row to undeleted_messages_by_user. Days of messages are never updated or removed, and deleting a message can't be
+# undone, so a late retry of those doesn't matter.
+IDEMPOTENT_WRITES = {
+    'message_day_insert',
+    'undeleted_delete',
+}
+
 
 class StatementKeys(Enum):
     acks_update = 'acks_update'
@@ -52,17 +91,53 @@ class StatementKeys(Enum):
     msg_select_msg_id_from_user_not_deleted = 'msg_select_msg_id_from_user_not_deleted'
     msg_select_msgs_from_user_not_deleted_for_time = 'msg_select_msgs_from_user_not_deleted_for_time'
     msg_select_msg_id_from_user_and_room_not_deleted = 'msg_select_msg_id_from_user_and_room_not_deleted'
+    undeleted_insert = 'undeleted_insert'
+    undeleted_delete = 'undeleted_delete'
+    bucket_insert = 'bucket_insert'
+    bucket_update = 'bucket_update'
+    bucket_select_latest_non_deleted = 'bucket_select_latest_non_deleted'
+    bucket_select_since = 'bucket_select_since'
+    bucket_select_time_slice = 'bucket_select_time_slice'
+    message_day_insert = 'message_day_insert'
+    message_days_select = 'message_days_select'
+    msgs_select_from_user_to_target_time_slice_paged = 'msgs_select_from_user_to_target_time_slice_paged'
+    msgs_select_from_user_paged = 'msgs_select_from_user_paged'
+
+
+def bucket_for(time_stamp: int) -> int:
+    return int(time_stamp) // BUCKET_SECONDS
+
+
+class BucketRows(object):
+    """
+    The rows from querying several buckets, with the same current_rows as a ResultSet so callers can treat them the
+    same way.
+    """
+
+    def __init__(self, rows: list):
+        self.current_rows = rows
+
+    def __iter__(self):
+        return iter(self.current_rows)
 
 
 @implementer(IDriver)
 class Driver(object):
-    def __init__(self, session: Session, key_space: str, strategy: str, replications: int):
+    def __init__(
+            self, session: Session, key_space: str, strategy: str, replications: int,
+            bucketed_history: bool=False, history_max_days: int=DEFAULT_HISTORY_MAX_DAYS,
+            read_consistency: int=None, write_consistency: int=None
+    ):
         self.session = session
         self.statements = dict()
         self.key_space = key_space
         self.key_space_test = key_space + 'test'
         self.strategy = strategy
         self.replications = replications
+        self.bucketed_history = bucketed_history
+        self.history_max_days = history_max_days
+        self.read_consistency = read_consistency
+        self.write_consistency = write_consistency
         self.logger = logging.getLogger(__name__)
 
     def init(self):
@@ -126,6 +201,64 @@ class Driver(object):
                 )
                 """
             )
+            # the undeleted room messages of each user, so they can be found without filtering (banning, kicking,
+            # clearing history); kept up to date when storing, deleting and undeleting messages, and existing
+            # messages are added with bin/backfill_undeleted_messages.py
+            self.session.execute(
+                """
+                CREATE TABLE IF NOT EXISTS undeleted_messages_by_user (
+                    message_id varchar,
+                    from_user_id text,
+                    from_user_name text,
+                    target_id text,
+                    target_name text,
+                    body text,
+                    domain text,
+                    sent_time varchar,
+                    time_stamp int,
+                    channel_id varchar,
+                    channel_name text,
+                    deleted boolean,
+                    PRIMARY KEY (from_user_id, target_id, time_stamp, sent_time)
+                )
+                """
+            )
+            # same as messages but partitioned by (target_id, day) so busy rooms don't grow unbounded partitions; only
+            # written and read if bucketed_history is enabled, existing messages are added with
+            # bin/backfill_history_buckets.py
+            self.session.execute(
+                """
+                CREATE TABLE IF NOT EXISTS messages_by_time_bucket (
+                    message_id varchar,
+                    from_user_id text,
+                    from_user_name text,
+                    target_id text,
+                    target_name text,
+                    body text,
+                    domain text,
+                    sent_time varchar,
+                    time_stamp int,
+                    day int,
+                    channel_id varchar,
+                    channel_name text,
+                    deleted boolean,
+                    PRIMARY KEY ((target_id, day), time_stamp, from_user_id, sent_time)
+                )
+                WITH CLUSTERING ORDER BY (time_stamp DESC, from_user_id ASC, sent_time ASC)
+                """
+            )
+            # the days (buckets in messages_by_time_bucket) each room has messages on, so reading the history only
+            # queries those buckets; one small row per room and day, written with the message
+            self.session.execute(
+                """
+                CREATE TABLE IF NOT EXISTS message_days_by_target (
+                    target_id text,
+                    day int,
+                    PRIMARY KEY (target_id, day)
+                )
+                WITH CLUSTERING ORDER BY (day DESC)
+                """
+            )
 
         def create_views():
             self.session.execute(
@@ -201,6 +334,33 @@ class Driver(object):
                         WITH CLUSTERING ORDER BY (time_stamp DESC)
                     """
             )
+            self.session.execute(
+                    """
+                    CREATE MATERIALIZED VIEW IF NOT EXISTS undeleted_messages_by_user_and_time AS
+                        SELECT * from undeleted_messages_by_user
+                            WHERE
+                                from_user_id IS NOT NULL AND
+                                target_id IS NOT NULL AND
+                                time_stamp IS NOT NULL AND
+                                sent_time IS NOT NULL
+                        PRIMARY KEY (from_user_id, time_stamp, target_id, sent_time)
+                    """
+            )
+            self.session.execute(
+                    """
+                    CREATE MATERIALIZED VIEW IF NOT EXISTS messages_by_time_bucket_non_deleted AS
+                        SELECT * from messages_by_time_bucket
+                            WHERE
+                                target_id IS NOT NULL AND
+                                day IS NOT NULL AND
+                                deleted IS NOT NULL AND
+                                time_stamp IS NOT NULL AND
+                                from_user_id IS NOT NULL AND
+                                sent_time IS NOT NULL
+                        PRIMARY KEY ((target_id, day), deleted, time_stamp, from_user_id, sent_time)
+                        WITH CLUSTERING ORDER BY (deleted ASC, time_stamp DESC, from_user_id ASC, sent_time ASC)
+                    """
+            )
 
         def prepare_statements():
             self.statements[StatementKeys.msg_insert] = self.session.prepare(
@@ -294,6 +454,16 @@ class Driver(object):
                     SELECT * FROM messages_by_from_user_id WHERE from_user_id = ? AND target_id = ? AND time_stamp > ? AND time_stamp < ? LIMIT ?
                     """
             )
+            self.statements[StatementKeys.msgs_select_from_user_to_target_time_slice_paged] = self.session.prepare(
+                    """
+                    SELECT * FROM messages_by_from_user_id WHERE from_user_id = ? AND target_id = ? AND time_stamp > ? AND time_stamp < ?
+                    """
+            )
+            self.statements[StatementKeys.msgs_select_from_user_paged] = self.session.prepare(
+                    """
+                    SELECT * FROM messages_by_from_user_id WHERE from_user_id = ?
+                    """
+            )
             self.statements[StatementKeys.msg_select] = self.session.prepare(
                     """
                     SELECT target_id, from_user_id, sent_time FROM messages_by_id WHERE message_id = ?
@@ -311,40 +481,127 @@ class Driver(object):
             )
             self.statements[StatementKeys.msg_select_msg_id_from_user_not_deleted] = self.session.prepare(
                     """
-                    SELECT
-                        message_id FROM messages_by_from_user_id
-                    WHERE
-                        from_user_id = ? AND
-                        deleted = False AND
-                        domain = 'room'
-                    ALLOW FILTERING
+                    SELECT message_id FROM undeleted_messages_by_user WHERE from_user_id = ?
                     """
             )
             self.statements[StatementKeys.msg_select_msgs_from_user_not_deleted_for_time] = self.session.prepare(
                     """
                     SELECT
-                        * FROM messages_by_from_user_id
+                        * FROM undeleted_messages_by_user_and_time
                     WHERE
                         from_user_id = ? AND
-                        deleted = False AND
-                        domain = 'room' AND
                         time_stamp > ? AND
                         time_stamp < ?
-                    ALLOW FILTERING
                     """
             )
             self.statements[StatementKeys.msg_select_msg_id_from_user_and_room_not_deleted] = self.session.prepare(
                     """
-                    SELECT
-                        message_id FROM messages_by_from_user_id
+                    SELECT message_id FROM undeleted_messages_by_user WHERE from_user_id = ? AND target_id = ?
+                    """
+            )
+            self.statements[StatementKeys.undeleted_insert] = self.session.prepare(
+                    """
+                    INSERT INTO undeleted_messages_by_user (
+                        message_id,
+                        from_user_id,
+                        from_user_name,
+                        target_id,
+                        target_name,
+                        body,
+                        domain,
+                        sent_time,
+                        time_stamp,
+                        channel_id,
+                        channel_name,
+                        deleted
+                    )
+                    VALUES (
+                        ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, False
+                    )
+                    """
+            )
+            self.statements[StatementKeys.bucket_insert] = self.session.prepare(
+                    """
+                    INSERT INTO messages_by_time_bucket (
+                        message_id,
+                        from_user_id,
+                        from_user_name,
+                        target_id,
+                        target_name,
+                        body,
+                        domain,
+                        sent_time,
+                        time_stamp,
+                        day,
+                        channel_id,
+                        channel_name,
+                        deleted
+                    )
+                    VALUES (
+                        ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?
+                    )
+                    """
+            )
+            self.statements[StatementKeys.bucket_update] = self.session.prepare(
+                    """
+                    UPDATE messages_by_time_bucket SET body = ?, deleted = ?
                     WHERE
-                        from_user_id = ? AND
-                        target_id = ? AND
-                        deleted = False AND
-                        domain = 'room'
-                    ALLOW FILTERING
+                      target_id = ? AND
+                      day = ? AND
+                      time_stamp = ? AND
+                      from_user_id = ? AND
+                      sent_time = ?
+                    """
+            )
+            self.statements[StatementKeys.bucket_select_latest_non_deleted] = self.session.prepare(
+                    """
+                    SELECT * FROM messages_by_time_bucket_non_deleted
+                    WHERE target_id = ? AND day = ? AND deleted = False LIMIT ?
+                    """
+            )
+            self.statements[StatementKeys.bucket_select_since] = self.session.prepare(
+                    """
+                    SELECT * FROM messages_by_time_bucket WHERE target_id = ? AND day = ? AND time_stamp > ?
+                    """
+            )
+            self.statements[StatementKeys.bucket_select_time_slice] = self.session.prepare(
+                    """
+                    SELECT * FROM messages_by_time_bucket
+                    WHERE target_id = ? AND day = ? AND time_stamp > ? AND time_stamp < ?
+                    """
+            )
+            self.statements[StatementKeys.message_day_insert] = self.session.prepare(
+                    """
+                    INSERT INTO message_days_by_target (target_id, day) VALUES (?, ?)
+                    """
+            )
+            self.statements[StatementKeys.message_days_select] = self.session.prepare(
+                    """
+                    SELECT day FROM message_days_by_target WHERE target_id = ? AND day <= ? AND day >= ?
                     """
             )
+            self.statements[StatementKeys.undeleted_delete] = self.session.prepare(
+                    """
+                    DELETE FROM undeleted_messages_by_user
+                    WHERE
+                      from_user_id = ? AND
+                      target_id = ? AND
+                      time_stamp = ? AND
+                      sent_time = ?
+                    """
+            )
+
+        def tune_statements():
+            for statement_key, statement in self.statements.items():
+                is_read = statement.query_string.strip().upper().startswith('SELECT')
+
+                # only idempotent statements are retried on timeouts or speculatively executed
+                if is_read or statement_key.value in IDEMPOTENT_WRITES:
+                    statement.is_idempotent = True
+
+                consistency = self.read_consistency if is_read else self.write_consistency
+                if consistency is not None:
+                    statement.consistency_level = consistency
 
         # create keyspace and tables for tests
         create_test_key_space()
@@ -358,14 +615,56 @@ class Driver(object):
         create_tables()
         create_views()
         prepare_statements()
+        tune_statements()
 
     def msg_insert(self, msg_id, from_user_id, from_user_name, target_id, target_name, body, domain, sent_time, channel_id, channel_name, deleted=False) -> None:
+        for statement_key, params in self._insert_statements(
+                msg_id, from_user_id, from_user_name, target_id, target_name, body, domain, sent_time,
+                channel_id, channel_name, deleted):
+            self._execute(statement_key, *params)
+
+    def msgs_insert(self, messages: list) -> None:
+        """
+        Same as msg_insert() but for many messages, with the inserts sent asynchronously instead of one after the
+        other; raises the first error if any insert fails, but since inserts are idempotent the whole batch can be
+        retried.
+
+        :param messages: a list of dicts with the same keys as the parameters of msg_insert()
+        """
+        statements = list()
+        for message in messages:
+            for statement_key, params in self._insert_statements(**message):
+                statements.append((self.statements[statement_key], params))
+
+        execute_concurrent(self.session, statements, concurrency=DELETE_CONCURRENCY, raise_on_first_error=True)
+
+    def _insert_statements(self, msg_id, from_user_id, from_user_name, target_id, target_name, body, domain, sent_time, channel_id, channel_name, deleted=False) -> list:
         dt = datetime.strptime(sent_time, ConfigKeys.DEFAULT_DATE_FORMAT)
         dt = pytz.timezone('utc').localize(dt, is_dst=None)
         time_stamp = int(dt.astimezone(pytz.utc).strftime('%s'))
-        self._execute(
-                StatementKeys.msg_insert, msg_id, from_user_id, from_user_name, target_id, target_name,
-                body, domain, sent_time, time_stamp, channel_id, channel_name, deleted)
+
+        statements = [(
+            StatementKeys.msg_insert,
+            (msg_id, from_user_id, from_user_name, target_id, target_name, body, domain, sent_time, time_stamp,
+             channel_id, channel_name, deleted)
+        )]
+
+        if not deleted and domain == 'room':
+            statements.append((
+                StatementKeys.undeleted_insert,
+                (msg_id, from_user_id, from_user_name, target_id, target_name, body, domain, sent_time, time_stamp,
+                 channel_id, channel_name)
+            ))
+
+        if self.bucketed_history:
+            statements.append((
+                StatementKeys.bucket_insert,
+                (msg_id, from_user_id, from_user_name, target_id, target_name, body, domain, sent_time, time_stamp,
+                 bucket_for(time_stamp), channel_id, channel_name, deleted)
+            ))
+            statements.append((StatementKeys.message_day_insert, (target_id, bucket_for(time_stamp))))
+
+        return statements
 
     def msg_update(self, from_user_id, target_id, body, sent_time, deleted=False) -> None:
         dt = datetime.strptime(sent_time, ConfigKeys.DEFAULT_DATE_FORMAT)
@@ -373,20 +672,74 @@ class Driver(object):
         time_stamp = int(dt.astimezone(pytz.utc).strftime('%s'))
         self._execute(StatementKeys.msg_update, body, deleted, target_id, from_user_id, sent_time, time_stamp)
 
+        if self.bucketed_history:
+            self._execute(
+                    StatementKeys.bucket_update, body, deleted, target_id, bucket_for(time_stamp),
+                    time_stamp, from_user_id, sent_time)
+
     def get_acks_for(self, message_ids: set, receiver_id: str) -> ResultSet:
         return self._execute(StatementKeys.acks_get, receiver_id, message_ids)
 
     def get_acks_for_status(self, user_id: str, status: int) -> ResultSet:
         return self._execute(StatementKeys.acks_get_for_status, user_id, status)
 
+    def get_acks_for_many(self, message_ids_by_receiver: dict) -> list:
+        """
+        Same as get_acks_for() but for many users at once, with one query per user sent asynchronously.
+
+        :param message_ids_by_receiver: a dict of user id => message ids to get the acks for
+        :return: the rows of the acks that exist
+        """
+        args = [(receiver_id, list(message_ids)) for receiver_id, message_ids in message_ids_by_receiver.items()]
+        rows = list()
+
+        for success, result in execute_concurrent_with_args(
+                self.session, self.statements[StatementKeys.acks_get], args,
+                concurrency=DELETE_CONCURRENCY, raise_on_first_error=True):
+            rows.extend(result)
+
+        return rows
+
+    def set_acks_with_status(self, acks: list) -> None:
+        """
+        Insert or overwrite many acks at once. The acks of each user are in the same partition, so they're written as
+        unlogged batches of at most ACKS_BATCH_SIZE acks per user (a single mutation per batch), and the batches are
+        sent asynchronously.
+
+        :param acks: a list of tuples of (receiver_id, message_id, status, target_id)
+        """
+        acks_by_receiver = dict()
+        for receiver_id, message_id, status, target_id in acks:
+            acks_by_receiver.setdefault(receiver_id, list()).append((receiver_id, message_id, status, target_id))
+
+        statement = self.statements[StatementKeys.acks_insert]
+        batches = list()
+
+        for receiver_acks in acks_by_receiver.values():
+            for i in range(0, len(receiver_acks), ACKS_BATCH_SIZE):
+                batch = BatchStatement(batch_type=BatchType.UNLOGGED, consistency_level=self.write_consistency)
+                for params in receiver_acks[i:i+ACKS_BATCH_SIZE]:
+                    batch.add(statement, params)
+                batches.append((batch, None))
+
+        execute_concurrent(self.session, batches, concurrency=DELETE_CONCURRENCY, raise_on_first_error=True)
+
     def add_acks_with_status(self, message_ids: set, receiver_id: str, target_id: str, status: int):
-        for message_id in message_ids:
-            self._execute(StatementKeys.acks_insert, receiver_id, message_id, status, target_id)
+        self.set_acks_with_status([(receiver_id, message_id, status, target_id) for message_id in message_ids])
 
     def update_acks_with_status(self, message_ids: set, receiver_id: str, status: int):
         return self._execute(StatementKeys.acks_update, status, receiver_id, message_ids)
 
     def msgs_select_time_slice(self, target_id: str, from_time: int, to_time: int) -> ResultSet:
+        if self.bucketed_history:
+            days = self._message_days(target_id, bucket_for(to_time), bucket_for(from_time))
+            if len(days) == 0:
+                return BucketRows(list())
+
+            if len(days) <= MAX_TIME_SLICE_BUCKETS:
+                return self._select_buckets(
+                    StatementKeys.bucket_select_time_slice, target_id, days, from_time, to_time)
+
         return self._execute(StatementKeys.msgs_select_time_slice, target_id, from_time, to_time)
 
     def msgs_select_from_user(self, from_user_id: str, limit: int=500) -> ResultSet:
@@ -408,11 +761,76 @@ class Driver(object):
         return self._execute(StatementKeys.msg_select_all, message_id)
 
     def msgs_select_latest_non_deleted(self, target_id: str, limit: int=100) -> ResultSet:
+        if self.bucketed_history:
+            newest = bucket_for(time.time())
+            days = self._message_days(target_id, newest, newest - self.history_max_days)
+            return self._select_buckets(StatementKeys.bucket_select_latest_non_deleted, target_id, days, limit=limit)
         return self._execute(StatementKeys.msgs_select_latest_non_deleted, target_id, limit)
 
     def msgs_select_since_time(self, target_id: str, time_stamp: int) -> ResultSet:
+        if self.bucketed_history:
+            newest = bucket_for(time.time())
+            days = self._message_days(target_id, newest, max(bucket_for(time_stamp), newest - self.history_max_days))
+            return self._select_buckets(StatementKeys.bucket_select_since, target_id, days, time_stamp)
         return self._execute(StatementKeys.msgs_select_by_time_stamp, target_id, time_stamp)
 
+    def _message_days(self, target_id: str, newest: int, oldest: int) -> list:
+        """
+        The buckets between newest and oldest (inclusive) that the room has messages in, from message_days_by_target,
+        so empty, new and quiet rooms don't query every bucket in the range.
+
+        :return: the buckets, newest first
+        """
+        return [row.day for row in self._execute(StatementKeys.message_days_select, target_id, newest, oldest)]
+
+    def _select_buckets(self, statement_key, target_id: str, days: list, *params, limit: int=None):
+        """
+        Query the buckets from newest to oldest, BUCKETS_PER_QUERY buckets at a time, until the limit (if any) is met.
+        Rows are ordered newest first, same as in the unbucketed views.
+        """
+        rows = list()
+
+        for i in range(0, len(days), BUCKETS_PER_QUERY):
+            buckets = days[i:i+BUCKETS_PER_QUERY]
+            if limit is None:
+                args = [(target_id, bucket) + params for bucket in buckets]
+            else:
+                args = [(target_id, bucket) + params + (limit - len(rows),) for bucket in buckets]
+
+            for result in self._execute_concurrent(statement_key, args, concurrency=BUCKETS_PER_QUERY):
+                rows.extend(result)
+
+            if limit is not None and len(rows) >= limit:
+                return BucketRows(rows[:limit])
+
+        return BucketRows(rows)
+
+    def msgs_select_time_slice_page(
+            self, target_id: str, from_time: int, to_time: int, fetch_size: int, paging_state: bytes=None
+    ) -> ResultSet:
+        # messages_by_time_stamp has all messages even with bucketed history, and paging through a range of one
+        # partition doesn't have to read the whole partition
+        return self._execute_page(
+            StatementKeys.msgs_select_time_slice, fetch_size, paging_state, target_id, from_time, to_time)
+
+    def msgs_select_from_user_to_target_time_slice_page(
+            self, from_user_id: str, target_id: str, from_time: int, to_time: int, fetch_size: int,
+            paging_state: bytes=None
+    ) -> ResultSet:
+        return self._execute_page(
+            StatementKeys.msgs_select_from_user_to_target_time_slice_paged, fetch_size, paging_state,
+            from_user_id, target_id, from_time, to_time)
+
+    def msgs_select_from_user_page(self, from_user_id: str, fetch_size: int, paging_state: bytes=None) -> ResultSet:
+        return self._execute_page(StatementKeys.msgs_select_from_user_paged, fetch_size, paging_state, from_user_id)
+
+    def msgs_select_non_deleted_for_user_and_time_page(
+            self, from_user_id: str, from_time: int, to_time: int, fetch_size: int, paging_state: bytes=None
+    ) -> ResultSet:
+        return self._execute_page(
+            StatementKeys.msg_select_msgs_from_user_not_deleted_for_time, fetch_size, paging_state,
+            from_user_id, from_time, to_time)
+
     def msgs_select_non_deleted_for_user(self, from_user_id: str) -> ResultSet:
         return self._execute(StatementKeys.msg_select_msg_id_from_user_not_deleted, from_user_id)
 
@@ -464,6 +882,177 @@ class Driver(object):
                     body = ''
 
                 self.msg_update(from_user_id, target_id, body, timestamp, deleted)
+                self._update_undeleted(message_row, deleted)
+
+    def _update_undeleted(self, row, deleted: bool) -> None:
+        if deleted:
+            self._execute(StatementKeys.undeleted_delete, *self._undeleted_key(row))
+        elif row.domain == 'room':
+            self._execute(StatementKeys.undeleted_insert, *self._undeleted_values(row))
+
+    def _undeleted_key(self, row) -> tuple:
+        return row.from_user_id, row.target_id, row.time_stamp, row.sent_time
+
+    def _undeleted_values(self, row) -> tuple:
+        return (
+            row.message_id, row.from_user_id, row.from_user_name, row.target_id, row.target_name, row.body,
+            row.domain, row.sent_time, row.time_stamp, row.channel_id, row.channel_name
+        )
+
+    def backfill_undeleted_messages(self) -> int:
+        """
+        Add all undeleted room messages to undeleted_messages_by_user. Only needed once, for messages stored before
+        the table existed; scans the whole messages table, so it's slow, but can run while dino is running.
+
+        :return: the number of messages added
+        """
+        def values_for(row):
+            # same conditions as the queries this table replaces
+            if row.deleted is not False or row.domain != 'room':
+                return None
+            return self._undeleted_values(row)
+
+        return self._backfill(StatementKeys.undeleted_insert, 'undeleted_messages_by_user', values_for)
+
+    def backfill_time_buckets(self) -> int:
+        """
+        Copy all messages to messages_by_time_bucket, and the days they were sent on to message_days_by_target. Only
+        needed once, when enabling bucketed history for an existing key space; scans the whole messages table, so it's
+        slow, but can run while dino is running.
+
+        :return: the number of messages copied
+        """
+        days = set()
+
+        def values_for(row):
+            return (
+                row.message_id, row.from_user_id, row.from_user_name, row.target_id, row.target_name, row.body,
+                row.domain, row.sent_time, row.time_stamp, bucket_for(row.time_stamp), row.channel_id,
+                row.channel_name, row.deleted
+            )
+
+        def day_values_for(row):
+            day = (row.target_id, bucket_for(row.time_stamp))
+            if day in days:
+                return None
+            days.add(day)
+            return day
+
+        n_copied = self._backfill(StatementKeys.bucket_insert, 'messages_by_time_bucket', values_for)
+        self._backfill(StatementKeys.message_day_insert, 'message_days_by_target', day_values_for)
+        return n_copied
+
+    def _backfill(self, statement_key, table: str, values_for) -> int:
+        n_added = 0
+        n_scanned = 0
+        values = list()
+
+        def flush():
+            execute_concurrent_with_args(
+                self.session, self.statements[statement_key], values,
+                concurrency=DELETE_CONCURRENCY, raise_on_first_error=True)
+            logger.info('scanned %s msgs, added %s to %s' % (n_scanned, n_added, table))
+            values.clear()
+
+        rows = self.session.execute(SimpleStatement('SELECT * FROM messages', fetch_size=BACKFILL_FETCH_SIZE))
+        for row in rows:
+            n_scanned += 1
+
+            row_values = values_for(row)
+            if row_values is None:
+                continue
+
+            values.append(row_values)
+            n_added += 1
+
+            if len(values) >= BACKFILL_FETCH_SIZE:
+                flush()
+
+        flush()
+        return n_added
+
+    def msgs_delete(self, message_ids: list, clear_body: bool=True) -> set:
+        """
+        Same as msg_delete() but for many messages at once. Instead of three synchronous queries per message, the
+        messages are looked up with IN queries on messages_by_id (which has the complete rows, so the extra select
+        on the messages table isn't needed), and the updates are sent asynchronously, with at most DELETE_CONCURRENCY
+        requests in flight.
+
+        :param message_ids: the uuids of the messages to 'delete'
+        :param clear_body: if the body of the messages should be cleared
+        :return: the message ids that couldn't be deleted, and could be retried
+        """
+        failed = set()
+        message_ids = list(message_ids)
+
+        chunks = [
+            message_ids[i:i+DELETE_LOOKUP_BATCH_SIZE]
+            for i in range(0, len(message_ids), DELETE_LOOKUP_BATCH_SIZE)
+        ]
+        lookups = execute_concurrent_with_args(
+            self.session,
+            self.statements[StatementKeys.msgs_select_all_in],
+            [(ValueSequence(chunk),) for chunk in chunks],
+            concurrency=DELETE_CONCURRENCY,
+            raise_on_first_error=False
+        )
+
+        rows = list()
+        for chunk, (success, result) in zip(chunks, lookups):
+            if not success:
+                logger.error('could not look up %s msgs to delete: %s' % (len(chunk), str(result)))
+                failed.update(chunk)
+                continue
+            rows.extend(result)
+
+        updates = list()
+        updated_rows = list()
+        for row in rows:
+            body = '' if clear_body else row.body
+            updates.append((
+                self.statements[StatementKeys.msg_update],
+                (body, True, row.target_id, row.from_user_id, row.sent_time, row.time_stamp)
+            ))
+            updates.append((self.statements[StatementKeys.undeleted_delete], self._undeleted_key(row)))
+            updated_rows.extend([row, row])
+
+            if self.bucketed_history:
+                updates.append((
+                    self.statements[StatementKeys.bucket_update],
+                    (body, True, row.target_id, bucket_for(row.time_stamp), row.time_stamp, row.from_user_id,
+                     row.sent_time)
+                ))
+                updated_rows.append(row)
+
+        results = execute_concurrent(
+            self.session, updates, concurrency=DELETE_CONCURRENCY, raise_on_first_error=False)
+
+        for row, (success, result) in zip(updated_rows, results):
+            if not success:
+                logger.error('could not delete msg with id %s: %s' % (row.message_id, str(result)))
+                failed.add(row.message_id)
+
+        return failed
+
+    def _execute_page(self, statement_key, fetch_size: int, paging_state: bytes, *params) -> ResultSet:
+        """
+        Only fetch one page of rows. The rows of the page are in current_rows of the returned ResultSet (don't iterate
+        over it, that would fetch the following pages as well), and its paging_state is passed to the next call to get
+        the next page, or is None if this was the last page.
+        """
+        statement = self.statements[statement_key].bind(params)
+        statement.fetch_size = fetch_size
+        return self.session.execute(statement, paging_state=paging_state)
+
+    def _execute_concurrent(self, statement_key, args: list, concurrency: int) -> list:
+        """
+        :return: the results of executing the statement once for each of the params in args, in the same order
+        """
+        return [
+            result for success, result in execute_concurrent_with_args(
+                self.session, self.statements[statement_key], args,
+                concurrency=concurrency, raise_on_first_error=True)
+        ]
 
     def _execute(self, statement_key, *params) -> ResultSet:
         if params is not None and len(params) > 0:
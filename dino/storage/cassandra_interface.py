@@ -48,10 +48,90 @@ class IDriver(Interface):
         :return: nothing
         """
 
+    def msgs_delete(self, message_ids: list, clear_body: bool=True) -> set:
+        """
+        flag many messages as deleted at once
+
+        :param message_ids: the uuids of the messages to delete
+        :param clear_body: if the body of the messages should be cleared
+        :return: the message ids that could not be deleted
+        """
+
+    def backfill_undeleted_messages(self) -> int:
+        """
+        add all existing undeleted room messages to the table used by the msgs_select_non_deleted_for_user* queries;
+        new messages are added when stored, so this only has to be run once after upgrading
+
+        :return: the number of messages added
+        """
+
+    def backfill_time_buckets(self) -> int:
+        """
+        copy all existing messages to the time bucketed history table; new messages are added when stored if
+        bucketed history is enabled, so this only has to be run once when enabling it
+
+        :return: the number of messages copied
+        """
+
+    def get_acks_for_many(self, message_ids_by_receiver: dict) -> list:
+        """
+        get the existing acks of many users at once
+
+        :param message_ids_by_receiver: a dict of user id => message ids to get the acks for
+        :return: the rows of the acks that exist
+        """
+
+    def set_acks_with_status(self, acks: list) -> None:
+        """
+        insert or overwrite many acks at once, without checking the current status
+
+        :param acks: a list of tuples of (receiver_id, message_id, status, target_id)
+        :return: nothing
+        """
+
+    def msgs_insert(self, messages: list) -> None:
+        """
+        store many new messages at once
+
+        :param messages: a list of dicts with the same keys as the parameters of msg_insert()
+        :return: nothing
+        """
+
+    def msgs_select_time_slice_page(
+            self, target_id: str, from_time: int, to_time: int, fetch_size: int, paging_state: bytes=None):
+        """
+        get one page of the messages sent to a room in a time slice
+
+        :param target_id: the uuid of the room
+        :param from_time: only messages sent after this time stamp
+        :param to_time: only messages sent before this time stamp
+        :param fetch_size: max number of messages in the page
+        :param paging_state: the paging_state of the previous page, or None for the first page
+        :return: a result set with the page in current_rows and the paging_state of the next page (None if no more)
+        """
+
+    def msgs_select_from_user_to_target_time_slice_page(
+            self, from_user_id: str, target_id: str, from_time: int, to_time: int, fetch_size: int,
+            paging_state: bytes=None):
+        """
+        same as msgs_select_time_slice_page() but only for messages sent by a certain user
+        """
+
+    def msgs_select_from_user_page(self, from_user_id: str, fetch_size: int, paging_state: bytes=None):
+        """
+        get one page of all messages sent by a user, see msgs_select_time_slice_page()
+        """
+
+    def msgs_select_non_deleted_for_user_and_time_page(
+            self, from_user_id: str, from_time: int, to_time: int, fetch_size: int, paging_state: bytes=None):
+        """
+        get one page of the un-deleted messages sent by a user in a time slice, see msgs_select_time_slice_page()
+        """
+
     def msgs_select_non_deleted_for_user(self, from_user_id: str):
         """
-        Get all un-deleted message ids send from a certain user. User by rest api to delete everything from a certain
-        user, which does not happen often so we can allow this filtering, slow query.
+        Get all un-deleted message ids send from a certain user. Used by rest api to delete everything from a certain
+        user, and when banning users.
 
         :param from_user_id: the id of the user to find messages for
         :return: a list of message ids
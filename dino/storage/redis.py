@@ -12,24 +12,37 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import logging
+from datetime import datetime
+
 from zope.interface import implementer
 from activitystreams.models.activity import Activity
 
 from dino import environ
 from dino.storage import IStorage
 from dino.config import ConfigKeys
-from dino.config import SessionKeys
 from dino.config import AckStatus
 from dino.config import RedisKeys
 from dino.utils import is_base64
 from dino.utils import b64d
-from dino.utils import b64e
 
 __author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
 
 
+logger = logging.getLogger(__name__)
+
+
 @implementer(IStorage)
 class StorageRedis(object):
+    """
+    Each message is stored in a hash, and the ids of the messages sent to a room are kept in a sorted set scored by
+    the time the message was sent, so deleting a message or reading a time slice of the history doesn't have to scan
+    the whole history of the room.
+
+    Messages stored with the older layout, where the history of a room was a list of comma separated messages, can
+    be moved over using migrate_history(), see bin/migrate_redis_history.py.
+    """
+
     redis = None
 
     def __init__(self, host: str, port: int = 6379, db: int = 0):
@@ -41,59 +54,187 @@ class StorageRedis(object):
         self.redis = Redis(host=host, port=port, db=db)
 
     def store_message(self, activity: Activity, deleted=False) -> None:
-        target_id = activity.target.id
-        target_name = b64e(activity.target.display_name)
-        user_id = environ.env.session.get(SessionKeys.user_id.value)
-        user_name = b64e(environ.env.session.get(SessionKeys.user_name.value))
-        channel_id = activity.object.url
-        channel_name = b64e(activity.object.summary)
-        msg = activity.object.content
-
-        if not is_base64(msg):
-            raise RuntimeError('message is not base64')
-
-        self.redis.lpush(
-                RedisKeys.room_history(target_id),
-                '%s,%s,%s,%s,%s,%s,%s,%s' % (
-                    activity.id, activity.published, user_id, user_name, target_name, channel_id, channel_name, msg))
+        self.store_messages([activity], deleted=deleted)
+
+    def store_messages(self, activities: list, deleted=False) -> None:
+        if deleted:
+            # deleted messages are never read from the redis storage, so no point in keeping them
+            return
 
+        messages = list()
+        for activity in activities:
+            if not is_base64(activity.object.content):
+                raise RuntimeError('message is not base64')
+
+            messages.append({
+                'message_id': activity.id,
+                'from_user_id': activity.actor.id,
+                'from_user_name': b64d(activity.actor.display_name),
+                'target_id': activity.target.id,
+                'target_name': activity.target.display_name or '',
+                'body': b64d(activity.object.content),
+                'domain': activity.target.object_type or 'room',
+                'channel_id': activity.object.url or '',
+                'channel_name': activity.object.summary or '',
+                'timestamp': activity.published
+            })
+
+        self._store(messages)
+
+    def _store(self, messages: list) -> None:
         max_history = environ.env.config.get(ConfigKeys.LIMIT, domain=ConfigKeys.HISTORY, default=-1)
+        room_ids = list()
+
+        pipe = self.redis.pipeline(transaction=False)
+        for message in messages:
+            room_id = message['target_id']
+            pipe.hmset(RedisKeys.message(message['message_id']), message)
+            pipe.zadd(RedisKeys.room_messages(room_id), **{message['message_id']: self._score(message['timestamp'])})
+            if room_id not in room_ids:
+                room_ids.append(room_id)
+
+        # in the same round trip, get the oldest messages that are above the history limit, if any
         if max_history > 0:
-            self.redis.ltrim(RedisKeys.room_history(target_id), 0, max_history)
+            for room_id in room_ids:
+                pipe.zrange(RedisKeys.room_messages(room_id), 0, -(max_history + 1))
+
+        results = pipe.execute()
+        if max_history <= 0:
+            return
+
+        pipe = self.redis.pipeline(transaction=False)
+        n_trimmed = 0
+        for room_id, trimmed_ids in zip(room_ids, results[-len(room_ids):]):
+            if len(trimmed_ids) == 0:
+                continue
+            n_trimmed += len(trimmed_ids)
+            pipe.zrem(RedisKeys.room_messages(room_id), *trimmed_ids)
+            pipe.delete(*[RedisKeys.message(str(message_id, 'utf-8')) for message_id in trimmed_ids])
+
+        if n_trimmed > 0:
+            pipe.execute()
+
+    def _score(self, published: str) -> int:
+        return int(datetime.strptime(published, ConfigKeys.DEFAULT_DATE_FORMAT).strftime('%s'))
 
     def get_undeleted_message_ids_for_user(self, user_id: str):
         raise NotImplementedError('inefficient query for redis storage, not implemented')
 
     def delete_message(self, message_id: str, room_id: str=None):
-        if room_id is None:
-            raise RuntimeError('redis storage needs room_id parameter to delete message')
-
         if message_id is None or message_id == '':
             return
 
-        all_history = self.redis.lrange(RedisKeys.room_history(room_id), 0, -1)
-        found_msg = None
-        for history in all_history:
-            history = str(history, 'utf-8')
-            if history.startswith(message_id + ','):
-                found_msg = history
-                break
+        self.delete_messages([message_id], room_id)
+
+    def delete_messages(self, message_ids: list, room_id: str=None) -> (int, int):
+        message_ids = set(message_ids)
+        message_ids.discard(None)
+        message_ids.discard('')
+        if len(message_ids) == 0:
+            return 0, 0
+
+        message_ids = list(message_ids)
+        if room_id is not None:
+            room_ids = [room_id] * len(message_ids)
+        else:
+            pipe = self.redis.pipeline(transaction=False)
+            for message_id in message_ids:
+                pipe.hget(RedisKeys.message(message_id), 'target_id')
+            room_ids = [None if target_id is None else str(target_id, 'utf-8') for target_id in pipe.execute()]
+
+        # number of commands sent for each message
+        n_commands = list()
+
+        pipe = self.redis.pipeline(transaction=False)
+        for message_id, message_room_id in zip(message_ids, room_ids):
+            if message_room_id is not None:
+                pipe.zrem(RedisKeys.room_messages(message_room_id), message_id)
+            pipe.delete(RedisKeys.message(message_id))
+            n_commands.append(1 if message_room_id is None else 2)
 
-        self.redis.lrem(RedisKeys.room_history(room_id), found_msg, 1)
+        # a message was deleted if either the zset entry or the hash was removed; unknown ids count as failures
+        results = iter(pipe.execute())
+        successes = len([n for n in n_commands if sum([next(results) for _ in range(n)]) > 0])
+
+        return successes, len(message_ids) - successes
 
     def get_history(self, room_id: str, limit: int = 100):
+        if limit is None or limit <= 0:
+            limit = 0
+
+        message_ids = self.redis.zrevrange(RedisKeys.room_messages(room_id), 0, limit - 1)
+        return self._get_messages(message_ids)
+
+    def get_history_for_time_slice(self, room_id: str, from_user_id: str, from_time: int, to_time: int) -> list:
+        if room_id is None or len(room_id.strip()) == 0:
+            raise NotImplementedError('inefficient query for redis storage, not implemented')
+
+        message_ids = self.redis.zrevrangebyscore(RedisKeys.room_messages(room_id), to_time, from_time)
+        messages = self._get_messages(message_ids)
+
+        if from_user_id is None or len(from_user_id.strip()) == 0:
+            return messages
+        return [message for message in messages if message['from_user_id'] == from_user_id]
+
+    def get_unread_history(self, room_id: str, time_stamp: int, limit: int = 100) -> list:
         if limit is None:
-            limit = -1
+            limit = 100
+
+        message_ids = self.redis.zrevrangebyscore(
+            RedisKeys.room_messages(room_id), '+inf', time_stamp, start=0, num=limit)
+        return self._get_messages(message_ids)
+
+    def _get_messages(self, message_ids: list) -> list:
+        if len(message_ids) == 0:
+            return list()
+
+        pipe = self.redis.pipeline(transaction=False)
+        for message_id in message_ids:
+            pipe.hgetall(RedisKeys.message(str(message_id, 'utf-8')))
+
+        messages = list()
+        for message in pipe.execute():
+            # could have been deleted or trimmed after reading the ids
+            if message is None or len(message) == 0:
+                continue
+
+            message = {str(key, 'utf-8'): str(value, 'utf-8') for key, value in message.items()}
+            message['deleted'] = False
+            messages.append(message)
+
+        return messages
+
+    def migrate_history(self) -> int:
+        """
+        move the history of all rooms from the old list layout to the current layout
+
+        :return: the number of messages moved
+        """
+        n_migrated = 0
+        for redis_key in self.redis.scan_iter(match=RedisKeys.room_history('*')):
+            room_id = str(redis_key, 'utf-8').split(RedisKeys.room_history(''), 1)[1]
+            n_migrated += self.migrate_room_history(room_id)
+        return n_migrated
 
-        messages = self.redis.lrange(RedisKeys.room_history(room_id), 0, limit)
+    def migrate_room_history(self, room_id: str) -> int:
+        """
+        move the history of a room from the old list layout, where each message was stored as
+        'id,published,user_id,b64(user_name),b64(room_name),channel_id,b64(channel_name),b64(message)', to the
+        current layout; the old list is removed afterwards
 
-        cleaned_messages = list()
-        for message_entry in messages:
-            message_entry = str(message_entry, 'utf-8')
-            msg_id, published, user_id, user_name, target_name, channel_id, channel_name, msg = \
-                message_entry.split(',', 7)
+        :param room_id: the uuid of the room
+        :return: the number of messages moved
+        """
+        messages = list()
+        for message_entry in self.redis.lrange(RedisKeys.room_history(room_id), 0, -1):
+            try:
+                msg_id, published, user_id, user_name, target_name, channel_id, channel_name, msg = \
+                    str(message_entry, 'utf-8').split(',', 7)
+            except ValueError:
+                logger.warning('skipping invalid history entry in room %s: %s' % (room_id, message_entry))
+                continue
 
-            cleaned_messages.append({
+            messages.append({
                 'message_id': msg_id,
                 'from_user_id': user_id,
                 'from_user_name': b64d(user_name),
@@ -103,48 +244,48 @@ class StorageRedis(object):
                 'domain': 'room',
                 'channel_id': channel_id,
                 'channel_name': b64d(channel_name),
-                'timestamp': published,
-                'deleted': False
+                'timestamp': published
             })
 
-        return cleaned_messages
+        if len(messages) > 0:
+            self._store(messages)
+
+        self.redis.delete(RedisKeys.room_history(room_id))
+        return len(messages)
+
+    def get_statuses(self, message_ids: set, receiver_id: str) -> dict:
+        return self._get_acks_for(message_ids, receiver_id)
 
     def _get_acks_for(self, message_ids: set, receiver_id: str) -> dict:
-        redis_key = RedisKeys.ack_for_user(receiver_id)
+        message_ids = list(message_ids)
+        if len(message_ids) == 0:
+            return dict()
+
         acks = dict()
-        for message_id in message_ids:
-            ack = self.redis.hget(redis_key, message_id)
+        statuses = self.redis.hmget(RedisKeys.ack_for_user(receiver_id), message_ids)
+        for message_id, ack in zip(message_ids, statuses):
             if ack is None:
                 continue
-            acks[message_ids] = int(float(str(ack, 'utf-8')))
+            acks[message_id] = int(float(str(ack, 'utf-8')))
         return acks
 
-    def _update_acks_with_status(self, message_ids: set, receiver_id: str, target_id: str, status: int):
-        redis_key_user = RedisKeys.ack_for_user(receiver_id)
-        redis_key_room = RedisKeys.ack_for_room(target_id)
-
-        for message_id in message_ids:
-            self.redis.hset(redis_key_user, message_id, str(status))
-            self.redis.sadd(redis_key_room, message_id)
+    def _update_acks_with_status(self, message_ids: list, receiver_id: str, target_id: str, status: int):
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hmset(RedisKeys.ack_for_user(receiver_id), {message_id: str(status) for message_id in message_ids})
+        pipe.sadd(RedisKeys.ack_for_room(target_id), *message_ids)
+        pipe.execute()
 
     def _mark_as_status(self, message_ids: set, receiver_id: str, target_id: str, status: int):
         current_acks = self._get_acks_for(message_ids, receiver_id)
-        to_update = list()
-        to_add = list()
 
-        for message_id in message_ids:
-            if message_id not in current_acks:
-                to_add.append(message_id)
-                continue
-                # don't downgrade status
-            if current_acks.get(message_id) >= status:
-                continue
-            to_update.append(message_id)
+        # don't downgrade status
+        to_update = [
+            message_id for message_id in message_ids
+            if message_id not in current_acks or current_acks[message_id] < status
+        ]
 
         if len(to_update) > 0:
-            self._update_acks_with_status(message_ids, receiver_id, target_id, status)
-        if len(to_add) > 0:
-            self._update_acks_with_status(message_ids, receiver_id, target_id, status)
+            self._update_acks_with_status(to_update, receiver_id, target_id, status)
 
     def get_unacked_history(self, user_id: str) -> list:
         """
@@ -164,8 +305,11 @@ class StorageRedis(object):
     def mark_as_unacked(self, message_id: str, receiver_id: str, target_id: str) -> None:
         self._mark_as_status({message_id}, receiver_id, target_id, AckStatus.NOT_ACKED)
 
-    def get_history_for_time_slice(self, room_id: str, from_time: int, to_time: int) -> list:
+    def get_history_page(
+            self, room_id: str, from_user_id: str, from_time: int, to_time: int, page_size: int,
+            cursor: str=None) -> (list, str):
         raise NotImplementedError()
 
-    def get_unread_history(self, room_id: str, time_stamp: int, limit: int = 100) -> list:
+    def get_undeleted_messages_for_user_and_time_page(
+            self, user_id: str, from_time: int, to_time: int, page_size: int, cursor: str=None) -> (list, str):
         raise NotImplementedError()
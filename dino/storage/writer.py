@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import sys
+import time
+from collections import Counter
+
+import eventlet
+from activitystreams import parse as as_parser
+from activitystreams.models.activity import Activity
+from eventlet.queue import Empty
+from eventlet.queue import LightQueue
+
+from dino import utils
+from dino.config import ConfigKeys
+from dino.utils.spool import Spool
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_SIZE = 10000
+DEFAULT_BATCH_SIZE = 200
+WRITE_RETRIES = 3
+WRITE_RETRY_WAIT = 0.2
+
+# seconds to wait before trying messages again that could not be written even after the retries; doubled for each
+# attempt that fails, up to the max
+FAILED_RETRY_WAIT = 1
+MAX_FAILED_RETRY_WAIT = 60
+
+
+class StorageWriter(object):
+    """
+    Writes messages to the storage behind the broadcast, instead of the sender and the room waiting for the storage
+    before seeing the message.
+
+    Messages are put on a bounded queue and written in batches by a background green thread, using store_messages()
+    on the storage. When the queue is full, store() blocks until there's room, so a slow storage slows down senders
+    instead of using up all memory.
+
+    Messages that still can't be written after the retries are kept and written again, together with the next
+    batch, after a backoff (FAILED_RETRY_WAIT, up to MAX_FAILED_RETRY_WAIT). Messages are only marked as unacked and
+    added to the cached history once they have been written.
+
+    If a spool path is configured, messages are also appended to a local spool before being queued, and are
+    written again after a restart if the process crashed before they were written to the storage. Storing a message
+    is idempotent, so messages written just before a crash being written again is fine.
+    """
+
+    def __init__(
+            self, env, queue_size: int=DEFAULT_QUEUE_SIZE, batch_size: int=DEFAULT_BATCH_SIZE,
+            spool_path: str=None
+    ):
+        self.env = env
+        self.batch_size = batch_size
+        self.queue = LightQueue(maxsize=queue_size)
+        self.write_retry_wait = WRITE_RETRY_WAIT
+
+        # (activity, deleted, segment) that couldn't be written, tried again with the next batch
+        self.failed = list()
+        self.failed_retry_wait = FAILED_RETRY_WAIT
+
+        if not self.env.config.get(ConfigKeys.TESTING, False):
+            eventlet.spawn_n(self.run)
+
+        self.spool = None
+        if spool_path is not None:
+            self.spool = Spool(spool_path, 'storage')
+            self.recover()
+
+    def recover(self) -> None:
+        entries = self.spool.recover()
+        if len(entries) == 0:
+            return
+
+        logger.info('recovering %s unwritten messages from spool' % len(entries))
+        for entry in entries:
+            self.store(entry['data'], as_parser(entry['data']), deleted=entry['deleted'])
+        self.spool.remove_recovered()
+
+    def store(self, data: dict, activity: Activity, deleted: bool=False) -> None:
+        segment = None
+        if self.spool is not None:
+            segment = self.spool.append({'data': data, 'deleted': deleted})
+
+        if self.queue.full():
+            logger.warning('storage write queue is full, waiting for the storage to catch up')
+            self.env.stats.incr('storage.writer.full')
+
+        self.queue.put((activity, deleted, segment))
+
+    def run(self) -> None:
+        while True:
+            batch = self._next_batch()
+
+            try:
+                self.failed = self.write(batch)
+            except Exception as e:
+                logger.error('could not write batch of messages: {}'.format(str(e)))
+                logger.exception(e)
+                self.env.capture_exception(sys.exc_info())
+
+            if len(self.failed) == 0:
+                self.failed_retry_wait = FAILED_RETRY_WAIT
+
+    def _next_batch(self) -> list:
+        if len(self.failed) == 0:
+            batch = [self.queue.get()]
+        else:
+            # give the storage some time to recover before trying again
+            eventlet.sleep(self.failed_retry_wait)
+            self.failed_retry_wait = min(self.failed_retry_wait * 2, MAX_FAILED_RETRY_WAIT)
+            batch, self.failed = self.failed, list()
+
+        batch.extend(self._drain(self.batch_size - len(batch)))
+        return batch
+
+    def flush(self) -> None:
+        """
+        write everything that is queued right now, and try the messages that failed before once more
+        """
+        failed, self.failed = self.failed, list()
+        if len(failed) > 0:
+            self.failed.extend(self.write(failed))
+
+        while not self.queue.empty():
+            self.failed.extend(self.write(self._drain(self.batch_size)))
+
+    def _drain(self, max_size: int) -> list:
+        batch = list()
+        while len(batch) < max_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except Empty:
+                break
+        return batch
+
+    def write(self, batch: list) -> list:
+        """
+        :return: the entries of the batch that could not be written
+        """
+        before = time.time()
+        failed = list()
+
+        for deleted in [False, True]:
+            entries = [entry for entry in batch if entry[1] == deleted]
+            if len(entries) == 0:
+                continue
+
+            if not self._write_with_retries([activity for activity, _, _ in entries], deleted):
+                # still in the spool if enabled, so will be written after a restart if not before
+                failed.extend(entries)
+                continue
+
+            self._written(entries)
+
+        self.env.stats.timing('storage.writer.flush', (time.time() - before) * 1000)
+        self.env.stats.gauge('storage.writer.queue', self.queue.qsize())
+        return failed
+
+    def _written(self, entries: list) -> None:
+        for activity, deleted, _ in entries:
+            try:
+                self.after_write(activity, deleted)
+            except Exception as e:
+                logger.error('could not mark message %s as unacked or cache it: %s' % (activity.id, str(e)))
+                logger.exception(e)
+                self.env.capture_exception(sys.exc_info())
+
+        if self.spool is not None:
+            for segment, n_entries in Counter(segment for _, _, segment in entries).items():
+                self.spool.done(segment, n_entries)
+
+    def after_write(self, activity: Activity, deleted: bool) -> None:
+        utils.mark_as_unacked_for_owners(activity)
+        if not deleted:
+            utils.add_to_recent_history(activity)
+
+    def _write_with_retries(self, activities: list, deleted: bool) -> bool:
+        retry_wait = self.write_retry_wait
+
+        for attempt in range(WRITE_RETRIES + 1):
+            try:
+                self.env.storage.store_messages(activities, deleted=deleted)
+                return True
+            except Exception as e:
+                logger.error('could not store %s messages (attempt %s/%s): %s' % (
+                    len(activities), attempt + 1, WRITE_RETRIES + 1, str(e)))
+                logger.exception(e)
+
+            if attempt < WRITE_RETRIES:
+                eventlet.sleep(retry_wait)
+                retry_wait *= 2
+
+        logger.error('giving up storing messages: %s' % ','.join(activity.id for activity in activities))
+        self.env.stats.incr('storage.writer.failed')
+        return False
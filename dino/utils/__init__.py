@@ -823,6 +823,10 @@ def activity_for_users_in_room(activity: Activity, users_orig: dict) -> dict:
     this_user_id = environ.env.session.get(SessionKeys.user_id.value)
     this_user_is_super_user = is_super_user(this_user_id) or is_global_moderator(this_user_id)
 
+    user_statuses = dict()
+    if this_user_is_super_user:
+        user_statuses = get_user_statuses(list(users.keys()))
+
     for user_id, user_name in users.items():
         user_info = get_user_info_attachments_for(user_id)
         if this_user_is_super_user:
@@ -852,7 +856,7 @@ def activity_for_users_in_room(activity: Activity, users_orig: dict) -> dict:
             'content': ','.join(user_roles),
             'objectType': 'user'
         }
-        if this_user_is_super_user and user_is_invisible(user_id):
+        if this_user_is_super_user and user_statuses.get(user_id) == UserKeys.STATUS_INVISIBLE:
             user_attachment['objectType'] = 'invisible'
 
         response['object']['attachments'].append(user_attachment)
@@ -962,6 +966,40 @@ def get_sids_for_user_id(user_id: str) -> Union[list, None]:
     return environ.env.db.get_sids_for_user(user_id)
 
 
+def get_node_queue_name() -> Union[str, None]:
+    if environ.env.internal_publisher is None:
+        return None
+    return environ.env.internal_publisher.node_queue_name()
+
+
+def set_node_for_sid(sid: str) -> None:
+    node = get_node_queue_name()
+    if node is None or sid is None or len(sid.strip()) == 0:
+        return
+    environ.env.cache.set_node_for_sid(sid, node)
+
+
+def remove_node_for_sid(sid: str) -> None:
+    if sid is None or len(sid.strip()) == 0:
+        return
+    environ.env.cache.remove_node_for_sid(sid)
+
+
+def get_nodes_for_user_id(user_id: str) -> Union[set, None]:
+    """
+    get the nodes the user is connected to, or None if not known for all of the user's sids (or if the user isn't
+    connected at all), in which case events for the user have to be broadcast to all nodes
+    """
+    sids = get_sids_for_user_id(user_id)
+    if sids is None or len(sids) == 0:
+        return None
+
+    nodes = environ.env.cache.get_nodes_for_sids(list(sids))
+    if nodes is None or len(nodes) == 0 or None in nodes:
+        return None
+    return set(nodes)
+
+
 def get_user_for_sid(sid: str) -> Union[str, None]:
     return environ.env.db.get_user_for_sid(sid)
 
@@ -1151,6 +1189,64 @@ def get_owners_for_room(room_id: str) -> dict:
     return environ.env.db.get_owners_room(room_id)
 
 
+def mark_as_unacked_for_owners(activity: Activity) -> None:
+    """
+    with delivery guarantee, a stored private message is unacked until each owner of the room has acked it
+    """
+    if not environ.env.config.get(ConfigKeys.DELIVERY_GUARANTEE, False) or activity.target.object_type != 'private':
+        return
+
+    owners = environ.env.db.get_owners_room(activity.target.id)
+    environ.env.storage.mark_as_read({activity.id}, activity.actor.id, activity.target.id)
+    if owners is None or len(owners) == 0:
+        return
+
+    for receiver_id in owners:
+        if activity.actor.id == receiver_id:
+            continue
+        environ.env.storage.mark_as_unacked(activity.id, receiver_id, activity.target.id)
+
+
+def is_recent_history_cached() -> bool:
+    return environ.env.config.get(ConfigKeys.RECENT_HISTORY_CACHE, domain=ConfigKeys.HISTORY, default=False) and \
+        environ.env.config.get(
+            ConfigKeys.TYPE, domain=ConfigKeys.HISTORY,
+            default=ConfigKeys.DEFAULT_HISTORY_STRATEGY) == ConfigKeys.HISTORY_TYPE_TOP
+
+
+def add_to_recent_history(activity: Activity) -> None:
+    """
+    add a stored message to the cached history of its room, in the same format as the storage returns the history
+    """
+    if not is_recent_history_cached():
+        return
+
+    limit = environ.env.config.get(ConfigKeys.LIMIT, domain=ConfigKeys.HISTORY, default=ConfigKeys.DEFAULT_HISTORY_LIMIT)
+    environ.env.cache.add_to_recent_history(activity.target.id, {
+        'message_id': activity.id,
+        'from_user_id': activity.actor.id,
+        'from_user_name': b64d(activity.actor.display_name),
+        'target_id': activity.target.id,
+        'target_name': activity.target.display_name,
+        'body': b64d(activity.object.content),
+        'domain': activity.target.object_type,
+        'channel_id': activity.object.url,
+        'channel_name': activity.object.display_name,
+        'timestamp': activity.published,
+        'deleted': False
+    }, limit)
+
+
+def remove_recent_history(room_id: str=None) -> None:
+    """
+    remove the cached history of a room after deleting or undeleting messages in it; without a room id the cached
+    history of all rooms is removed
+    """
+    if not is_recent_history_cached():
+        return
+    environ.env.cache.remove_recent_history(room_id)
+
+
 def channel_exists(channel_id: str) -> bool:
     return environ.env.db.channel_exists(channel_id)
 
@@ -1159,6 +1255,10 @@ def get_user_name_for(user_id: str) -> str:
     return environ.env.db.get_user_name(user_id)
 
 
+def get_user_names_for(user_ids: list) -> dict:
+    return environ.env.db.get_user_names(user_ids)
+
+
 def get_channel_name(channel_id: str) -> str:
     return environ.env.db.get_channel_name(channel_id)
 
@@ -1309,7 +1409,18 @@ def get_history_for_room(room_id: str, user_id: str, last_read: str = None) -> l
 
     def _history(_last_read: str = None):
         if history == 'top':
-            return environ.env.storage.get_history(room_id, limit)
+            if not is_recent_history_cached():
+                return environ.env.storage.get_history(room_id, limit)
+
+            messages = environ.env.cache.get_recent_history(room_id, limit)
+            if messages is not None:
+                return messages
+
+            version = environ.env.cache.get_recent_history_version(room_id)
+            messages = environ.env.storage.get_history(room_id, limit)
+            environ.env.cache.set_recent_history(room_id, messages, version, ttl=int(environ.env.config.get(
+                ConfigKeys.RECENT_HISTORY_CACHE_TTL, domain=ConfigKeys.HISTORY, default=ConfigKeys.DEFAULT_RECENT_HISTORY_CACHE_TTL)))
+            return messages
 
         if _last_read is None:
             _last_read = get_last_read_for(room_id, user_id)
@@ -1361,6 +1472,11 @@ def get_user_status(user_id: str, skip_cache: bool = False) -> str:
     return str(environ.env.db.get_user_status(user_id, skip_cache))
 
 
+def get_user_statuses(user_ids: list, skip_cache: bool = False) -> dict:
+    statuses = environ.env.db.get_user_statuses(user_ids, skip_cache)
+    return {user_id: str(status) for user_id, status in statuses.items()}
+
+
 def get_last_read_for(room_id: str, user_id: str) -> str:
     return environ.env.db.get_last_read_timestamp(room_id, user_id)
 
@@ -1377,8 +1493,7 @@ def update_last_reads(room_id: str) -> None:
     users_in_room = get_users_in_room(room_id)
     online_users_in_room = set()
 
-    for user_id, _ in users_in_room.items():
-        status = get_user_status(user_id)
+    for user_id, status in get_user_statuses(list(users_in_room.keys())).items():
         if status in [None, UserKeys.STATUS_UNAVAILABLE, UserKeys.STATUS_UNKNOWN]:
             continue
 
@@ -14,73 +14,206 @@ import logging
 import traceback
 import time
 
+from collections import deque
+
+import eventlet
 from activitystreams.models.activity import Activity
 
 from dino import utils
+from dino.config import ConfigKeys
 
 __author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
 
 logger = logging.getLogger(__name__)
 
+# rebuild the automaton when this many words have been added or removed since it was built
+REBUILD_AFTER_N_CHANGES = 500
+
+# let other greenlets run every this many words while building the automaton
+BUILD_YIELD_EVERY_N_WORDS = 1000
+
+
+class WordMatcher(object):
+    """
+    Aho-Corasick automaton for checking if any of a set of words occur anywhere in a text, in a single pass over the
+    text no matter how many words there are
+    """
+
+    def __init__(self, words, yield_every: int = None):
+        self.words = frozenset(words)
+
+        # node -> {char: child node}, node -> node of the longest proper suffix in the trie, and node -> whether a
+        # word ends on this node or on any of its suffixes
+        self.goto = [dict()]
+        self.fail = [0]
+        self.terminal = [False]
+
+        self._build(yield_every)
+
+    def _build(self, yield_every: int = None) -> None:
+        goto, fail, terminal = self.goto, self.fail, self.terminal
+
+        for i, word in enumerate(self.words):
+            node = 0
+            for c in word:
+                child = goto[node].get(c)
+                if child is None:
+                    child = len(goto)
+                    goto.append(dict())
+                    fail.append(0)
+                    terminal.append(False)
+                    goto[node][c] = child
+                node = child
+            terminal[node] = True
+
+            if yield_every is not None and i % yield_every == 0:
+                eventlet.sleep(0)
+
+        # breadth first, so the suffix of a node is always done before the node itself
+        queue = deque(goto[0].values())
+        while len(queue) > 0:
+            node = queue.popleft()
+            for c, child in goto[node].items():
+                suffix = fail[node]
+                while suffix > 0 and c not in goto[suffix]:
+                    suffix = fail[suffix]
+
+                suffix = goto[suffix].get(c, 0)
+                fail[child] = suffix if suffix != child else 0
+                terminal[child] = terminal[child] or terminal[fail[child]]
+                queue.append(child)
+
+    def contains_any(self, text: str) -> bool:
+        goto, fail, terminal = self.goto, self.fail, self.terminal
+        if terminal[0]:
+            return True  # the empty string
+
+        node = 0
+        for c in text:
+            while node > 0 and c not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(c, 0)
+            if terminal[node]:
+                return True
+        return False
+
 
 class BlackListChecker(object):
     """
-    Check if a blacklisted word is used in a message. Here the check is implemented in this way:
+    Check if a blacklisted word is used in a message. A blacklisted word, e.g. 'the donald', might be blacklisted, but
+    individual words like 'the' and 'donald' might not be, so the check has to be done as:
 
         contains_forbidden_word = any(
             word in message
             for word in blacklist
         )
 
-    ...since a blacklisted work, e.g. 'the donald', might be blacklisted, but individual words like 'the' and 'donald'
-    might not be. So the following (faster) way:
+    ...which is O(|blacklist| * |message|). Instead, a WordMatcher (Aho-Corasick automaton) is built for the
+    blacklist, which checks a message in one pass no matter the size of the blacklist. Only when it finds a match is
+    the blacklist scanned to return the matched word, so the returned word is the same as before.
 
-        contains_forbidden_word = any(
-            word in blacklist
-            for word in message.split()
-        )
-        if not contains_forbidden_word:
-            return None
+    Building the automaton for a large blacklist takes a while, so it's built in the background, and until it's ready
+    the linear scan is used. When the blacklist changes, the added words are checked with a linear scan and removed
+    words can only cause the (exact) full check to run, until enough words have changed to rebuild the automaton.
+    Changes are noticed by the version of the blacklist in the cache, so the blacklist is only compared to the words
+    of the automaton when it has changed, instead of for every message.
 
-    ...shouldn't be done here. On the other hand it can help as a 'shortcut' if the blacklist is large enough, e.g.:
+    Results from bin/benchmark_blacklist.py, where few messages contain a blacklisted word:
 
-        contains_partly_forbidden_word = any(
-            word in blacklist
-            for word in message.split()
-        )
-        if not contains_partly_forbidden_word:
-            return None
-
-    ...and then do the full, slower check:
+        words: 1000, messages: 2000, avg. message length: 89
+        [linear] avg time: 0.1346ms
+        [matcher] avg time: 0.0134ms, built in 0.01s
 
-        contains_real_forbidden_word = any(
-            word in message
-            for word in blacklist
-        )
-        if not contains_real_forbidden_word:
-            return None
+        words: 59998, messages: 2000, avg. message length: 89
+        [linear] avg time: 10.3603ms
+        [matcher] avg time: 0.0449ms, built in 1.16s
 
-    Since if 'the donald' is blocked, then so would 'donald'. So if 'donald' matches then we can check if 'the donald'
-    matches'.
-
-    The first partial check is around 20x faster in tests. Cuckoo filters weren't really effective until blacklist size
-    exceeded ~60k entries:
-
-        length of blacklist: 60000, messages to check: 1000000, word length: 25487
-        [cuckoo] done in 24.35s, avg time: 0.0243ms
-        [regular] done in 82.57s, avg time: 0.0826ms
-        [partial] done in 3.34s, avg time: 0.0033ms
+        words: 199983, messages: 2000, avg. message length: 89
+        [linear] avg time: 53.8487ms
+        [matcher] avg time: 0.0610ms, built in 6.82s
     """
 
     def __init__(self, env):
         self.env = env
+        self.matcher = None
+        self.building = False
+
+        # the last seen blacklist and its version, and the difference between it and the words the matcher was built for
+        self.blacklist = None
+        self.version = None
+        self.added = set()
+        self.removed = set()
 
     def _get_black_list(self):
         # cached in db object
         return self.env.db.get_black_list()
 
+    def _get_black_list_version(self):
+        return self.env.cache.get_black_list_version()
+
+    def _update_matcher(self, blacklist, version) -> None:
+        # without a version (e.g. the cache is unavailable), always compare with the words of the matcher
+        if version is not None and version == self.version and self.blacklist is not None:
+            return
+
+        self.blacklist = blacklist
+        self.version = version
+
+        if self.matcher is None:
+            self._rebuild()
+            return
+
+        self.added = blacklist - self.matcher.words
+        self.removed = self.matcher.words - blacklist
+
+        if len(self.added) + len(self.removed) >= REBUILD_AFTER_N_CHANGES:
+            self._rebuild()
+
+    def _rebuild(self) -> None:
+        if self.building:
+            return
+
+        self.building = True
+        if self.env.config.get(ConfigKeys.TESTING, False):
+            self._build_matcher(frozenset(self.blacklist))
+        else:
+            eventlet.spawn_n(self._build_matcher, frozenset(self.blacklist))
+
+    def _build_matcher(self, words: frozenset) -> None:
+        try:
+            start = time.time()
+            matcher = WordMatcher(words, yield_every=BUILD_YIELD_EVERY_N_WORDS)
+            logger.info('built blacklist matcher for {} words in {:.2f}s'.format(len(words), time.time() - start))
+        except Exception as e:
+            logger.error('could not build blacklist matcher: {}'.format(str(e)))
+            logger.exception(traceback.format_exc())
+            return
+        finally:
+            self.building = False
+
+        self.matcher = matcher
+
+        # the blacklist might have changed while building
+        self.added = self.blacklist - matcher.words
+        self.removed = matcher.words - self.blacklist
+
+    def _might_contain_blacklisted_word(self, message: str, blacklist, version) -> bool:
+        self._update_matcher(blacklist, version)
+
+        if self.matcher is None:
+            return any(
+                word in message
+                for word in blacklist
+            )
+
+        # removed words might give false positives, but the full check will ignore those
+        return any(word in message for word in self.added) or self.matcher.contains_any(message)
+
     def _contains_blacklisted_word(self, activity: Activity):
         message = activity.object.content
+
+        # read the version first, so a change in between is noticed on the next message
+        version = self._get_black_list_version()
         blacklist = self._get_black_list()
 
         if blacklist is None or len(blacklist) == 0:
@@ -88,12 +221,7 @@ class BlackListChecker(object):
         if message is not None and len(message) > 0:
             message = utils.b64d(message).lower()
 
-        contains_forbidden_word = any(
-            word in message
-            for word in blacklist
-        )
-
-        if not contains_forbidden_word:
+        if not self._might_contain_blacklisted_word(message, blacklist, version):
             return None
 
         for word in blacklist:
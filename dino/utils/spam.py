@@ -1,9 +1,6 @@
-import os
 import logging
 
-from scipy import sparse
-from sklearn.externals import joblib
-
+from dino.config import ConfigKeys
 from dino.utils import suppress_stdout_stderr
 from dino.environ import GNEnvironment
 from dino.utils.decorators import timeit
@@ -16,6 +13,8 @@ logger = logging.getLogger(__name__)
 class SpamClassifier(object):
     def __init__(self, env: GNEnvironment, skip_loading: bool=False):
         self.env = env
+        self.models = None
+        self.batcher = None
 
         if skip_loading:
             return
@@ -24,40 +23,39 @@ class SpamClassifier(object):
         if root_path == '':
             root_path = '.'
 
-        logger.info('loading TF-IDF and PCA transformers...')
-        with suppress_stdout_stderr():
-            self.tfidf_char = joblib.load(root_path + '/models/transformer_1a.pkl')
-            self.tfidf_word = joblib.load(root_path + '/models/transformer_1b.pkl')
-            self.pca = joblib.load(root_path + '/models/transformer_2.pkl')
+        n_workers = int(env.config.get(ConfigKeys.SPAM_WORKERS, default=0))
+
+        # with workers, the models are only loaded in the worker processes, and messages are predicted in batches
+        if n_workers > 0:
+            from dino.spam.pool import SpamBatcher
+            from dino.spam.pool import SpamWorker
+            from dino.spam.pool import DEFAULT_BATCH_SIZE
+            from dino.spam.pool import DEFAULT_BATCH_WAIT
+            from dino.spam.pool import DEFAULT_TIMEOUT
+
+            logger.info('starting {} spam workers'.format(n_workers))
+            self.batcher = SpamBatcher(
+                env,
+                [SpamWorker(root_path) for _ in range(n_workers)],
+                batch_size=int(env.config.get(ConfigKeys.SPAM_BATCH_SIZE, default=DEFAULT_BATCH_SIZE)),
+                batch_wait=float(env.config.get(ConfigKeys.SPAM_BATCH_WAIT, default=DEFAULT_BATCH_WAIT)),
+                timeout=float(env.config.get(ConfigKeys.SPAM_TIMEOUT, default=DEFAULT_TIMEOUT))
+            )
+            return
 
-        logger.info('loading models...')
+        from dino.spam.models import SpamModels
         with suppress_stdout_stderr():
-            self.xgb = joblib.load(root_path + '/models/classifier_1.pkl')
-            self.rfc = joblib.load(root_path + '/models/classifier_2.pkl')
-            self.svc = joblib.load(root_path + '/models/classifier_3.pkl')
-
-        size = (
-            os.path.getsize(root_path + '/models/transformer_1a.pkl') +
-            os.path.getsize(root_path + '/models/transformer_1b.pkl') +
-            os.path.getsize(root_path + '/models/transformer_2.pkl') +
-            os.path.getsize(root_path + '/models/classifier_1.pkl') +
-            os.path.getsize(root_path + '/models/classifier_2.pkl') +
-            os.path.getsize(root_path + '/models/classifier_3.pkl')
-        )
-        logger.info('done loading, memory size: {} MB'.format('%.2f' % (size / 1024 / 1024)))
+            self.models = SpamModels(root_path)
 
     @timeit(logger, 'on_transform')
     def transform(self, x):
-        x = sparse.hstack((self.tfidf_char.transform(x), self.tfidf_word.transform(x))).A
-        return self.pca.transform(x)
+        return self.models.transform(x)
 
     @timeit(logger, 'on_predict')
     def predict(self, x):
-        y_hat = (
-            self.xgb.predict_proba(x)[0][1],
-            self.rfc.predict_proba(x)[0][1],
-            self.svc.predict(x)[0]
-        )
+        return self.classify(self.models.predict(x)[0])
+
+    def classify(self, y_hat: tuple) -> (int, tuple):
         logger.info('y_hat: {}'.format(y_hat))
         threshold = float(self.env.service_config.get_spam_threshold()) / 100
 
@@ -69,6 +67,13 @@ class SpamClassifier(object):
             return False, None
 
         logger.info('prediction message: {}'.format(message))
+
+        if self.batcher is not None:
+            y_hat = self.batcher.predict(message)
+            if y_hat is None:
+                return False, None
+            return self.classify(y_hat)
+
         x = self.transform([message])
         return self.predict(x)
 
@@ -0,0 +1,141 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import logging
+import os
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SEGMENT_SIZE = 1000
+
+
+class Spool(object):
+    """
+    An append-only local spool of json entries, so entries that are only kept in memory while waiting to be handled
+    aren't lost if the process crashes.
+
+    Entries are appended to segment files of at most segment_size entries. When every entry in a (full) segment has
+    been marked as done, the segment file is removed. After a restart, the entries in the segments that are left are
+    returned by recover(); they might have been handled already before the crash, so handling them has to be
+    idempotent.
+    """
+
+    def __init__(self, path: str, name: str, segment_size: int=DEFAULT_SEGMENT_SIZE):
+        self.path = path
+        self.name = name
+        self.segment_size = segment_size
+
+        # segment number => number of entries in the segment that are not done yet
+        self.pending = dict()
+
+        self.file = None
+        self.segment = None
+        self.n_in_segment = 0
+
+        os.makedirs(self.path, exist_ok=True)
+        self.old_segments = sorted(self._existing_segments())
+        self.next_segment = self.old_segments[-1] + 1 if len(self.old_segments) > 0 else 0
+
+    def recover(self) -> list:
+        """
+        :return: the entries left in the spool from before a restart
+        """
+        entries = list()
+        for segment in self.old_segments:
+            with open(self._segment_path(segment), 'r') as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        # the last line might only be partially written if the process crashed while writing it
+                        logger.warning('ignoring invalid line in spool segment %s: %s' % (segment, line))
+        return entries
+
+    def remove_recovered(self) -> None:
+        """
+        remove the segments from before a restart; call after the recovered entries have been appended again
+        """
+        for segment in self.old_segments:
+            os.remove(self._segment_path(segment))
+        self.old_segments = list()
+
+    def append(self, entry) -> int:
+        """
+        :return: the segment the entry was written to, to pass to done() when the entry has been handled
+        """
+        if self.file is None or self.n_in_segment >= self.segment_size:
+            self._rotate()
+
+        self.file.write(json.dumps(entry) + '\n')
+        self.file.flush()
+
+        self.n_in_segment += 1
+        self.pending[self.segment] += 1
+        return self.segment
+
+    def sync(self) -> None:
+        """
+        append() only flushes to the os; call this to also have the entries written so far survive a power loss
+        """
+        if self.file is not None:
+            os.fsync(self.file.fileno())
+
+    def done(self, segment: int, n_entries: int=1) -> None:
+        self.pending[segment] -= n_entries
+        self._remove_if_done(segment)
+
+    def _rotate(self) -> None:
+        previous = self.segment
+        if self.file is not None:
+            self.file.close()
+
+        self.segment = self.next_segment
+        self.next_segment += 1
+        self.n_in_segment = 0
+        self.pending[self.segment] = 0
+        self.file = open(self._segment_path(self.segment), 'a')
+
+        if previous is not None:
+            self._remove_if_done(previous)
+
+    def _remove_if_done(self, segment: int) -> None:
+        if self.pending.get(segment) != 0:
+            return
+
+        # when everything in the current segment is done, start on a new one on the next append
+        if segment == self.segment:
+            self.file.close()
+            self.file = None
+            self.segment = None
+
+        del self.pending[segment]
+        os.remove(self._segment_path(segment))
+
+    def _existing_segments(self) -> list:
+        prefix = self.name + '.'
+        segments = list()
+
+        for file_name in os.listdir(self.path):
+            if not file_name.startswith(prefix) or not file_name.endswith('.spool'):
+                continue
+            try:
+                segments.append(int(file_name[len(prefix):-len('.spool')]))
+            except ValueError:
+                continue
+
+        return segments
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.path, '%s.%010d.spool' % (self.name, segment))
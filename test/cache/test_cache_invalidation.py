@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from unittest import TestCase
+
+from dino.cache.redis import CacheRedis
+from dino.config import RedisKeys
+from dino.config import UserKeys
+from dino.environ import ConfigDict
+from dino.environ import ConfigKeys
+from dino.environ import GNEnvironment
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+
+class CacheInvalidationTest(TestCase):
+    class FakeEnv(GNEnvironment):
+        def __init__(self):
+            super(CacheInvalidationTest.FakeEnv, self).__init__(None, ConfigDict(), skip_init=True)
+            self.config = ConfigDict()
+            self.config.set(ConfigKeys.TESTING, True)
+            self.config.set(ConfigKeys.INVALIDATION_HOST, 'mock', domain=ConfigKeys.CACHE_SERVICE)
+            self.cache = CacheRedis(self, 'mock')
+
+    USER_ID = '8888'
+    ROOM_ID = '4321'
+    CHANNEL_ID = '1234'
+
+    def setUp(self):
+        self.worker_a = CacheInvalidationTest.FakeEnv().cache
+        self.worker_b = CacheInvalidationTest.FakeEnv().cache
+        self.worker_a._flushall()
+
+        # fakeredis only delivers messages published on the same instance
+        self.worker_b.invalidation.redis = self.worker_a.invalidation.redis
+        self.pubsub = self.worker_a.invalidation.redis.pubsub(ignore_subscribe_messages=True)
+        self.pubsub.subscribe(self.worker_a.invalidation.channel)
+        self.pubsub.get_message()  # the subscribe confirmation
+
+    def deliver(self) -> int:
+        n_messages = 0
+        while True:
+            message = self.pubsub.get_message()
+            if message is None:
+                break
+            if message['type'] != 'message':
+                continue
+
+            n_messages += 1
+            self.worker_a.invalidation.on_message(message['data'])
+            self.worker_b.invalidation.on_message(message['data'])
+        return n_messages
+
+    def test_rename_room_evicts_other_worker(self):
+        self.worker_a.set_room_name(CacheInvalidationTest.ROOM_ID, 'old')
+        self.assertEqual('old', self.worker_b.get_room_name(CacheInvalidationTest.ROOM_ID))
+
+        self.worker_a.set_room_name(CacheInvalidationTest.ROOM_ID, 'new')
+        self.assertEqual(1, self.deliver())
+        self.assertEqual('new', self.worker_b.get_room_name(CacheInvalidationTest.ROOM_ID))
+        self.assertEqual('new', self.worker_a.get_room_name(CacheInvalidationTest.ROOM_ID))
+
+    def test_populating_cache_does_not_broadcast(self):
+        self.worker_a.set_room_name(CacheInvalidationTest.ROOM_ID, 'name')
+        self.worker_b.set_room_name(CacheInvalidationTest.ROOM_ID, 'name')
+        self.assertEqual(0, self.deliver())
+
+    def test_populating_black_list_does_not_broadcast(self):
+        self.worker_a.set_black_list({'badword'})
+        self.worker_b.set_black_list({'badword'})
+        self.assertEqual(0, self.deliver())
+
+    def test_add_to_black_list_evicts_other_worker(self):
+        self.worker_a.set_black_list({'badword'})
+        self.assertEqual({'badword'}, self.worker_b.get_black_list())
+
+        self.worker_a.add_to_black_list('newword')
+        self.assertLess(0, self.deliver())
+        self.assertEqual({'badword', 'newword'}, self.worker_b.get_black_list())
+
+    def test_reset_user_roles_evicts_other_worker(self):
+        self.worker_a.set_user_roles(CacheInvalidationTest.USER_ID, {'global': ['superuser']})
+        self.assertEqual({'global': ['superuser']}, self.worker_b.get_user_roles(CacheInvalidationTest.USER_ID))
+
+        self.worker_a.reset_user_roles(CacheInvalidationTest.USER_ID)
+        self.deliver()
+        self.assertIsNone(self.worker_b.get_user_roles(CacheInvalidationTest.USER_ID))
+
+    def test_ban_evicts_other_worker(self):
+        self.worker_a.set_global_ban_timestamp(CacheInvalidationTest.USER_ID, '', '', '')
+        self.assertEqual(['', '', ''], self.worker_b.get_global_ban_timestamp(CacheInvalidationTest.USER_ID))
+
+        self.worker_a.set_global_ban_timestamp(CacheInvalidationTest.USER_ID, '5m', '2016-01-01', 'batman')
+        self.deliver()
+        self.assertEqual(
+            ['5m', '2016-01-01', 'batman'], self.worker_b.get_global_ban_timestamp(CacheInvalidationTest.USER_ID))
+
+    def test_presence_change_evicts_status(self):
+        self.worker_a.set_user_online(CacheInvalidationTest.USER_ID)
+        self.assertEqual({
+            CacheInvalidationTest.USER_ID: UserKeys.STATUS_AVAILABLE
+        }, self.worker_b.get_user_statuses([CacheInvalidationTest.USER_ID]))
+
+        self.worker_a.set_user_invisible(CacheInvalidationTest.USER_ID)
+        self.deliver()
+        self.assertEqual({
+            CacheInvalidationTest.USER_ID: UserKeys.STATUS_INVISIBLE
+        }, self.worker_b.get_user_statuses([CacheInvalidationTest.USER_ID]))
+
+    def test_own_messages_are_ignored(self):
+        self.worker_a.set_room_name(CacheInvalidationTest.ROOM_ID, 'old')
+        self.worker_a.set_room_name(CacheInvalidationTest.ROOM_ID, 'new')
+        self.deliver()
+
+        cache_key = '%s-%s-name' % (RedisKeys.room_name_for_id(), CacheInvalidationTest.ROOM_ID)
+        self.assertEqual('new', self.worker_a.cache.get(cache_key))
+
+    def test_remove_room_evicts_channel_for_room(self):
+        self.worker_a.set_channel_for_room(CacheInvalidationTest.CHANNEL_ID, CacheInvalidationTest.ROOM_ID)
+        self.assertEqual(
+            CacheInvalidationTest.CHANNEL_ID, self.worker_b.get_channel_for_room(CacheInvalidationTest.ROOM_ID))
+
+        self.worker_a.remove_room_exists(CacheInvalidationTest.CHANNEL_ID, CacheInvalidationTest.ROOM_ID)
+        self.deliver()
+        self.assertIsNone(self.worker_b.get_channel_for_room(CacheInvalidationTest.ROOM_ID))
+
+    def test_slow_changing_values_are_kept_longer(self):
+        self.assertGreaterEqual(self.worker_a._slow_ttl(), self.worker_a.invalidation_ttl)
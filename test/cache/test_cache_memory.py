@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from unittest import TestCase
+
+from dino.cache.memory import MemoryCache
+from dino.cache.memory import family_of
+from dino.stats.statsd import MockStatsd
+
+import time
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+
+class MemoryCacheTest(TestCase):
+    class FakeEnv(object):
+        def __init__(self):
+            self.stats = MockStatsd()
+
+    def setUp(self):
+        self.env = MemoryCacheTest.FakeEnv()
+        self.cache = MemoryCache(self.env, max_size=3)
+
+    def test_get_not_expired(self):
+        self.cache.set('foo', 'bar')
+        self.assertEqual('bar', self.cache.get('foo'))
+
+    def test_get_expired(self):
+        self.cache.set('foo', 'bar', ttl=0.1)
+        time.sleep(0.15)
+        self.assertIsNone(self.cache.get('foo'))
+        self.assertEqual(0, len(self.cache.vals))
+
+    def test_evicts_least_recently_used(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.set('c', 3)
+        self.cache.get('a')
+        self.cache.set('d', 4)
+
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(1, self.cache.get('a'))
+        self.assertEqual(3, self.cache.get('c'))
+        self.assertEqual(4, self.cache.get('d'))
+
+    def test_overwrite_does_not_evict(self):
+        for _ in range(5):
+            self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.set('c', 3)
+        self.assertEqual(1, self.cache.get('a'))
+
+    def test_byte_budget(self):
+        cache = MemoryCache(self.env, max_size=None, max_bytes=1000)
+        for i in range(100):
+            cache.set('key-%s' % i, 'x' * 100)
+
+        self.assertLessEqual(cache.n_bytes, 1000)
+        self.assertLess(len(cache.vals), 100)
+        self.assertIsNotNone(cache.get('key-99'))
+
+    def test_delete_updates_byte_count(self):
+        cache = MemoryCache(self.env, max_bytes=10000)
+        cache.set('foo', 'bar')
+        cache.delete('foo')
+        self.assertEqual(0, cache.n_bytes)
+
+    def test_sweep_removes_expired(self):
+        self.cache.set('a', 1, ttl=0.05)
+        self.cache.set('b', 2)
+        time.sleep(0.1)
+
+        self.assertEqual(1, self.cache.sweep())
+        self.assertEqual(['b'], list(self.cache.vals.keys()))
+
+    def test_report_stats_per_family(self):
+        self.cache.set('user:status:1', '1')
+        self.cache.get('user:status:1')
+        self.cache.get('user:status:2')
+        self.cache.set('a', 1)
+        self.cache.set('b', 1)
+        self.cache.set('c', 1)
+        self.cache.report_stats()
+
+        self.assertEqual(1, self.env.stats.vals['cache.memory.user.status.hits'])
+        self.assertEqual(1, self.env.stats.vals['cache.memory.user.status.misses'])
+        self.assertEqual(1, self.env.stats.vals['cache.memory.user.status.evictions'])
+        self.assertEqual(3, self.env.stats.vals['cache.memory.size'])
+        self.assertEqual(0, len(self.cache.hits))
+
+    def test_family_of(self):
+        self.assertEqual('room.names', family_of('room:names-1234-name'))
+        self.assertEqual('users.banned', family_of('users:banned:global-1234'))
+        self.assertEqual('foo', family_of('foo'))
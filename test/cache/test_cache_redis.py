@@ -16,6 +16,7 @@ from unittest import TestCase
 from dino.environ import GNEnvironment, ConfigDict, ConfigKeys
 from dino.cache.redis import CacheRedis
 from dino.config import RedisKeys
+from dino.config import UserKeys
 from datetime import datetime, timedelta
 
 import time
@@ -49,6 +50,78 @@ class CacheRedisTest(TestCase):
         self.cache.set_user_status(CacheRedisTest.USER_ID, '1')
         self.assertEqual('1', self.cache.get_user_status(CacheRedisTest.USER_ID))
 
+    def test_get_user_statuses(self):
+        self.cache.set_user_status(CacheRedisTest.USER_ID, '1')
+        self.cache.set_user_status('1234', '3')
+        self.cache.cache.flushall()
+
+        statuses = self.cache.get_user_statuses([CacheRedisTest.USER_ID, '1234', '5678'])
+        self.assertEqual({CacheRedisTest.USER_ID: '1', '1234': '3'}, statuses)
+
+    def test_get_user_statuses_prefers_memory_cache(self):
+        self.cache.set_user_status(CacheRedisTest.USER_ID, '1')
+        self.cache.redis.delete(RedisKeys.user_status(CacheRedisTest.USER_ID))
+        self.assertEqual({CacheRedisTest.USER_ID: '1'}, self.cache.get_user_statuses([CacheRedisTest.USER_ID]))
+
+    def test_set_user_statuses(self):
+        self.cache.set_user_statuses({CacheRedisTest.USER_ID: '1', '1234': '3'})
+        self.assertEqual('1', self.cache.get_user_status(CacheRedisTest.USER_ID))
+        self.assertEqual('3', self.cache.get_user_status('1234'))
+
+    def test_set_user_online(self):
+        self.cache.set_user_online(CacheRedisTest.USER_ID)
+        self.assertTrue(self.cache.user_is_online(CacheRedisTest.USER_ID))
+        self.assertTrue(self.cache.user_is_in_multicast(CacheRedisTest.USER_ID))
+        self.assertEqual(1, self.cache.redis.getbit(RedisKeys.online_bitmap(), int(CacheRedisTest.USER_ID)))
+        self.assertTrue(self.cache.redis.sismember(RedisKeys.online_set(), CacheRedisTest.USER_ID))
+
+    def test_set_user_invisible(self):
+        self.cache.set_user_online(CacheRedisTest.USER_ID)
+        self.cache.set_user_invisible(CacheRedisTest.USER_ID)
+        self.assertTrue(self.cache.user_is_invisible(CacheRedisTest.USER_ID))
+        self.assertTrue(self.cache.user_is_in_multicast(CacheRedisTest.USER_ID))
+        self.assertEqual(0, self.cache.redis.getbit(RedisKeys.online_bitmap(), int(CacheRedisTest.USER_ID)))
+        self.assertFalse(self.cache.redis.sismember(RedisKeys.online_set(), CacheRedisTest.USER_ID))
+
+    def test_set_users_online_and_offline(self):
+        user_ids = [str(user_id) for user_id in range(1000, 1700)]
+        self.cache.set_users_online(user_ids)
+        self.assertEqual(len(user_ids), self.cache.redis.scard(RedisKeys.online_set()))
+        self.assertEqual(len(user_ids), self.cache.redis.bitcount(RedisKeys.online_bitmap()))
+        self.assertEqual(
+            {user_id: UserKeys.STATUS_AVAILABLE for user_id in user_ids},
+            self.cache.get_user_statuses(user_ids))
+
+        self.cache.set_users_offline(user_ids)
+        self.assertEqual(0, self.cache.redis.scard(RedisKeys.online_set()))
+        self.assertEqual(0, self.cache.redis.scard(RedisKeys.users_multi_cast()))
+        self.assertEqual(0, self.cache.redis.bitcount(RedisKeys.online_bitmap()))
+        self.assertTrue(self.cache.user_is_offline(user_ids[0]))
+
+    def test_set_users_invisible(self):
+        self.cache.set_users_invisible([CacheRedisTest.USER_ID, '1234'])
+        self.assertTrue(self.cache.user_is_invisible(CacheRedisTest.USER_ID))
+        self.assertTrue(self.cache.user_is_invisible('1234'))
+        self.assertEqual(2, self.cache.redis.scard(RedisKeys.users_multi_cast()))
+
+    def test_get_user_names(self):
+        self.cache.set_user_name(CacheRedisTest.USER_ID, CacheRedisTest.USER_NAME)
+        self.cache.set_user_names({'1234': 'Robin'})
+        self.cache.cache.flushall()
+
+        self.assertEqual(
+            {CacheRedisTest.USER_ID: CacheRedisTest.USER_NAME, '1234': 'Robin'},
+            self.cache.get_user_names([CacheRedisTest.USER_ID, '1234', '5678']))
+
+    def test_check_heartbeats(self):
+        self.cache.add_heartbeat(CacheRedisTest.USER_ID)
+        self.cache.add_heartbeat('1234')
+        self.cache.redis.expire(RedisKeys.heartbeat_user('1234'), 5)
+
+        self.assertEqual({CacheRedisTest.USER_ID, '1234'}, self.cache.check_heartbeats(
+            [CacheRedisTest.USER_ID, '1234', '5678']))
+        self.assertLess(5, self.cache.redis.ttl(RedisKeys.heartbeat_user('1234')))
+
     def test_user_check_status(self):
         self.assertFalse(self.cache.user_check_status(CacheRedisTest.USER_ID, '1'))
         self.cache.set_user_status(CacheRedisTest.USER_ID, '1')
@@ -155,3 +228,147 @@ class CacheRedisTest(TestCase):
         self.cache._del(key)
 
         self.assertEqual('1', self.cache.get_user_status(CacheRedisTest.USER_ID))
+
+    def message(self, message_id: str) -> dict:
+        return {'message_id': message_id, 'target_id': CacheRedisTest.ROOM_ID, 'body': 'hi', 'deleted': False}
+
+    def cache_recent_history(self, message_ids: list) -> None:
+        version = self.cache.get_recent_history_version(CacheRedisTest.ROOM_ID)
+        self.cache.set_recent_history(CacheRedisTest.ROOM_ID, [self.message(i) for i in message_ids], version)
+
+    def recent_history_ids(self, limit: int=3):
+        messages = self.cache.get_recent_history(CacheRedisTest.ROOM_ID, limit)
+        if messages is None:
+            return None
+        return [message['message_id'] for message in messages]
+
+    def test_recent_history_not_cached(self):
+        self.assertIsNone(self.cache.get_recent_history(CacheRedisTest.ROOM_ID, 3))
+
+    def test_recent_history_empty_room(self):
+        self.cache_recent_history([])
+        self.assertEqual([], self.recent_history_ids())
+
+    def test_recent_history_added_to(self):
+        self.cache_recent_history(['2', '1'])
+        self.cache.add_to_recent_history(CacheRedisTest.ROOM_ID, self.message('3'), 3)
+        self.assertEqual(['3', '2', '1'], self.recent_history_ids())
+
+        self.cache.add_to_recent_history(CacheRedisTest.ROOM_ID, self.message('4'), 3)
+        self.assertEqual(['4', '3', '2'], self.recent_history_ids())
+
+    def test_recent_history_not_added_to_if_not_cached(self):
+        self.cache.add_to_recent_history(CacheRedisTest.ROOM_ID, self.message('1'), 3)
+        self.assertIsNone(self.recent_history_ids())
+
+    def test_recent_history_not_cached_if_added_to_while_reading(self):
+        version = self.cache.get_recent_history_version(CacheRedisTest.ROOM_ID)
+        self.cache.add_to_recent_history(CacheRedisTest.ROOM_ID, self.message('2'), 3)
+
+        self.cache.set_recent_history(CacheRedisTest.ROOM_ID, [self.message('1')], version)
+        self.assertIsNone(self.recent_history_ids())
+
+    def test_recent_history_not_cached_if_added_to_while_writing(self):
+        version = self.cache.get_recent_history_version(CacheRedisTest.ROOM_ID)
+        self.cache_recent_history(['1'])
+        pipeline = self.cache.redis.pipeline
+        cache = self.cache
+
+        def pipeline_adding_message(*args, **kwargs):
+            pipe = pipeline(*args, **kwargs)
+            multi = pipe.multi
+
+            def add_then_multi():
+                # after the version has been checked, before the history is written
+                cache.add_to_recent_history(CacheRedisTest.ROOM_ID, self.message('2'), 3)
+                multi()
+
+            pipe.multi = add_then_multi
+            return pipe
+
+        self.cache.redis.pipeline = pipeline_adding_message
+        try:
+            self.cache.set_recent_history(CacheRedisTest.ROOM_ID, [self.message('0')], version)
+        finally:
+            self.cache.redis.pipeline = pipeline
+
+        self.assertEqual(['2', '1'], self.recent_history_ids())
+
+    def test_remove_recent_history_for_room(self):
+        self.cache_recent_history(['1'])
+        self.cache.remove_recent_history(CacheRedisTest.ROOM_ID)
+        self.assertIsNone(self.recent_history_ids())
+
+    def test_remove_recent_history_for_all_rooms(self):
+        self.cache_recent_history(['1'])
+        self.cache.remove_recent_history()
+        self.assertIsNone(self.recent_history_ids())
+
+        self.cache_recent_history(['2'])
+        self.assertEqual(['2'], self.recent_history_ids())
+
+    def test_recent_history_not_cached_if_all_removed_while_reading(self):
+        version = self.cache.get_recent_history_version(CacheRedisTest.ROOM_ID)
+        self.cache.remove_recent_history()
+
+        self.cache.set_recent_history(CacheRedisTest.ROOM_ID, [self.message('1')], version)
+        self.assertIsNone(self.recent_history_ids())
+
+    def test_get_nodes_for_unknown_sids(self):
+        self.assertEqual([None, None], self.cache.get_nodes_for_sids(['sid-1', 'sid-2']))
+
+    def test_get_nodes_for_sids(self):
+        self.cache.set_node_for_sid('sid-1', 'node-a')
+        self.cache.set_node_for_sid('sid-2', 'node-b')
+        self.assertEqual(['node-b', None, 'node-a'], self.cache.get_nodes_for_sids(['sid-2', 'sid-3', 'sid-1']))
+
+    def test_remove_node_for_sid(self):
+        self.cache.set_node_for_sid('sid-1', 'node-a')
+        self.cache.remove_node_for_sid('sid-1')
+        self.assertEqual([None], self.cache.get_nodes_for_sids(['sid-1']))
+
+    def test_black_list_version_changes_with_black_list(self):
+        self.cache.set_black_list({'badword'})
+
+        version = self.cache.get_black_list_version()
+        self.cache.add_to_black_list('newword')
+        self.assertNotEqual(version, self.cache.get_black_list_version())
+
+        version = self.cache.get_black_list_version()
+        self.cache.reset_black_list()
+        self.assertNotEqual(version, self.cache.get_black_list_version())
+
+    def test_black_list_version_same_after_populating_cache(self):
+        version = self.cache.get_black_list_version()
+        self.cache.set_black_list({'badword'})
+        self.assertEqual(version, self.cache.get_black_list_version())
+
+    def test_get_black_list_from_redis(self):
+        self.cache.set_black_list({'badword'})
+        self.cache.cache.delete(RedisKeys.black_list())
+        self.assertEqual({'badword'}, self.cache.get_black_list())
+
+    def test_add_to_black_list_without_local_copy(self):
+        self.cache.set_black_list({'badword'})
+        self.cache.cache.delete(RedisKeys.black_list())
+
+        self.cache.add_to_black_list('newword')
+        self.assertEqual({'badword', 'newword'}, self.cache.get_black_list())
+
+    def test_remove_from_black_list_without_local_copy(self):
+        self.cache.set_black_list({'badword', 'newword'})
+        self.cache.cache.delete(RedisKeys.black_list())
+
+        self.cache.remove_from_black_list('newword')
+        self.assertEqual({'badword'}, self.cache.get_black_list())
+
+    def test_add_to_black_list_when_not_cached(self):
+        self.cache.add_to_black_list('newword')
+        self.assertIsNone(self.cache.get_black_list())
+
+    def test_black_list_version_read_from_redis(self):
+        self.cache.increase_black_list_version()
+        version = self.cache.get_black_list_version()
+
+        self.cache.cache.delete(RedisKeys.black_list_version())
+        self.assertEqual(version, self.cache.get_black_list_version())
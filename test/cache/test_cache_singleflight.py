@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from unittest import TestCase
+
+import eventlet
+
+from dino.cache.singleflight import SingleFlight
+from dino.stats.statsd import MockStatsd
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+
+class SingleFlightTest(TestCase):
+    class FakeEnv(object):
+        def __init__(self):
+            self.stats = MockStatsd()
+
+    KEY = 'room:channel:info:1234'
+
+    def setUp(self):
+        self.env = SingleFlightTest.FakeEnv()
+        self.single_flight = SingleFlight(self.env)
+        self.n_loads = 0
+
+    def slow_loader(self, value='rooms'):
+        def _load():
+            self.n_loads += 1
+            eventlet.sleep(0.05)
+            return value
+        return _load
+
+    def test_concurrent_misses_load_once(self):
+        pool = eventlet.GreenPool()
+        results = list(pool.imap(
+            lambda _: self.single_flight.load(SingleFlightTest.KEY, self.slow_loader()), range(10)))
+
+        self.assertEqual(['rooms'] * 10, results)
+        self.assertEqual(1, self.n_loads)
+        self.assertEqual(9, self.env.stats.vals['cache.singleflight.room.channel.coalesced'])
+
+    def test_sequential_misses_load_again(self):
+        self.single_flight.load(SingleFlightTest.KEY, self.slow_loader())
+        self.single_flight.load(SingleFlightTest.KEY, self.slow_loader())
+        self.assertEqual(2, self.n_loads)
+        self.assertEqual(0, len(self.single_flight.in_flight))
+
+    def test_waiters_get_exception(self):
+        def _load():
+            eventlet.sleep(0.05)
+            raise ValueError('failed')
+
+        def _load_and_catch(_):
+            try:
+                self.single_flight.load(SingleFlightTest.KEY, _load)
+            except ValueError:
+                return 'raised'
+
+        pool = eventlet.GreenPool()
+        self.assertEqual(['raised'] * 3, list(pool.imap(_load_and_catch, range(3))))
+        self.assertEqual(0, len(self.single_flight.in_flight))
+
+    def test_serve_stale_while_reloading(self):
+        self.single_flight.load(SingleFlightTest.KEY, self.slow_loader('old'), serve_stale=True)
+
+        pool = eventlet.GreenPool()
+        results = list(pool.imap(
+            lambda _: self.single_flight.load(SingleFlightTest.KEY, self.slow_loader('new'), serve_stale=True),
+            range(3)))
+
+        self.assertEqual(['new', 'old', 'old'], results)
+        self.assertEqual(2, self.env.stats.vals['cache.singleflight.room.channel.stale'])
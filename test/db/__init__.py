@@ -360,6 +360,21 @@ class BaseDatabaseTest(BaseTest):
         self.assertTrue(BaseTest.ROOM_ID in rooms.keys())
         self.assertTrue(BaseTest.ROOM_NAME == list(rooms.values())[0]['name'])
 
+    def _test_rooms_for_channel_counts_only_visible_users(self):
+        self._create_channel()
+        self._create_room()
+        self.db.create_room(
+                'Beijing', BaseTest.OTHER_ROOM_ID, BaseTest.CHANNEL_ID,
+                BaseTest.USER_ID, BaseTest.USER_NAME)
+        self._join()
+        self.db.join_room(BaseTest.OTHER_USER_ID, BaseTest.OTHER_USER_NAME, BaseTest.ROOM_ID, BaseTest.ROOM_NAME)
+        self.db.set_user_invisible(BaseTest.OTHER_USER_ID)
+
+        rooms = self._rooms_for_channel()
+        self.assertEqual(1, rooms[BaseTest.ROOM_ID]['users'])
+        self.assertEqual(0, rooms[BaseTest.OTHER_ROOM_ID]['users'])
+        self.assertEqual(BaseTest.ROOM_NAME, rooms[BaseTest.ROOM_ID]['name'])
+
     def _test_rooms_for_user_before_joining(self):
         self._create_channel()
         self._create_room()
@@ -758,6 +773,32 @@ class BaseDatabaseTest(BaseTest):
         self.db.set_user_online(BaseTest.USER_ID)
         self.assertEqual(UserKeys.STATUS_AVAILABLE, self.db.get_user_status(BaseTest.USER_ID))
 
+    def _test_get_user_statuses(self):
+        self.db.set_user_online(BaseTest.USER_ID)
+        self.db.set_user_invisible(BaseTest.OTHER_USER_ID)
+        statuses = self.db.get_user_statuses([BaseTest.USER_ID, BaseTest.OTHER_USER_ID, '9999'])
+
+        self.assertEqual(UserKeys.STATUS_AVAILABLE, statuses[BaseTest.USER_ID])
+        self.assertEqual(UserKeys.STATUS_INVISIBLE, statuses[BaseTest.OTHER_USER_ID])
+        self.assertEqual(UserKeys.STATUS_UNAVAILABLE, statuses['9999'])
+
+    def _test_set_users_online(self):
+        self.db.set_user_invisible(BaseTest.OTHER_USER_ID)
+        self.db.set_users_online([BaseTest.USER_ID, BaseTest.OTHER_USER_ID])
+        statuses = self.db.get_user_statuses([BaseTest.USER_ID, BaseTest.OTHER_USER_ID], skip_cache=True)
+
+        self.assertEqual(UserKeys.STATUS_AVAILABLE, statuses[BaseTest.USER_ID])
+        self.assertEqual(UserKeys.STATUS_AVAILABLE, statuses[BaseTest.OTHER_USER_ID])
+
+    def _test_get_user_names(self):
+        self.db.create_user(BaseTest.OTHER_USER_ID, BaseTest.OTHER_USER_NAME)
+        user_names = self.db.get_user_names([BaseTest.USER_ID, BaseTest.OTHER_USER_ID, '9999'])
+
+        self.assertEqual({
+            BaseTest.USER_ID: BaseTest.USER_NAME,
+            BaseTest.OTHER_USER_ID: BaseTest.OTHER_USER_NAME
+        }, user_names)
+
     def _test_set_user_invisible_twice_ignores_second(self):
         self.db.set_user_invisible(BaseTest.USER_ID)
         self.db.set_user_invisible(BaseTest.USER_ID)
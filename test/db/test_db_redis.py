@@ -526,6 +526,15 @@ class DatabaseRedisTest(BaseDatabaseTest):
     def test_get_user_status_after_set(self):
         self._test_get_user_status_after_set()
 
+    def test_get_user_statuses(self):
+        self._test_get_user_statuses()
+
+    def test_set_users_online(self):
+        self._test_set_users_online()
+
+    def test_get_user_names(self):
+        self._test_get_user_names()
+
     def test_set_user_invisible_twice_ignores_second(self):
         self._test_set_user_invisible_twice_ignores_second()
 
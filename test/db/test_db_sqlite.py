@@ -119,6 +119,9 @@ class DatabaseSqliteTest(BaseDatabaseTest):
     def test_rooms_for_channel_after_create_channel_after_create_room(self):
         self._test_rooms_for_channel_after_create_channel_after_create_room()
 
+    def test_rooms_for_channel_counts_only_visible_users(self):
+        self._test_rooms_for_channel_counts_only_visible_users()
+
     def test_get_channels_before_create(self):
         self._test_get_channels_before_create()
 
@@ -537,6 +540,15 @@ class DatabaseSqliteTest(BaseDatabaseTest):
     def test_get_user_status_after_set(self):
         self._test_get_user_status_after_set()
 
+    def test_get_user_statuses(self):
+        self._test_get_user_statuses()
+
+    def test_set_users_online(self):
+        self._test_set_users_online()
+
+    def test_get_user_names(self):
+        self._test_get_user_names()
+
     def test_set_user_invisible_twice_ignores_second(self):
         self._test_set_user_invisible_twice_ignores_second()
 
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from unittest import TestCase
+
+from dino.cache.redis import CacheRedis
+from dino.environ import ConfigDict
+from dino.environ import ConfigKeys
+from dino.environ import GNEnvironment
+from dino.heartbeat.manager import HeartbeatManager
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+
+class FakeObserver(object):
+    def __init__(self):
+        self.emitted = list()
+
+    def emit(self, event, args):
+        self.emitted.append((event, args[0]['actor']['id']))
+
+
+class HeartbeatManagerTest(TestCase):
+    class FakeEnv(GNEnvironment):
+        def __init__(self):
+            super(HeartbeatManagerTest.FakeEnv, self).__init__(None, ConfigDict(), skip_init=True)
+            self.config = ConfigDict()
+            self.config.set(ConfigKeys.TESTING, True)
+            self.config.set(ConfigKeys.TIMEOUT, 300, domain=ConfigKeys.HEARTBEAT)
+            self.config.set(ConfigKeys.INTERVAL, 20, domain=ConfigKeys.HEARTBEAT)
+            self.cache = CacheRedis(self, 'mock')
+            self.observer = FakeObserver()
+
+    def setUp(self):
+        self.env = HeartbeatManagerTest.FakeEnv()
+        self.env.cache._flushall()
+        self.manager = HeartbeatManager(self.env)
+
+        self.tick = 100
+        self.manager._now_tick = lambda: self.tick
+        self.manager.current_tick = self.tick
+
+    def test_not_expired_before_timeout(self):
+        self.manager.add_heartbeat('1')
+        self.tick += self.manager.expire_ticks - 1
+        self.assertEqual([], self.manager.get_all_expired_user_ids())
+        self.assertTrue(self.manager.has_heartbeat('1'))
+
+    def test_expired_after_timeout(self):
+        self.manager.add_heartbeat('1')
+        self.tick += self.manager.expire_ticks
+        self.assertEqual(['1'], self.manager.get_all_expired_user_ids())
+        self.assertFalse(self.manager.has_heartbeat('1'))
+        self.assertEqual(0, sum(len(slot) for slot in self.manager.wheel))
+
+    def test_new_heartbeat_postpones_expiry(self):
+        self.manager.add_heartbeat('1')
+        self.tick += 5
+        self.manager.add_heartbeat('1')
+        self.tick += self.manager.expire_ticks - 1
+        self.assertEqual([], self.manager.get_all_expired_user_ids())
+
+        self.tick += 1
+        self.assertEqual(['1'], self.manager.get_all_expired_user_ids())
+
+    def test_lagging_more_than_a_turn(self):
+        self.manager.add_heartbeats(['1', '2'])
+        self.tick += 3 * self.manager.n_slots
+        self.assertEqual({'1', '2'}, set(self.manager.get_all_expired_user_ids()))
+
+    def test_heartbeat_added_while_lagging_is_not_expired_early(self):
+        self.tick += 2
+        self.manager.add_heartbeat('1')
+
+        # the slot for '1' is the same as for the first tick after the last check, which is visited now
+        self.tick += self.manager.expire_ticks - 7
+        self.assertEqual([], self.manager.get_all_expired_user_ids())
+        self.assertTrue(self.manager.has_heartbeat('1'))
+
+        self.tick += 7
+        self.assertEqual(['1'], self.manager.get_all_expired_user_ids())
+
+    def test_check_heartbeats(self):
+        self.env.cache.add_heartbeat('1')
+        self.manager.check_heartbeats(['1', '2'])
+
+        self.assertTrue(self.manager.has_heartbeat('1'))
+        self.assertFalse(self.manager.has_heartbeat('2'))
+        self.assertEqual([('on_heartbeat_disconnect', '2')], self.env.observer.emitted)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from unittest import TestCase
+
+from dino import environ
+from dino.hooks.heartbeat import OnHeartbeatsHooks
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+
+class FakeHeartbeat(object):
+    def __init__(self):
+        self.heartbeats = set()
+
+    def has_heartbeat(self, user_id: str) -> bool:
+        return user_id in self.heartbeats
+
+
+class HeartbeatsHookTest(TestCase):
+    USER_ID = '8888'
+    OTHER_USER_ID = '9999'
+
+    def setUp(self):
+        self.publish, self.heartbeat = environ.env.publish, environ.env.heartbeat
+        self.published = list()
+
+        environ.env.publish = lambda activity, external=False: self.published.append(activity)
+        environ.env.heartbeat = FakeHeartbeat()
+
+        # the resource adds the heartbeats before the hooks are called
+        environ.env.heartbeat.heartbeats = {HeartbeatsHookTest.USER_ID, HeartbeatsHookTest.OTHER_USER_ID}
+        self.user_names = {
+            HeartbeatsHookTest.USER_ID: 'batman',
+            HeartbeatsHookTest.OTHER_USER_ID: 'robin'
+        }
+
+    def tearDown(self):
+        environ.env.publish, environ.env.heartbeat = self.publish, self.heartbeat
+
+    def test_login_published_for_new_users_only(self):
+        OnHeartbeatsHooks.publish_activities((self.user_names, [HeartbeatsHookTest.OTHER_USER_ID]))
+
+        self.assertEqual(1, len(self.published))
+        self.assertEqual('login', self.published[0]['verb'])
+        self.assertEqual(HeartbeatsHookTest.OTHER_USER_ID, self.published[0]['actor']['id'])
+        self.assertEqual('hb-{}'.format(HeartbeatsHookTest.OTHER_USER_ID), self.published[0]['actor']['content'])
+
+    def test_nothing_published_without_new_users(self):
+        OnHeartbeatsHooks.publish_activities((self.user_names, list()))
+        self.assertEqual(0, len(self.published))
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from unittest import TestCase
+
+from dino import environ
+from dino.rest.resources.heartbeat import HeartbeatResource
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+
+class FakeDb(object):
+    _user_names = dict()
+
+    def get_user_names(self, user_ids: list) -> dict:
+        return {
+            user_id: FakeDb._user_names[user_id]
+            for user_id in user_ids if user_id in FakeDb._user_names
+        }
+
+
+class FakeHeartbeat(object):
+    def __init__(self):
+        self.heartbeats = set()
+
+    def has_heartbeat(self, user_id: str) -> bool:
+        return user_id in self.heartbeats
+
+    def add_heartbeats(self, user_ids: list) -> None:
+        self.heartbeats.update(user_ids)
+
+
+class FakeObserver(object):
+    def __init__(self):
+        self.emitted = list()
+
+    def emit(self, event: str, arg) -> None:
+        self.emitted.append((event, arg))
+
+
+class HeartbeatResourceTest(TestCase):
+    USER_ID = '8888'
+    OTHER_USER_ID = '9999'
+
+    def setUp(self):
+        self.db, self.heartbeat, self.observer = environ.env.db, environ.env.heartbeat, environ.env.observer
+
+        environ.env.db = FakeDb()
+        environ.env.heartbeat = FakeHeartbeat()
+        environ.env.observer = FakeObserver()
+        FakeDb._user_names = {
+            HeartbeatResourceTest.USER_ID: 'batman',
+            HeartbeatResourceTest.OTHER_USER_ID: 'robin'
+        }
+        self.resource = HeartbeatResource()
+
+    def tearDown(self):
+        environ.env.db, environ.env.heartbeat, environ.env.observer = self.db, self.heartbeat, self.observer
+
+    def test_heartbeats_are_added(self):
+        self.resource._do_post([HeartbeatResourceTest.USER_ID, HeartbeatResourceTest.OTHER_USER_ID])
+        self.assertEqual(
+            {HeartbeatResourceTest.USER_ID, HeartbeatResourceTest.OTHER_USER_ID}, environ.env.heartbeat.heartbeats)
+
+    def test_new_users_are_the_ones_without_heartbeat(self):
+        environ.env.heartbeat.heartbeats.add(HeartbeatResourceTest.USER_ID)
+        self.resource._do_post([HeartbeatResourceTest.USER_ID, HeartbeatResourceTest.OTHER_USER_ID])
+
+        event, (user_names, new_user_ids) = environ.env.observer.emitted[0]
+        self.assertEqual('on_heartbeats', event)
+        self.assertEqual(FakeDb._user_names, user_names)
+        self.assertEqual([HeartbeatResourceTest.OTHER_USER_ID], new_user_ids)
+
+    def test_unknown_users_are_skipped(self):
+        self.resource._do_post(['1111', HeartbeatResourceTest.USER_ID])
+
+        _, (user_names, new_user_ids) = environ.env.observer.emitted[0]
+        self.assertEqual([HeartbeatResourceTest.USER_ID], list(user_names.keys()))
+        self.assertEqual({HeartbeatResourceTest.USER_ID}, environ.env.heartbeat.heartbeats)
+
+    def test_nothing_emitted_without_known_users(self):
+        self.resource._do_post(['1111'])
+        self.assertEqual(0, len(environ.env.observer.emitted))
+
+    def test_user_ids_as_ints(self):
+        self.resource._do_post([int(HeartbeatResourceTest.USER_ID)])
+        self.assertEqual({HeartbeatResourceTest.USER_ID}, environ.env.heartbeat.heartbeats)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+from unittest import TestCase
+
+from dino import environ
+from dino.rest.resources.streaming_history import StreamingHistoryResource
+from dino.rest.resources.streaming_history import StreamingFullHistoryResource
+from dino.utils import b64d
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+
+class FakeStorage(object):
+    def __init__(self, n_messages: int):
+        self.n_messages = n_messages
+        self.fail_at = None
+        self.requested_cursors = list()
+
+    def _page(self, page_size: int, cursor: str) -> (list, str):
+        self.requested_cursors.append(cursor)
+        start = 0 if cursor is None else int(cursor)
+        if start == self.fail_at:
+            raise RuntimeError('storage is down')
+
+        end = min(start + page_size, self.n_messages)
+        messages = [{
+            'message_id': str(i),
+            'from_user_id': StreamingHistoryTest.USER_ID,
+            'from_user_name': 'batman',
+            'target_id': StreamingHistoryTest.ROOM_ID,
+            'target_name': 'cool guys',
+            'body': 'message %s' % i,
+            'domain': 'room',
+            'channel_id': '5555',
+            'channel_name': 'shanghai',
+            'timestamp': '2017-01-26T04:58:33Z',
+            'deleted': False
+        } for i in range(start, end)]
+
+        return messages, None if end >= self.n_messages else str(end)
+
+    def get_history_page(self, room_id, from_user_id, from_time, to_time, page_size, cursor=None):
+        return self._page(page_size, cursor)
+
+    def get_undeleted_messages_for_user_and_time_page(self, user_id, from_time, to_time, page_size, cursor=None):
+        return self._page(page_size, cursor)
+
+
+class FakeRequest(object):
+    def __init__(self, the_json):
+        self.the_json = the_json
+
+    def get_json(self, *args, **kwargs):
+        return self.the_json
+
+
+class StreamingHistoryTest(TestCase):
+    USER_ID = '8888'
+    ROOM_ID = '1234'
+
+    def setUp(self):
+        self.storage = FakeStorage(5)
+        self.old_storage = environ.env.storage
+        environ.env.storage = self.storage
+
+    def tearDown(self):
+        environ.env.storage = self.old_storage
+
+    def stream(self, resource_class=StreamingHistoryResource, **kwargs):
+        the_json = {'room_id': StreamingHistoryTest.ROOM_ID, 'page_size': 2}
+        the_json.update(kwargs)
+
+        resource = resource_class()
+        resource.request = FakeRequest(the_json)
+        if resource_class is StreamingHistoryResource:
+            return resource.get()
+        return resource.post()
+
+    def lines(self, response) -> list:
+        return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+    def test_messages_and_cursors_are_streamed(self):
+        lines = self.lines(self.stream())
+
+        self.assertEqual(
+            ['0', '1', {'cursor': '2'}, '2', '3', {'cursor': '4'}, '4', {'cursor': None}],
+            [line.get('message_id', line) for line in lines])
+        self.assertEqual('message 0', b64d(lines[0]['body']))
+        self.assertEqual('batman', b64d(lines[0]['from_user_name']))
+
+    def test_continue_from_cursor(self):
+        lines = self.lines(self.stream(cursor='4'))
+        self.assertEqual(['4', {'cursor': None}], [line.get('message_id', line) for line in lines])
+
+    def test_pages_are_fetched_when_streamed(self):
+        response = self.stream()
+        self.assertEqual([None], self.storage.requested_cursors)
+
+        self.lines(response)
+        self.assertEqual([None, '2', '4'], self.storage.requested_cursors)
+
+    def test_full_history(self):
+        lines = self.lines(self.stream(StreamingFullHistoryResource, user_id=StreamingHistoryTest.USER_ID))
+        self.assertEqual(5, len([line for line in lines if 'message_id' in line]))
+
+    def test_missing_room_and_user(self):
+        response = self.stream(room_id=None)
+        self.assertEqual(500, response['status_code'])
+
+    def test_invalid_page_size(self):
+        self.assertEqual(500, self.stream(page_size=0)['status_code'])
+        self.assertEqual(500, self.stream(page_size='many')['status_code'])
+
+    def test_error_after_streaming_started(self):
+        self.storage.fail_at = 2
+        lines = self.lines(self.stream())
+
+        self.assertEqual(['0', '1', {'cursor': '2'}], [line.get('message_id', line) for line in lines[:-1]])
+        self.assertIn('error', lines[-1])
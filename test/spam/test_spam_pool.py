@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+from unittest import TestCase
+
+import eventlet
+
+from dino.spam.pool import SpamBatcher
+from dino.spam.pool import SpamWorker
+from dino.spam.worker import read_frame
+from dino.spam.worker import write_frame
+from dino.stats.statsd import MockStatsd
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+
+class FakeWorker(object):
+    def __init__(self, fail=False, delay=0):
+        self.fail = fail
+        self.delay = delay
+        self.batches = list()
+
+    def predict(self, messages: list) -> list:
+        self.batches.append(messages)
+        eventlet.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError('could not predict')
+        return [(len(message), 0, 0) for message in messages]
+
+
+class FakeEnv(object):
+    def __init__(self):
+        self.stats = MockStatsd()
+
+    def capture_exception(self, _):
+        pass
+
+
+class SpamBatcherTest(TestCase):
+    def predict_all(self, batcher, messages: list) -> list:
+        threads = [eventlet.spawn(batcher.predict, message) for message in messages]
+        return [thread.wait() for thread in threads]
+
+    def test_predictions_are_returned_to_each_caller(self):
+        batcher = SpamBatcher(FakeEnv(), [FakeWorker()])
+        predictions = self.predict_all(batcher, ['a', 'bb', 'ccc'])
+        self.assertEqual([(1, 0, 0), (2, 0, 0), (3, 0, 0)], predictions)
+
+    def test_queued_messages_are_batched(self):
+        worker = FakeWorker()
+        batcher = SpamBatcher(FakeEnv(), [worker], batch_size=10, batch_wait=0.05)
+        self.predict_all(batcher, ['a'] * 25)
+        self.assertEqual([10, 10, 5], [len(batch) for batch in worker.batches])
+
+    def test_batch_sent_after_wait_when_not_full(self):
+        worker = FakeWorker()
+        batcher = SpamBatcher(FakeEnv(), [worker], batch_size=10, batch_wait=0.01)
+        self.predict_all(batcher, ['a'])
+        self.assertEqual([['a']], worker.batches)
+
+    def test_batches_are_spread_over_workers(self):
+        workers = [FakeWorker(delay=0.05), FakeWorker(delay=0.05)]
+        batcher = SpamBatcher(FakeEnv(), workers, batch_size=2, batch_wait=0.01)
+        self.predict_all(batcher, ['a'] * 4)
+        self.assertEqual([1, 1], [len(worker.batches) for worker in workers])
+
+    def test_timeout_returns_none(self):
+        env = FakeEnv()
+        batcher = SpamBatcher(env, [FakeWorker(delay=0.2)], timeout=0.05)
+        self.assertIsNone(batcher.predict('a'))
+        self.assertEqual(1, env.stats.vals['spam.timeout'])
+
+    def test_worker_failure_is_raised_to_callers(self):
+        batcher = SpamBatcher(FakeEnv(), [FakeWorker(fail=True)])
+        self.assertRaises(RuntimeError, batcher.predict, 'a')
+
+
+class SpamWorkerTest(TestCase):
+    def test_frames(self):
+        f = io.BytesIO()
+        write_frame(f, ['a', 'b'])
+        write_frame(f, None)
+        f.seek(0)
+
+        self.assertEqual(['a', 'b'], read_frame(f))
+        self.assertIsNone(read_frame(f))
+        self.assertRaises(EOFError, read_frame, f)
+
+    def test_worker_without_models_fails_and_is_restarted(self):
+        worker = SpamWorker('/non/existing/path')
+        self.assertRaises(EOFError, worker.predict, ['a'])
+        self.assertIsNone(worker.process)
+
+        self.assertRaises(EOFError, worker.predict, ['a'])
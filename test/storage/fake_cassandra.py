@@ -36,7 +36,8 @@ class FakeResultSet(object):
                 return None
             return self.__dict__['vals'][item]
 
-    def __init__(self, current_rows):
+    def __init__(self, current_rows, paging_state=None):
+        self.paging_state = paging_state
         if isinstance(current_rows, dict):
             self.current_rows = list()
             row = FakeResultSet.FakeRow()
@@ -56,6 +57,11 @@ class FakeCassandraDriver(object):
     def __init__(self):
         self.msgs_to_user = dict()
 
+        # message id => number of times deleting it should fail
+        self.failing_deletes = dict()
+        self.acks = dict()
+        self.n_ack_writes = 0
+
     def init(self):
         pass
 
@@ -69,6 +75,33 @@ class FakeCassandraDriver(object):
             msg_id, from_user_id, from_user_name, target_id, target_name, body, domain,
             sent_time, time_stamp, channel_id, channel_name, deleted))
 
+    def get_acks_for(self, message_ids: set, receiver_id: str) -> FakeResultSet:
+        return FakeResultSet(self.get_acks_for_many({receiver_id: message_ids}))
+
+    def get_acks_for_many(self, message_ids_by_receiver: dict) -> list:
+        rows = list()
+        for receiver_id, message_ids in message_ids_by_receiver.items():
+            for message_id in message_ids:
+                if (receiver_id, message_id) not in self.acks:
+                    continue
+                status, target_id = self.acks[(receiver_id, message_id)]
+                rows.extend(FakeResultSet({
+                    'for_user_id': receiver_id,
+                    'message_id': message_id,
+                    'status': status,
+                    'target_id': target_id
+                }))
+        return rows
+
+    def set_acks_with_status(self, acks: list) -> None:
+        self.n_ack_writes += 1
+        for receiver_id, message_id, status, target_id in acks:
+            self.acks[(receiver_id, message_id)] = (status, target_id)
+
+    def msgs_insert(self, messages: list) -> None:
+        for message in messages:
+            self.msg_insert(**message)
+
     def msgs_select_latest_non_deleted(self, to_user_id: str, limit: int=100) -> FakeResultSet:
         return self.msgs_select(to_user_id, limit)
 
@@ -101,6 +134,18 @@ class FakeCassandraDriver(object):
             filtered.append(msg)
         return FakeResultSet(filtered)
 
+    def msgs_select_time_slice_page(self, target_id: str, from_time: int, to_time: int, fetch_size: int, paging_state: bytes=None) -> FakeResultSet:
+        msgs = [
+            msg for msg in self.msgs_select(target_id, 999999)
+            if from_time < msg.time_stamp < to_time
+        ]
+
+        start = 0 if paging_state is None else int(paging_state.decode())
+        end = start + fetch_size
+        if end >= len(msgs):
+            return FakeResultSet(msgs[start:])
+        return FakeResultSet(msgs[start:end], paging_state=str(end).encode())
+
     def msg_delete(self, message_id: str) -> FakeResultSet:
         found = False
         for room_id, msgs in self.msgs_to_user.items():
@@ -114,3 +159,13 @@ class FakeCassandraDriver(object):
             if found:
                 self.msgs_to_user[room_id] = new_msgs
                 break
+
+    def msgs_delete(self, message_ids: list, clear_body: bool=True) -> set:
+        failed = set()
+        for message_id in message_ids:
+            if self.failing_deletes.get(message_id, 0) > 0:
+                self.failing_deletes[message_id] -= 1
+                failed.add(message_id)
+                continue
+            self.msg_delete(message_id)
+        return failed
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+from unittest import TestCase
+
+from dino.storage.cassandra_driver import BUCKET_SECONDS
+from dino.storage.cassandra_driver import MAX_TIME_SLICE_BUCKETS
+from dino.storage.cassandra_driver import Driver
+from dino.storage.cassandra_driver import StatementKeys
+from test.storage.fake_cassandra import FakeResultSet
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+
+class FakeStatement(object):
+    def __init__(self, statement_key: StatementKeys):
+        self.statement_key = statement_key
+
+    def bind(self, params):
+        return self.statement_key, params
+
+
+class FakeSession(object):
+    """
+    the messages of one room; counts the queries by statement
+    """
+
+    def __init__(self):
+        self.time_stamps = list()
+        self.queries = list()
+        self.inserts = list()
+
+    def execute(self, bound):
+        statement_key, params = bound
+        if statement_key.value.endswith('_insert'):
+            self.inserts.append((statement_key, params))
+            return list()
+        return self.select(statement_key, params)
+
+    def select(self, statement_key: StatementKeys, params) -> list:
+        self.queries.append(statement_key)
+        newest_first = sorted(self.time_stamps, reverse=True)
+
+        if statement_key == StatementKeys.message_days_select:
+            _, newest, oldest = params
+            days = sorted({t // BUCKET_SECONDS for t in self.time_stamps}, reverse=True)
+            return [FakeResultSet({'day': day}).current_rows[0] for day in days if oldest <= day <= newest]
+        elif statement_key == StatementKeys.bucket_select_latest_non_deleted:
+            _, day, limit = params
+            time_stamps = [t for t in newest_first if t // BUCKET_SECONDS == day][:limit]
+        elif statement_key == StatementKeys.bucket_select_time_slice:
+            _, day, from_time, to_time = params
+            time_stamps = [t for t in newest_first if t // BUCKET_SECONDS == day and from_time < t < to_time]
+        elif statement_key == StatementKeys.msgs_select_time_slice:
+            _, from_time, to_time = params
+            time_stamps = [t for t in newest_first if from_time < t < to_time]
+        else:
+            raise NotImplementedError(statement_key)
+
+        return [FakeResultSet({'time_stamp': time_stamp}).current_rows[0] for time_stamp in time_stamps]
+
+
+class DriverBucketTest(TestCase):
+    ROOM_ID = '1234'
+
+    def setUp(self):
+        self.session = FakeSession()
+        self.driver = Driver(self.session, 'dino', 'SimpleStrategy', 1, bucketed_history=True)
+        self.driver.statements = {key: FakeStatement(key) for key in StatementKeys}
+
+        # the buckets are queried concurrently in the real driver
+        self.driver._execute_concurrent = lambda statement_key, args, concurrency: [
+            self.session.select(statement_key, params) for params in args]
+        self.now = int(time.time())
+
+    def days_ago(self, days: int) -> int:
+        return self.now - days * BUCKET_SECONDS
+
+    def bucket_queries(self, statement_key: StatementKeys) -> int:
+        return len([key for key in self.session.queries if key == statement_key])
+
+    def test_empty_room_does_not_query_buckets(self):
+        rows = self.driver.msgs_select_latest_non_deleted(DriverBucketTest.ROOM_ID, limit=50)
+
+        self.assertEqual(0, len(list(rows)))
+        self.assertEqual([StatementKeys.message_days_select], self.session.queries)
+
+    def test_only_buckets_with_messages_are_queried(self):
+        self.session.time_stamps = [self.days_ago(30), self.days_ago(31)]
+        rows = self.driver.msgs_select_latest_non_deleted(DriverBucketTest.ROOM_ID, limit=50)
+
+        self.assertEqual(2, len(list(rows)))
+        self.assertEqual(2, self.bucket_queries(StatementKeys.bucket_select_latest_non_deleted))
+
+    def test_limit_stops_walking_buckets(self):
+        self.session.time_stamps = [self.days_ago(days) for days in range(100)]
+        rows = self.driver.msgs_select_latest_non_deleted(DriverBucketTest.ROOM_ID, limit=3)
+
+        self.assertEqual(self.session.time_stamps[:3], [row.time_stamp for row in rows])
+        self.assertGreater(100, self.bucket_queries(StatementKeys.bucket_select_latest_non_deleted))
+
+    def test_short_time_slice_uses_buckets(self):
+        self.session.time_stamps = [self.days_ago(days) for days in range(10)]
+        rows = self.driver.msgs_select_time_slice(DriverBucketTest.ROOM_ID, self.days_ago(5) - 1, self.now + 1)
+
+        self.assertEqual(6, len(list(rows)))
+        self.assertEqual(0, self.bucket_queries(StatementKeys.msgs_select_time_slice))
+
+    def test_long_time_slice_is_one_query(self):
+        self.session.time_stamps = [self.days_ago(days) for days in range(400)]
+        rows = self.driver.msgs_select_time_slice(DriverBucketTest.ROOM_ID, self.days_ago(365) - 1, self.now + 1)
+
+        self.assertEqual(366, len(list(rows)))
+        self.assertEqual(0, self.bucket_queries(StatementKeys.bucket_select_time_slice))
+        self.assertEqual(1, self.bucket_queries(StatementKeys.msgs_select_time_slice))
+
+    def test_long_time_slice_with_few_message_days_uses_buckets(self):
+        self.session.time_stamps = [self.days_ago(2), self.days_ago(3)]
+        rows = self.driver.msgs_select_time_slice(DriverBucketTest.ROOM_ID, self.days_ago(365), self.now + 1)
+
+        self.assertEqual(2, len(list(rows)))
+        self.assertGreaterEqual(MAX_TIME_SLICE_BUCKETS, self.bucket_queries(StatementKeys.bucket_select_time_slice))
+
+    def test_day_of_message_is_recorded(self):
+        self.driver.msg_insert(
+            'msg-id', '8888', 'user', DriverBucketTest.ROOM_ID, 'room', 'body', 'room', '2016-05-01T10:00:00Z', '4321',
+            'channel')
+
+        days = [params for key, params in self.session.inserts if key == StatementKeys.message_day_insert]
+        self.assertEqual([(DriverBucketTest.ROOM_ID, 1462096800 // BUCKET_SECONDS)], days)
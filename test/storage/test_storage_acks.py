@@ -0,0 +1,100 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from unittest import TestCase
+
+import eventlet
+
+from dino.config import AckStatus
+from dino.stats.statsd import MockStatsd
+from dino.storage.acks import AckBatcher
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+
+class FakeEnv(object):
+    def __init__(self):
+        self.stats = MockStatsd()
+
+    def capture_exception(self, _):
+        pass
+
+
+class AckBatcherTest(TestCase):
+    def setUp(self):
+        self.env = FakeEnv()
+        self.written = list()
+        self.fail = False
+        self.writing = 0
+        self.max_writing = 0
+        self.write_time = 0
+        self.batcher = AckBatcher(self.env, self.write, wait=0.01, max_pending=3)
+
+    def write(self, acks: dict) -> None:
+        if self.fail:
+            raise RuntimeError('storage is down')
+
+        self.writing += 1
+        self.max_writing = max(self.max_writing, self.writing)
+        if self.write_time > 0:
+            # like reading the current acks from the storage before writing
+            eventlet.sleep(self.write_time)
+        self.writing -= 1
+        self.written.append(acks)
+
+    def test_written_after_wait(self):
+        self.batcher.add({'1', '2'}, 'user', 'room', AckStatus.NOT_ACKED)
+        self.assertEqual([], self.written)
+
+        eventlet.sleep(0.05)
+        self.assertEqual(1, len(self.written))
+        self.assertEqual(2, len(self.written[0]))
+
+    def test_highest_status_kept(self):
+        self.batcher.add({'1'}, 'user', 'room', AckStatus.READ)
+        self.batcher.add({'1'}, 'user', 'room', AckStatus.NOT_ACKED)
+        self.batcher.add({'2'}, 'user', 'room', AckStatus.NOT_ACKED)
+        self.batcher.add({'2'}, 'user', 'room', AckStatus.RECEIVED)
+        self.batcher.flush()
+
+        self.assertEqual({
+            ('user', '1'): (AckStatus.READ, 'room'),
+            ('user', '2'): (AckStatus.RECEIVED, 'room')
+        }, self.written[0])
+        self.assertEqual(2, self.env.stats.vals['storage.acks.coalesced'])
+
+    def test_written_when_max_pending(self):
+        self.batcher.wait = 10
+        self.batcher.add({'1', '2', '3'}, 'user', 'room', AckStatus.READ)
+
+        eventlet.sleep(0)
+        self.assertEqual(1, len(self.written))
+
+    def test_one_batch_written_at_a_time(self):
+        self.write_time = 0.01
+        self.batcher.add({'1'}, 'user', 'room', AckStatus.RECEIVED)
+        eventlet.sleep(0.015)
+
+        # the timer flush is still writing when max_pending is reached
+        self.batcher.add({'1', '2', '3'}, 'user', 'room', AckStatus.READ)
+        eventlet.sleep(0.05)
+
+        self.assertEqual(1, self.max_writing)
+        self.assertEqual(AckStatus.READ, self.written[-1][('user', '1')][0])
+
+    def test_failed_write_counted(self):
+        self.fail = True
+        self.batcher.add({'1'}, 'user', 'room', AckStatus.READ)
+        self.batcher.flush()
+
+        self.assertEqual(1, self.env.stats.vals['storage.acks.failed'])
+        self.assertEqual(0, len(self.batcher.pending))
@@ -18,10 +18,16 @@ from uuid import uuid4 as uuid
 from datetime import datetime
 import time
 
+from cassandra import ConsistencyLevel
+from cassandra.policies import ConstantSpeculativeExecutionPolicy
+
 from test.base import BaseTest
 
 from dino import environ
+from dino.config import AckStatus
 from dino.config import ConfigKeys
+from dino.stats.statsd import MockStatsd
+from dino.storage.acks import AckBatcher
 from dino.storage.cassandra import CassandraStorage
 from dino.db.redis import DatabaseRedis
 from test.storage.fake_cassandra import FakeCassandraDriver
@@ -37,6 +43,7 @@ class StorageMockCassandraTest(BaseTest):
         self.key_space = 'testing'
         self.storage = CassandraStorage(hosts=['mock'], key_space=self.key_space)
         self.storage.driver = FakeCassandraDriver()
+        self.storage.delete_retry_wait = 0
         environ.env.db = DatabaseRedis(environ.env, 'mock')
 
     def test_replications(self):
@@ -76,6 +83,26 @@ class StorageMockCassandraTest(BaseTest):
         environ.env.config.set(ConfigKeys.TESTING, False)
         self.assertRaises(ValueError, self.storage.validate, ['localhost'], 2, 1)
 
+    def test_consistency(self):
+        self.assertEqual(ConsistencyLevel.LOCAL_QUORUM, self.storage._consistency('local_quorum'))
+        self.assertIsNone(self.storage._consistency(None))
+
+    def test_unknown_consistency(self):
+        self.assertRaises(ValueError, self.storage._consistency, 'MOST')
+
+    def test_create_cluster_with_tuning(self):
+        storage = CassandraStorage(
+            hosts=['127.0.0.1'], key_space=self.key_space, local_dc='dc1', compression='unknown', request_timeout=3,
+            executor_threads=4, speculative_delay=0.05, speculative_attempts=2)
+        cluster = storage._create_cluster()
+
+        profile = cluster.profile_manager.default
+        self.assertEqual(3, profile.request_timeout)
+        self.assertEqual('dc1', profile.load_balancing_policy._child_policy.local_dc)
+        self.assertIsInstance(profile.speculative_execution_policy, ConstantSpeculativeExecutionPolicy)
+        self.assertEqual(4, cluster.executor._max_workers)
+        self.assertTrue(cluster.compression)
+
     def test_history(self):
         self.assertEqual(0, len(self.storage.get_history(BaseTest.ROOM_ID)))
 
@@ -87,6 +114,87 @@ class StorageMockCassandraTest(BaseTest):
         self.assertEqual(BaseTest.USER_ID, res[0]['from_user_id'])
         self.assertEqual(BaseTest.ROOM_ID, res[0]['target_id'])
 
+    def test_store_messages(self):
+        messages = [self.act_message() for _ in range(3)]
+        self.storage.store_messages(messages)
+
+        res = self.storage.get_history(BaseTest.ROOM_ID)
+        self.assertEqual({message.id for message in messages}, {m['message_id'] for m in res})
+
+    def test_get_history_page(self):
+        messages = [self.act_message() for _ in range(5)]
+        self.storage.store_messages(messages)
+        now = int(time.time())
+
+        message_ids = list()
+        page, cursor = self.storage.get_history_page(BaseTest.ROOM_ID, None, now - 60, now + 60, 2)
+        n_pages = 1
+
+        while True:
+            message_ids.extend(m['message_id'] for m in page)
+            if cursor is None:
+                break
+            page, cursor = self.storage.get_history_page(BaseTest.ROOM_ID, None, now - 60, now + 60, 2, cursor)
+            n_pages += 1
+
+        self.assertEqual(3, n_pages)
+        self.assertEqual(sorted(message.id for message in messages), sorted(message_ids))
+
+    def test_get_history_page_invalid_cursor(self):
+        self.assertRaises(ValueError, self.storage.get_history_page, BaseTest.ROOM_ID, None, 0, 1, 2, 'not a cursor')
+
+    def test_mark_as_read(self):
+        self.storage.mark_as_read({'1', '2'}, BaseTest.USER_ID, BaseTest.ROOM_ID)
+        self.assertEqual({'1': AckStatus.READ, '2': AckStatus.READ}, self.storage.get_statuses({'1', '2'}, BaseTest.USER_ID))
+        self.assertEqual(1, self.storage.driver.n_ack_writes)
+
+    def test_status_not_downgraded(self):
+        self.storage.mark_as_read({'1'}, BaseTest.USER_ID, BaseTest.ROOM_ID)
+        self.storage.mark_as_unacked('1', BaseTest.USER_ID, BaseTest.ROOM_ID)
+        self.storage.mark_as_received({'1', '2'}, BaseTest.USER_ID, BaseTest.ROOM_ID)
+
+        self.assertEqual(
+            {'1': AckStatus.READ, '2': AckStatus.RECEIVED},
+            self.storage.get_statuses({'1', '2'}, BaseTest.USER_ID))
+
+    def test_acks_are_coalesced(self):
+        environ.env.stats = MockStatsd()
+        self.storage.acks = AckBatcher(environ.env, self.storage._write_acks)
+        self.storage.mark_as_unacked('1', BaseTest.USER_ID, BaseTest.ROOM_ID)
+        self.storage.mark_as_received({'1'}, BaseTest.USER_ID, BaseTest.ROOM_ID)
+        self.storage.mark_as_unacked('1', BaseTest.OTHER_USER_ID, BaseTest.ROOM_ID)
+        self.assertEqual(0, self.storage.driver.n_ack_writes)
+
+        self.storage.acks.flush()
+        self.assertEqual(1, self.storage.driver.n_ack_writes)
+        self.assertEqual({'1': AckStatus.RECEIVED}, self.storage.get_statuses({'1'}, BaseTest.USER_ID))
+        self.assertEqual({'1': AckStatus.NOT_ACKED}, self.storage.get_statuses({'1'}, BaseTest.OTHER_USER_ID))
+
+    def test_delete_messages(self):
+        messages = [self.act_message() for _ in range(3)]
+        for message in messages:
+            self.storage.store_message(message)
+
+        successes, failures = self.storage.delete_messages([message.id for message in messages[:2]])
+        self.assertEqual((2, 0), (successes, failures))
+        self.assertEqual([messages[2].id], [m['message_id'] for m in self.storage.get_history(BaseTest.ROOM_ID)])
+
+    def test_delete_messages_retries_failed(self):
+        message = self.act_message()
+        self.storage.store_message(message)
+        self.storage.driver.failing_deletes[message.id] = 1
+
+        self.assertEqual((1, 0), self.storage.delete_messages([message.id]))
+        self.assertEqual(0, len(self.storage.get_history(BaseTest.ROOM_ID)))
+
+    def test_delete_messages_gives_up_after_retries(self):
+        message = self.act_message()
+        self.storage.store_message(message)
+        self.storage.driver.failing_deletes[message.id] = 100
+
+        self.assertEqual((0, 1), self.storage.delete_messages([message.id]))
+        self.assertEqual(1, len(self.storage.get_history(BaseTest.ROOM_ID)))
+
     def join(self):
         environ.env.db.join_room(BaseTest.USER_ID, BaseTest.USER_NAME, BaseTest.ROOM_ID, BaseTest.ROOM_NAME)
 
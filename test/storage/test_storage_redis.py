@@ -14,10 +14,13 @@ from unittest import TestCase
 from uuid import uuid4 as uuid
 from activitystreams import parse as as_parser
 from datetime import datetime
+from datetime import timedelta
 
 from dino import environ
 from dino.utils import b64e
+from dino.config import AckStatus
 from dino.config import ConfigKeys
+from dino.config import RedisKeys
 from dino.storage.redis import StorageRedis
 
 __author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
@@ -33,6 +36,7 @@ class RedisStorageTest(TestCase):
     def setUp(self):
         self.db = StorageRedis('mock')
         self.db.redis.flushall()
+        self.now = datetime.utcnow().replace(microsecond=0)
         environ.env.session = {
             'user_id': RedisStorageTest.USER_ID,
             'user_name': RedisStorageTest.USER_NAME
@@ -49,6 +53,7 @@ class RedisStorageTest(TestCase):
         self.assertIsNotNone(history[0]['message_id'])
         self.assertEqual(RedisStorageTest.USER_ID, history[0]['from_user_id'])
         self.assertEqual(RedisStorageTest.MESSAGE, history[0]['body'])
+        self.assertEqual(RedisStorageTest.USER_NAME, history[0]['from_user_name'])
 
     def test_delete_message(self):
         self.db.store_message(as_parser(self.act()))
@@ -58,11 +63,131 @@ class RedisStorageTest(TestCase):
         history = self.db.get_history(RedisStorageTest.ROOM_ID)
         self.assertEqual(0, len(history))
 
-    def act(self):
+    def test_delete_messages(self):
+        self.db.store_message(as_parser(self.act()))
+        self.assertEqual((1, 0), self.db.delete_messages([RedisStorageTest.MESSAGE_ID], RedisStorageTest.ROOM_ID))
+        self.assertEqual(0, len(self.db.get_history(RedisStorageTest.ROOM_ID)))
+
+    def test_delete_messages_without_room(self):
+        self.db.store_message(as_parser(self.act()))
+        self.assertEqual((1, 0), self.db.delete_messages([RedisStorageTest.MESSAGE_ID]))
+        self.assertEqual(0, len(self.db.get_history(RedisStorageTest.ROOM_ID)))
+        self.assertFalse(self.db.redis.exists(RedisKeys.message(RedisStorageTest.MESSAGE_ID)))
+
+    def test_delete_unknown_messages_are_failures(self):
+        self.db.store_message(as_parser(self.act()))
+        self.assertEqual((1, 1), self.db.delete_messages(
+            [RedisStorageTest.MESSAGE_ID, str(uuid())], RedisStorageTest.ROOM_ID))
+        self.assertEqual((0, 1), self.db.delete_messages([RedisStorageTest.MESSAGE_ID]))
+
+    def test_store_deleted_message_is_not_stored(self):
+        self.db.store_message(as_parser(self.act()), deleted=True)
+        self.assertEqual(0, len(self.db.get_history(RedisStorageTest.ROOM_ID)))
+
+    def test_get_history_newest_first_with_limit(self):
+        for i in range(5):
+            self.db.store_message(as_parser(self.act(message_id=str(i), published=self.published(i))))
+
+        history = self.db.get_history(RedisStorageTest.ROOM_ID, limit=3)
+        self.assertEqual(['4', '3', '2'], [message['message_id'] for message in history])
+
+    def test_history_is_trimmed_to_limit(self):
+        history_config = environ.env.config.get(ConfigKeys.HISTORY, default=dict())
+        environ.env.config.set(ConfigKeys.HISTORY, {ConfigKeys.LIMIT: 3})
+        try:
+            for i in range(5):
+                self.db.store_message(as_parser(self.act(message_id=str(i), published=self.published(i))))
+        finally:
+            environ.env.config.set(ConfigKeys.HISTORY, history_config)
+
+        history = self.db.get_history(RedisStorageTest.ROOM_ID, limit=10)
+        self.assertEqual(['4', '3', '2'], [message['message_id'] for message in history])
+        self.assertFalse(self.db.redis.exists(RedisKeys.message('0')))
+        self.assertFalse(self.db.redis.exists(RedisKeys.message('1')))
+
+    def test_get_history_for_time_slice(self):
+        for i in range(5):
+            self.db.store_message(as_parser(self.act(message_id=str(i), published=self.published(i))))
+
+        history = self.db.get_history_for_time_slice(
+            RedisStorageTest.ROOM_ID, None, self.time_stamp(1), self.time_stamp(3))
+        self.assertEqual(['3', '2', '1'], [message['message_id'] for message in history])
+
+    def test_get_history_for_time_slice_from_other_user(self):
+        self.db.store_message(as_parser(self.act()))
+        history = self.db.get_history_for_time_slice(
+            RedisStorageTest.ROOM_ID, 'other-user', self.time_stamp(-60), self.time_stamp(60))
+        self.assertEqual(0, len(history))
+
+    def test_get_history_for_time_slice_without_room(self):
+        self.assertRaises(
+            NotImplementedError, self.db.get_history_for_time_slice,
+            None, RedisStorageTest.USER_ID, self.time_stamp(-60), self.time_stamp(60))
+
+    def test_get_unread_history(self):
+        for i in range(5):
+            self.db.store_message(as_parser(self.act(message_id=str(i), published=self.published(i))))
+
+        history = self.db.get_unread_history(RedisStorageTest.ROOM_ID, self.time_stamp(3))
+        self.assertEqual(['4', '3'], [message['message_id'] for message in history])
+
+    def test_migrate_history(self):
+        published = self.published(0)
+        self.db.redis.lpush(
+            RedisKeys.room_history(RedisStorageTest.ROOM_ID), '%s,%s,%s,%s,%s,%s,%s,%s' % (
+                RedisStorageTest.MESSAGE_ID, published, RedisStorageTest.USER_ID, b64e(RedisStorageTest.USER_NAME),
+                b64e('a room'), 'some-channel', b64e('a channel'), b64e(RedisStorageTest.MESSAGE)))
+
+        self.assertEqual(1, self.db.migrate_history())
+        self.assertFalse(self.db.redis.exists(RedisKeys.room_history(RedisStorageTest.ROOM_ID)))
+
+        history = self.db.get_history(RedisStorageTest.ROOM_ID)
+        self.assertEqual(1, len(history))
+        self.assertEqual(RedisStorageTest.MESSAGE_ID, history[0]['message_id'])
+        self.assertEqual(RedisStorageTest.USER_NAME, history[0]['from_user_name'])
+        self.assertEqual('a room', history[0]['target_name'])
+        self.assertEqual('a channel', history[0]['channel_name'])
+        self.assertEqual(RedisStorageTest.MESSAGE, history[0]['body'])
+        self.assertEqual(published, history[0]['timestamp'])
+
+    def test_get_statuses_empty(self):
+        self.assertEqual(dict(), self.db.get_statuses({'1', '2'}, RedisStorageTest.USER_ID))
+
+    def test_mark_as_received(self):
+        self.db.mark_as_received({'1', '2'}, RedisStorageTest.USER_ID, RedisStorageTest.ROOM_ID)
+        self.assertEqual(
+            {'1': AckStatus.RECEIVED, '2': AckStatus.RECEIVED},
+            self.db.get_statuses({'1', '2', '3'}, RedisStorageTest.USER_ID))
+        self.assertEqual(
+            {b'1', b'2'}, self.db.redis.smembers(RedisKeys.ack_for_room(RedisStorageTest.ROOM_ID)))
+
+    def test_mark_as_read_upgrades_status(self):
+        self.db.mark_as_unacked('1', RedisStorageTest.USER_ID, RedisStorageTest.ROOM_ID)
+        self.db.mark_as_received({'2'}, RedisStorageTest.USER_ID, RedisStorageTest.ROOM_ID)
+        self.db.mark_as_read({'1', '2', '3'}, RedisStorageTest.USER_ID, RedisStorageTest.ROOM_ID)
+        self.assertEqual(
+            {'1': AckStatus.READ, '2': AckStatus.READ, '3': AckStatus.READ},
+            self.db.get_statuses({'1', '2', '3'}, RedisStorageTest.USER_ID))
+
+    def test_status_is_not_downgraded(self):
+        self.db.mark_as_read({'1'}, RedisStorageTest.USER_ID, RedisStorageTest.ROOM_ID)
+        self.db.mark_as_received({'1', '2'}, RedisStorageTest.USER_ID, RedisStorageTest.ROOM_ID)
+        self.db.mark_as_unacked('1', RedisStorageTest.USER_ID, RedisStorageTest.ROOM_ID)
+        self.assertEqual(
+            {'1': AckStatus.READ, '2': AckStatus.RECEIVED},
+            self.db.get_statuses({'1', '2'}, RedisStorageTest.USER_ID))
+
+    def published(self, delta_seconds: int) -> str:
+        return (self.now + timedelta(seconds=delta_seconds)).strftime(ConfigKeys.DEFAULT_DATE_FORMAT)
+
+    def time_stamp(self, delta_seconds: int) -> int:
+        return int((self.now + timedelta(seconds=delta_seconds)).strftime('%s'))
+
+    def act(self, message_id: str=MESSAGE_ID, published: str=None):
         return {
             'actor': {
                 'id': RedisStorageTest.USER_ID,
-                'summary': RedisStorageTest.USER_NAME
+                'displayName': b64e(RedisStorageTest.USER_NAME)
             },
             'verb': 'send',
             'object': {
@@ -71,6 +196,6 @@ class RedisStorageTest(TestCase):
             'target': {
                 'id': RedisStorageTest.ROOM_ID
             },
-            'id': RedisStorageTest.MESSAGE_ID,
-            'published': datetime.utcnow().strftime(ConfigKeys.DEFAULT_DATE_FORMAT)
+            'id': message_id,
+            'published': published or datetime.utcnow().strftime(ConfigKeys.DEFAULT_DATE_FORMAT)
         }
@@ -0,0 +1,170 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import shutil
+import tempfile
+from unittest import TestCase
+from uuid import uuid4 as uuid
+
+from activitystreams import parse as as_parser
+
+from dino.config import ConfigKeys
+from dino.environ import ConfigDict
+from dino.stats.statsd import MockStatsd
+from dino.storage.writer import StorageWriter
+from dino.utils import b64e
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+
+class FakeStorage(object):
+    def __init__(self):
+        self.stored = list()
+        self.failures = 0
+        self.deleted_down = False
+
+    def store_messages(self, activities: list, deleted=False) -> None:
+        if deleted and self.deleted_down:
+            raise RuntimeError('storage is down')
+        if self.failures > 0:
+            self.failures -= 1
+            raise RuntimeError('storage is down')
+        self.stored.extend((activity.id, deleted) for activity in activities)
+
+
+class RecordingWriter(StorageWriter):
+    def __init__(self, env, **kwargs):
+        self.after_written = list()
+        super(RecordingWriter, self).__init__(env, **kwargs)
+
+    def after_write(self, activity, deleted: bool) -> None:
+        self.after_written.append((activity.id, deleted))
+
+
+class FakeEnv(object):
+    def __init__(self):
+        self.config = ConfigDict()
+        self.config.set(ConfigKeys.TESTING, True)
+        self.stats = MockStatsd()
+        self.storage = FakeStorage()
+
+    def capture_exception(self, _):
+        pass
+
+
+class StorageWriterTest(TestCase):
+    def setUp(self):
+        self.env = FakeEnv()
+        self.spool_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.spool_path)
+
+    def writer(self, **kwargs) -> StorageWriter:
+        writer = RecordingWriter(self.env, **kwargs)
+        writer.write_retry_wait = 0
+        return writer
+
+    def store(self, writer: StorageWriter, deleted: bool=False) -> str:
+        data = {
+            'id': str(uuid()),
+            'verb': 'send',
+            'actor': {'id': '1234'},
+            'target': {'id': '4321', 'objectType': 'room'},
+            'object': {'content': b64e('hi')}
+        }
+        writer.store(data, as_parser(data), deleted=deleted)
+        return data['id']
+
+    def test_messages_are_written_in_batches(self):
+        writer = self.writer(batch_size=2)
+        ids = [self.store(writer) for _ in range(3)]
+        self.assertEqual([], self.env.storage.stored)
+
+        writer.flush()
+        self.assertEqual([(message_id, False) for message_id in ids], self.env.storage.stored)
+        self.assertEqual(0, self.env.stats.vals['storage.writer.queue'])
+
+    def test_deleted_flag_is_kept(self):
+        writer = self.writer()
+        message_id = self.store(writer, deleted=True)
+        writer.flush()
+        self.assertEqual([(message_id, True)], self.env.storage.stored)
+
+    def test_failed_write_is_retried(self):
+        writer = self.writer()
+        message_id = self.store(writer)
+        self.env.storage.failures = 1
+
+        writer.flush()
+        self.assertEqual([(message_id, False)], self.env.storage.stored)
+
+    def test_unwritten_messages_are_recovered_from_spool(self):
+        writer = self.writer(spool_path=self.spool_path)
+        message_id = self.store(writer)
+        self.env.storage.failures = 100
+        writer.flush()
+        self.assertEqual(1, self.env.stats.vals['storage.writer.failed'])
+
+        # as after a restart
+        self.env.storage.failures = 0
+        writer = self.writer(spool_path=self.spool_path)
+        writer.flush()
+        self.assertEqual([(message_id, False)], self.env.storage.stored)
+
+    def test_written_messages_are_not_recovered(self):
+        writer = self.writer(spool_path=self.spool_path)
+        self.store(writer)
+        writer.flush()
+
+        writer = self.writer(spool_path=self.spool_path)
+        writer.flush()
+        self.assertEqual(1, len(self.env.storage.stored))
+
+    def test_written_group_is_handled_when_other_group_fails(self):
+        writer = self.writer(spool_path=self.spool_path)
+        message_id = self.store(writer)
+        deleted_id = self.store(writer, deleted=True)
+        self.env.storage.deleted_down = True
+
+        writer.flush()
+        self.assertEqual([(message_id, False)], self.env.storage.stored)
+        self.assertEqual([(message_id, False)], writer.after_written)
+        self.assertEqual([deleted_id], [activity.id for activity, _, _ in writer.failed])
+
+    def test_failed_messages_are_written_again(self):
+        writer = self.writer(spool_path=self.spool_path)
+        message_id = self.store(writer)
+        self.env.storage.failures = 100
+        writer.flush()
+        self.assertEqual(1, len(writer.failed))
+
+        self.env.storage.failures = 0
+        writer.flush()
+        self.assertEqual([(message_id, False)], self.env.storage.stored)
+        self.assertEqual([(message_id, False)], writer.after_written)
+        self.assertEqual(0, len(writer.failed))
+
+        # done in the spool, so not written again after a restart
+        writer = self.writer(spool_path=self.spool_path)
+        writer.flush()
+        self.assertEqual(1, len(self.env.storage.stored))
+
+    def test_failed_messages_are_tried_before_new_ones(self):
+        writer = self.writer(batch_size=2)
+        writer.failed_retry_wait = 0
+        failed_id = self.store(writer)
+        writer.failed = writer._drain(1)
+        message_ids = [self.store(writer) for _ in range(2)]
+
+        batch = writer._next_batch()
+        self.assertEqual([failed_id, message_ids[0]], [activity.id for activity, _, _ in batch])
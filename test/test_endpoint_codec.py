@@ -0,0 +1,89 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+from unittest import TestCase
+
+from kombu import serialization
+
+from dino.endpoint import codec
+from dino.endpoint.codec import Codec
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+
+class MissingCodec(Codec):
+    name = 'missing'
+    codec_id = 99
+    content_type = 'application/x-missing'
+
+    def __init__(self):
+        raise ImportError('No module named missing')
+
+
+class CodecTest(TestCase):
+    MESSAGE = {
+        'id': '1234',
+        'verb': 'send',
+        'actor': {'id': '0', 'displayName': 'YmF0bWFu'},
+        'object': {'content': 'aGVsbG8=', 'attachments': [{'objectType': 'room', 'id': '5678'}]}
+    }
+
+    def setUp(self):
+        codec.CODECS[MissingCodec.name] = MissingCodec
+
+    def tearDown(self):
+        del codec.CODECS[MissingCodec.name]
+
+    def test_json_has_no_header(self):
+        data = codec.encode(CodecTest.MESSAGE, codec.get_codec(codec.CODEC_JSON))
+        self.assertEqual(CodecTest.MESSAGE, json.loads(data.decode('utf-8')))
+
+    def test_default_is_json(self):
+        self.assertEqual(codec.CODEC_JSON, codec.get_codec().name)
+        self.assertEqual(codec.CODEC_JSON, codec.get_codec('').name)
+
+    def test_orjson_round_trip(self):
+        data = codec.encode(CodecTest.MESSAGE, codec.get_codec(codec.CODEC_ORJSON))
+        self.assertEqual(bytes([codec.MAGIC, codec.WIRE_VERSION, 1]), data[:codec.HEADER_SIZE])
+        self.assertEqual(CodecTest.MESSAGE, codec.decode(data))
+
+    def test_decode_without_header_is_json(self):
+        self.assertEqual(CodecTest.MESSAGE, codec.decode(json.dumps(CodecTest.MESSAGE).encode('utf-8')))
+        self.assertEqual(CodecTest.MESSAGE, codec.decode(json.dumps(CodecTest.MESSAGE)))
+
+    def test_decode_already_decoded(self):
+        self.assertEqual(CodecTest.MESSAGE, codec.decode(CodecTest.MESSAGE))
+
+    def test_newer_wire_version_raises(self):
+        data = bytes([codec.MAGIC, codec.WIRE_VERSION + 1, 0]) + b'{}'
+        self.assertRaises(RuntimeError, codec.decode, data)
+
+    def test_unknown_codec_id_raises(self):
+        self.assertRaises(RuntimeError, codec.decode, bytes([codec.MAGIC, codec.WIRE_VERSION, 123]) + b'{}')
+
+    def test_header_for_codec_not_installed_raises(self):
+        data = bytes([codec.MAGIC, codec.WIRE_VERSION, MissingCodec.codec_id]) + b'{}'
+        self.assertRaises(RuntimeError, codec.decode, data)
+
+    def test_unknown_codec_name_raises(self):
+        self.assertRaises(RuntimeError, codec.get_codec, 'xml')
+
+    def test_codec_not_installed_falls_back_to_json(self):
+        self.assertEqual(codec.CODEC_JSON, codec.get_codec(MissingCodec.name).name)
+
+    def test_registered_with_kombu(self):
+        orjson_codec = codec.get_codec(codec.CODEC_ORJSON)
+        content_type, content_encoding, data = serialization.dumps(CodecTest.MESSAGE, serializer=orjson_codec.name)
+
+        self.assertEqual(orjson_codec.content_type, content_type)
+        self.assertEqual(CodecTest.MESSAGE, serialization.loads(data, content_type, content_encoding))
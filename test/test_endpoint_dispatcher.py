@@ -0,0 +1,81 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from unittest import TestCase
+
+import eventlet
+
+from dino.endpoint.dispatcher import PartitionedDispatcher
+from dino.stats.statsd import MockStatsd
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+
+class FakeEnv(object):
+    def __init__(self):
+        self.stats = MockStatsd()
+        self.n_exceptions = 0
+
+    def capture_exception(self, *args):
+        self.n_exceptions += 1
+
+
+class PartitionedDispatcherTest(TestCase):
+    def setUp(self):
+        self.env = FakeEnv()
+        self.dispatcher = PartitionedDispatcher(self.env, concurrency=4)
+        self.handled = list()
+
+    def handle(self, key: str, value: int, wait: float=0) -> None:
+        eventlet.sleep(wait)
+        self.handled.append((key, value))
+
+    def test_same_key_is_handled_in_order(self):
+        # the first one is slowest, so it would finish last if they were handled concurrently
+        for value in range(5):
+            self.dispatcher.dispatch('room-1', 'send', self.handle, 'room-1', value, 0.05 - value * 0.01)
+        self.dispatcher.wait_until_done()
+
+        self.assertEqual([('room-1', value) for value in range(5)], self.handled)
+
+    def test_slow_task_does_not_block_other_keys(self):
+        key_a, key_b = self.keys_in_different_partitions()
+        self.dispatcher.dispatch(key_a, 'ban', self.handle, key_a, 0, 0.1)
+        self.dispatcher.dispatch(key_b, 'kick', self.handle, key_b, 1)
+        self.dispatcher.wait_until_done()
+
+        self.assertEqual([(key_b, 1), (key_a, 0)], self.handled)
+
+    def test_failing_task_does_not_stop_partition(self):
+        self.dispatcher.dispatch('room-1', 'send', self.failing_task)
+        self.dispatcher.dispatch('room-1', 'send', self.handle, 'room-1', 1)
+        self.dispatcher.wait_until_done()
+
+        self.assertEqual([('room-1', 1)], self.handled)
+        self.assertEqual(1, self.env.n_exceptions)
+
+    def test_latency_per_name(self):
+        self.dispatcher.dispatch('room-1', 'kick', self.handle, 'room-1', 1)
+        self.dispatcher.wait_until_done()
+
+        self.assertIn('queue.internal.kick.time', self.env.stats.timings)
+        self.assertIn('queue.internal.kick.wait', self.env.stats.timings)
+
+    def failing_task(self) -> None:
+        raise RuntimeError('failing on purpose')
+
+    def keys_in_different_partitions(self) -> tuple:
+        partition = self.dispatcher.partition_for('room-0')
+        for i in range(1, 100):
+            if self.dispatcher.partition_for('room-%s' % i) is not partition:
+                return 'room-0', 'room-%s' % i
+        raise AssertionError('all keys in the same partition')
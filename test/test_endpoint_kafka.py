@@ -0,0 +1,294 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from unittest import TestCase
+from uuid import uuid4 as uuid
+
+import eventlet
+from eventlet.event import Event
+
+from dino import environ
+from dino.config import ConfigKeys
+from dino.endpoint.base import PublishException
+from dino.endpoint.kafka import KafkaPublisher
+from dino.endpoint.kafka import BUFFER_POLICY_BLOCK
+from dino.endpoint.kafka import DEFAULT_MAX_BLOCK_MS
+from dino.endpoint.pubsub import PubSub
+from dino.stats.statsd import MockStatsd
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+
+class FakeFuture(object):
+    def __init__(self):
+        self.callbacks = list()
+        self.errbacks = list()
+
+    def add_callback(self, func, *args):
+        self.callbacks.append((func, args))
+
+    def add_errback(self, func, *args):
+        self.errbacks.append((func, args))
+
+    def succeed(self):
+        for func, args in self.callbacks:
+            func(*args, 'metadata')
+
+    def fail(self, exception):
+        for func, args in self.errbacks:
+            func(*args, exception)
+
+    def get(self, timeout=None):
+        return 'metadata'
+
+
+class FailingFuture(FakeFuture):
+    def get(self, timeout=None):
+        raise RuntimeError('timed out')
+
+
+class FakeProducer(object):
+    def __init__(self, fail: bool=False, fail_delivery: bool=False):
+        self.fail = fail
+        self.fail_delivery = fail_delivery
+        self.sent = list()
+
+    def send(self, topic, value, key):
+        if self.fail:
+            raise RuntimeError('no brokers available')
+
+        future = FailingFuture() if self.fail_delivery else FakeFuture()
+        self.sent.append((value, future))
+        return future
+
+
+class BlockingProducer(FakeProducer):
+    """
+    blocks in send() until released, like when kafka is unavailable
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.released = Event()
+
+    def send(self, topic, value, key):
+        self.released.wait()
+        return super().send(topic, value, key)
+
+
+class CapturingKafkaPublisher(KafkaPublisher):
+    def create_producer(self, hosts: list, producer_args: dict):
+        self.producer_args = producer_args
+        return FakeProducer()
+
+
+class FakePublisher(object):
+    def __init__(self):
+        self.published = list()
+        self.released = None
+
+    def publish(self, message: dict, routing_key: str=None) -> None:
+        if self.released is not None:
+            # like the kombu publisher retrying while the internal queue is unavailable
+            self.released.wait()
+        self.published.append(message)
+
+
+class FakeEnv(object):
+    def __init__(self, config: dict):
+        self.config = environ.ConfigDict({ConfigKeys.EXTERNAL_QUEUE: config})
+        self.stats = MockStatsd()
+        self.enrichment_manager = None
+        self.internal_publisher = FakePublisher()
+
+    def capture_exception(self, _):
+        pass
+
+
+class KafkaPublisherTest(TestCase):
+    def setUp(self):
+        self.env = FakeEnv({
+            ConfigKeys.ASYNC_PUBLISH: True,
+            ConfigKeys.BUFFER_SIZE: 2
+        })
+        self.publisher = self.create_publisher()
+
+    def create_publisher(self):
+        # no host configured, so no producer is created, use the fake one instead
+        publisher = KafkaPublisher(self.env, is_external_queue=True)
+        publisher.queue = 'chat'
+        publisher.queue_connection = FakeProducer()
+        return publisher
+
+    def test_publish_does_not_wait_for_delivery(self):
+        self.publisher.publish(self.activity())
+        self.assertEqual(1, len(self.publisher.queue_connection.sent))
+        self.assertNotIn('publish.external.count', self.env.stats.vals)
+
+    def test_delivered_is_counted(self):
+        self.publisher.publish(self.activity())
+        _, future = self.publisher.queue_connection.sent[0]
+        future.succeed()
+
+        self.assertEqual(1, self.env.stats.vals['publish.external.count'])
+        self.assertIn('publish.external.time', self.env.stats.timings)
+
+    def test_dropped_when_buffer_is_full(self):
+        for _ in range(3):
+            self.publisher.publish(self.activity())
+
+        self.assertEqual(2, len(self.publisher.queue_connection.sent))
+        self.assertEqual(1, self.env.stats.vals['publish.external.dropped'])
+
+    def test_delivered_frees_buffer(self):
+        for _ in range(2):
+            self.publisher.publish(self.activity())
+        for _, future in self.publisher.queue_connection.sent:
+            future.succeed()
+
+        self.publisher.publish(self.activity())
+        self.assertEqual(3, len(self.publisher.queue_connection.sent))
+        self.assertNotIn('publish.external.dropped', self.env.stats.vals)
+
+    def test_failed_is_republished_internally(self):
+        activity = self.activity()
+        self.publisher.publish(activity)
+        _, future = self.publisher.queue_connection.sent[0]
+        future.fail(RuntimeError('timed out'))
+        eventlet.sleep(0)
+
+        self.assertEqual([activity['id']], [message['id'] for message in self.env.internal_publisher.published])
+        self.assertEqual(1, self.env.stats.vals['publish.error'])
+
+        # the failed event doesn't hold a place in the buffer anymore
+        for _ in range(2):
+            self.publisher.publish(self.activity())
+        self.assertNotIn('publish.external.dropped', self.env.stats.vals)
+
+    def test_failed_callback_does_not_wait_for_internal_queue(self):
+        self.env.internal_publisher.released = Event()
+        self.publisher.publish(self.activity())
+        _, future = self.publisher.queue_connection.sent[0]
+
+        # would never return if the internal publish was done in the callback
+        future.fail(RuntimeError('timed out'))
+        self.assertEqual(0, len(self.env.internal_publisher.published))
+
+        self.env.internal_publisher.released.send()
+        eventlet.sleep(0.01)
+        self.assertEqual(1, len(self.env.internal_publisher.published))
+
+    def test_send_error_raises(self):
+        self.publisher.queue_connection = FakeProducer(fail=True)
+        self.assertRaises(PublishException, self.publisher.publish, self.activity())
+        self.assertEqual(2, self.publisher.in_flight.balance)
+
+    def test_same_event_only_sent_once(self):
+        activity = self.activity()
+        self.publisher.publish(activity)
+        self.publisher.publish(activity)
+        self.assertEqual(1, len(self.publisher.queue_connection.sent))
+
+    def test_sync_publish_counted_when_sent(self):
+        self.env = FakeEnv(dict())
+        self.publisher = self.create_publisher()
+        self.publisher.publish(self.activity())
+
+        self.assertEqual(1, len(self.publisher.queue_connection.sent))
+        self.assertEqual(1, self.env.stats.vals['publish.external.count'])
+
+    def test_unknown_buffer_policy(self):
+        self.env = FakeEnv({ConfigKeys.BUFFER_POLICY: 'wait'})
+        self.assertRaises(RuntimeError, self.create_publisher)
+
+    def activity(self) -> dict:
+        return {
+            'id': str(uuid()),
+            'verb': 'send',
+            'actor': {'id': '1234'},
+            'target': {'id': str(uuid())}
+        }
+
+    def test_producer_does_not_block_for_long(self):
+        self.env = FakeEnv({
+            ConfigKeys.ASYNC_PUBLISH: True,
+            ConfigKeys.HOST: 'localhost:9092',
+            ConfigKeys.QUEUE: 'chat'
+        })
+        publisher = CapturingKafkaPublisher(self.env, is_external_queue=True)
+        self.assertEqual(DEFAULT_MAX_BLOCK_MS, publisher.producer_args['max_block_ms'])
+
+    def test_max_block_ms_from_config(self):
+        self.env = FakeEnv({
+            ConfigKeys.ASYNC_PUBLISH: True,
+            ConfigKeys.HOST: 'localhost:9092',
+            ConfigKeys.QUEUE: 'chat',
+            ConfigKeys.MAX_BLOCK_MS: 20
+        })
+        publisher = CapturingKafkaPublisher(self.env, is_external_queue=True)
+        self.assertEqual(20, publisher.producer_args['max_block_ms'])
+
+
+class PubSubKafkaTest(TestCase):
+    def create_pub_sub(self, config: dict) -> PubSub:
+        env = FakeEnv(config)
+        env.config.set(ConfigKeys.TESTING, True)
+
+        env.external_publisher = KafkaPublisher(env, is_external_queue=True)
+        env.external_publisher.queue = 'chat'
+        return PubSub(env)
+
+    def activity(self) -> dict:
+        return {'id': str(uuid()), 'verb': 'send', 'actor': {'id': '1234'}, 'target': {'id': '5678'}}
+
+    def test_drop_policy_publishes_directly(self):
+        pub_sub = self.create_pub_sub({ConfigKeys.ASYNC_PUBLISH: True})
+        producer = pub_sub.env.external_publisher.queue_connection = FakeProducer()
+
+        pub_sub.do_publish(self.activity(), external=True)
+        self.assertEqual(1, len(producer.sent))
+
+    def test_block_policy_does_not_block_caller(self):
+        pub_sub = self.create_pub_sub({ConfigKeys.ASYNC_PUBLISH: True, ConfigKeys.BUFFER_POLICY: BUFFER_POLICY_BLOCK})
+        producer = pub_sub.env.external_publisher.queue_connection = BlockingProducer()
+
+        # would never return if send() was called by the caller
+        pub_sub.do_publish(self.activity(), external=True)
+        self.assertEqual(0, len(producer.sent))
+
+        producer.released.send()
+        eventlet.sleep(0.01)
+        self.assertEqual(1, len(producer.sent))
+
+    def test_sync_publisher_does_not_block_caller(self):
+        pub_sub = self.create_pub_sub(dict())
+        producer = pub_sub.env.external_publisher.queue_connection = BlockingProducer()
+
+        pub_sub.do_publish(self.activity(), external=True)
+        self.assertEqual(0, len(producer.sent))
+
+        producer.released.send()
+        eventlet.sleep(0.01)
+        self.assertEqual(1, len(producer.sent))
+
+    def test_failed_publish_does_not_wait_for_internal_queue(self):
+        pub_sub = self.create_pub_sub({ConfigKeys.ASYNC_PUBLISH: True})
+        pub_sub.env.external_publisher.queue_connection = FakeProducer(fail=True)
+        pub_sub.env.internal_publisher.released = Event()
+
+        # would never return if the internal publish was done by the caller
+        pub_sub.do_publish(self.activity(), external=True)
+        self.assertEqual(0, len(pub_sub.env.internal_publisher.published))
+
+        pub_sub.env.internal_publisher.released.send()
+        eventlet.sleep(0.01)
+        self.assertEqual(1, len(pub_sub.env.internal_publisher.published))
@@ -0,0 +1,271 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from uuid import uuid4 as uuid
+
+from dino import environ
+from dino.config import ConfigKeys
+from dino.endpoint.base import PublishException
+from dino.endpoint.kafka import KafkaPublisher
+from dino.endpoint.outbox import Outbox
+from dino.endpoint.pubsub import PubSub
+from dino.stats.statsd import MockStatsd
+from test.test_endpoint_kafka import FakeProducer
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+
+class FakePublisher(object):
+    def __init__(self):
+        self.published = list()
+        self.down = False
+
+    def publish(self, message: dict, routing_key: str=None) -> None:
+        if self.down:
+            raise PublishException()
+        self.published.append(message)
+
+    def publish_and_wait(self, messages: list, timeout: float=None) -> int:
+        if self.down:
+            return 0
+        self.published.extend(messages)
+        return len(messages)
+
+
+class WaitRecordingProducer(FakeProducer):
+    """
+    remembers how many events had been sent when each future was waited on
+    """
+    def __init__(self, fail_after: int=None):
+        super(WaitRecordingProducer, self).__init__()
+        self.fail_after = fail_after
+        self.sent_when_waited = list()
+
+    def send(self, topic, value, key):
+        future = super(WaitRecordingProducer, self).send(topic, value, key)
+        n_sent = len(self.sent)
+        producer = self
+
+        def get(timeout=None):
+            producer.sent_when_waited.append(len(producer.sent))
+            if producer.fail_after is not None and n_sent > producer.fail_after:
+                raise RuntimeError('timed out')
+            return 'metadata'
+
+        future.get = get
+        return future
+
+
+class FakeEnv(object):
+    def __init__(self):
+        self.config = environ.ConfigDict({ConfigKeys.TESTING: True})
+        self.stats = MockStatsd()
+        self.external_publisher = FakePublisher()
+        self.internal_publisher = FakePublisher()
+
+    def capture_exception(self, _):
+        pass
+
+
+class OutboxTest(TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.env = FakeEnv()
+        self.outbox = self.create_outbox()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def create_outbox(self, max_size: int=10, replay_window: int=100) -> Outbox:
+        return Outbox(
+            self.env, self.path, max_size=max_size, replay_rate=10000, retry_interval=0, replay_window=replay_window)
+
+    def test_replayed_when_queue_is_back(self):
+        message = self.activity()
+        self.outbox.add(message)
+        self.assertTrue(self.outbox.is_failing())
+
+        self.assertTrue(self.outbox.replay())
+        self.assertEqual([message], self.env.external_publisher.published)
+        self.assertFalse(self.outbox.is_failing())
+        self.assertEqual(0, self.outbox.size())
+        self.assertEqual(0, len(os.listdir(self.path)))
+
+    def test_kept_while_queue_is_down(self):
+        self.env.external_publisher.down = True
+        self.outbox.add(self.activity())
+
+        self.assertFalse(self.outbox.replay())
+        self.assertTrue(self.outbox.is_failing())
+        self.assertEqual(1, self.outbox.size())
+
+    def test_replayed_in_order(self):
+        messages = [self.activity() for _ in range(3)]
+        for message in messages:
+            self.outbox.add(message)
+
+        while self.outbox.replay():
+            pass
+        self.assertEqual(messages, self.env.external_publisher.published)
+
+    def test_replayed_in_windows(self):
+        outbox = self.create_outbox(replay_window=2)
+        messages = [self.activity() for _ in range(5)]
+        for message in messages:
+            outbox.add(message)
+
+        self.assertTrue(outbox.replay())
+        self.assertEqual(messages[:2], self.env.external_publisher.published)
+        self.assertEqual(3, outbox.size())
+
+    def test_dropped_when_full(self):
+        outbox = self.create_outbox(max_size=2)
+        results = [outbox.add(self.activity()) for _ in range(3)]
+
+        self.assertEqual([True, True, False], results)
+        self.assertEqual(2, outbox.size())
+        self.assertEqual(1, self.env.stats.vals['publish.outbox.dropped'])
+
+    def test_recovered_after_restart(self):
+        message = self.activity()
+        self.outbox.add(message)
+
+        outbox = self.create_outbox()
+        self.assertEqual(1, outbox.size())
+        self.assertTrue(outbox.replay())
+        self.assertEqual([message], self.env.external_publisher.published)
+        self.assertEqual(0, len(os.listdir(self.path)))
+
+    def test_nothing_to_replay(self):
+        self.assertFalse(self.outbox.replay())
+
+    def activity(self) -> dict:
+        return {'id': str(uuid()), 'verb': 'send'}
+
+
+class PubSubOutboxTest(TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.env = FakeEnv()
+        self.pub_sub = PubSub(self.env)
+        self.pub_sub.outbox = Outbox(self.env, self.path, replay_rate=10000, retry_interval=0)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_failed_event_is_added_to_outbox(self):
+        self.env.external_publisher.down = True
+        self.pub_sub._do_publish_external({'id': str(uuid()), 'verb': 'send'})
+
+        self.assertEqual(1, self.pub_sub.outbox.size())
+        self.assertEqual(0, len(self.env.internal_publisher.published))
+
+    def test_new_events_skip_publisher_while_failing(self):
+        self.env.external_publisher.down = True
+        self.pub_sub._do_publish_external({'id': str(uuid()), 'verb': 'send'})
+
+        self.env.external_publisher.down = False
+        self.pub_sub._do_publish_external({'id': str(uuid()), 'verb': 'send'})
+        self.assertEqual(2, self.pub_sub.outbox.size())
+        self.assertEqual(0, len(self.env.external_publisher.published))
+
+    def test_published_directly_after_outbox_recovered(self):
+        self.pub_sub.outbox.add({'id': str(uuid()), 'verb': 'send'})
+        self.pub_sub.outbox.replay()
+
+        self.pub_sub._do_publish_external({'id': str(uuid()), 'verb': 'send'})
+        self.assertEqual(2, len(self.env.external_publisher.published))
+        self.assertEqual(0, self.pub_sub.outbox.size())
+
+
+class AsyncKafkaOutboxTest(TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.env = FakeEnv()
+        self.env.config.set(ConfigKeys.ASYNC_PUBLISH, True, domain=ConfigKeys.EXTERNAL_QUEUE)
+        self.env.config.set(ConfigKeys.BUFFER_SIZE, 1, domain=ConfigKeys.EXTERNAL_QUEUE)
+        self.env.enrichment_manager = None
+
+        self.publisher = KafkaPublisher(self.env, is_external_queue=True)
+        self.publisher.queue = 'chat'
+        self.publisher.queue_connection = FakeProducer()
+        self.env.external_publisher = self.publisher
+
+        self.outbox = Outbox(self.env, self.path, replay_rate=10000, retry_interval=0)
+        self.publisher.outbox = self.outbox
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def activity(self) -> dict:
+        return {'id': str(uuid()), 'verb': 'send', 'actor': {'id': '1234'}, 'target': {'id': '5678'}}
+
+    def test_failed_delivery_is_added_to_outbox(self):
+        self.publisher.publish(self.activity())
+        _, future = self.publisher.queue_connection.sent[0]
+        future.fail(RuntimeError('timed out'))
+
+        self.assertEqual(1, self.outbox.size())
+        self.assertEqual(0, len(self.env.internal_publisher.published))
+
+    def test_dropped_event_is_added_to_outbox(self):
+        self.publisher.publish(self.activity())
+        self.publisher.publish(self.activity())
+
+        self.assertEqual(1, len(self.publisher.queue_connection.sent))
+        self.assertEqual(1, self.outbox.size())
+
+    def test_replayed_event_kept_until_delivered(self):
+        self.outbox.add(self.activity())
+        self.publisher.queue_connection = FakeProducer(fail_delivery=True)
+
+        self.assertFalse(self.outbox.replay())
+        self.assertEqual(1, self.outbox.size())
+        self.assertEqual(1, len(os.listdir(self.path)))
+
+        self.publisher.queue_connection = FakeProducer()
+        self.assertTrue(self.outbox.replay())
+        self.assertEqual(0, self.outbox.size())
+        self.assertEqual(0, len(os.listdir(self.path)))
+
+    def test_replay_of_failed_event_is_not_ignored_as_already_sent(self):
+        activity = self.activity()
+        self.publisher.publish(activity)
+        _, future = self.publisher.queue_connection.sent[0]
+        future.fail(RuntimeError('timed out'))
+
+        self.assertTrue(self.outbox.replay())
+        self.assertEqual(2, len(self.publisher.queue_connection.sent))
+
+    def test_window_is_sent_before_waiting(self):
+        for _ in range(3):
+            self.outbox.add(self.activity())
+        self.publisher.queue_connection = WaitRecordingProducer()
+
+        self.assertTrue(self.outbox.replay())
+        self.assertEqual([3, 3, 3], self.publisher.queue_connection.sent_when_waited)
+        self.assertEqual(0, self.outbox.size())
+        self.assertEqual(0, len(os.listdir(self.path)))
+
+    def test_events_after_failed_one_are_kept(self):
+        messages = [self.activity() for _ in range(3)]
+        for message in messages:
+            self.outbox.add(message)
+        self.publisher.queue_connection = WaitRecordingProducer(fail_after=1)
+
+        self.assertFalse(self.outbox.replay())
+        self.assertTrue(self.outbox.is_failing())
+        self.assertEqual(messages[1:], [message for _, message in self.outbox.entries])
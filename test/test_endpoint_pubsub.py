@@ -0,0 +1,120 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from unittest import TestCase
+from uuid import uuid4 as uuid
+
+from dino import environ
+from dino.cache.redis import CacheRedis
+from dino.config import ConfigKeys
+from dino.endpoint.pubsub import PubSub
+from dino.stats.statsd import MockStatsd
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+
+class FakePublisher(object):
+    def __init__(self):
+        self.published = list()
+
+    def publish(self, message: dict, routing_key: str=None) -> None:
+        self.published.append((routing_key, message.copy()))
+
+
+class FakeDb(object):
+    def __init__(self):
+        self.sids = dict()
+
+    def get_sids_for_user(self, user_id: str):
+        return self.sids.get(user_id)
+
+
+class PubSubDirectedTest(TestCase):
+    USER_ID = '1234'
+
+    def setUp(self):
+        environ.env.config.set(ConfigKeys.TESTING, True)
+        self.db, self.cache, self.stats = environ.env.db, environ.env.cache, environ.env.stats
+        self.internal_publisher = environ.env.internal_publisher
+
+        environ.env.db = FakeDb()
+        environ.env.cache = CacheRedis(environ.env, 'mock')
+        environ.env.cache.redis.flushall()
+        environ.env.stats = MockStatsd()
+        environ.env.internal_publisher = FakePublisher()
+        self.pub_sub = PubSub(environ.env)
+
+    def tearDown(self):
+        environ.env.db, environ.env.cache, environ.env.stats = self.db, self.cache, self.stats
+        environ.env.internal_publisher = self.internal_publisher
+
+    def test_kick_is_sent_to_nodes_of_user(self):
+        environ.env.db.sids[PubSubDirectedTest.USER_ID] = ['sid-1', 'sid-2']
+        environ.env.cache.set_node_for_sid('sid-1', 'node-a')
+        environ.env.cache.set_node_for_sid('sid-2', 'node-b')
+
+        self.pub_sub._do_publish_internal(self.activity('kick'))
+        published = environ.env.internal_publisher.published
+        self.assertEqual({'node-a', 'node-b'}, {routing_key for routing_key, _ in published})
+        self.assertTrue(all(message['directed'] for _, message in published))
+
+    def test_ban_is_broadcast_even_if_nodes_of_user_are_known(self):
+        # the node in the registry might be gone, and the ban has to be created by some node
+        environ.env.db.sids[PubSubDirectedTest.USER_ID] = ['sid-1']
+        environ.env.cache.set_node_for_sid('sid-1', 'node-a')
+
+        self.pub_sub._do_publish_internal(self.activity('ban'))
+        published = environ.env.internal_publisher.published
+        self.assertEqual([None], [routing_key for routing_key, _ in published])
+        self.assertNotIn('directed', published[0][1])
+
+    def test_broadcast_if_node_of_a_sid_is_unknown(self):
+        environ.env.db.sids[PubSubDirectedTest.USER_ID] = ['sid-1', 'sid-2']
+        environ.env.cache.set_node_for_sid('sid-1', 'node-a')
+
+        self.pub_sub._do_publish_internal(self.activity('kick'))
+        self.assertEqual([None], [routing_key for routing_key, _ in environ.env.internal_publisher.published])
+
+    def test_broadcast_if_user_not_connected(self):
+        self.pub_sub._do_publish_internal(self.activity('kick'))
+        self.assertEqual([None], [routing_key for routing_key, _ in environ.env.internal_publisher.published])
+
+    def test_broadcast_other_verbs(self):
+        environ.env.db.sids[PubSubDirectedTest.USER_ID] = ['sid-1']
+        environ.env.cache.set_node_for_sid('sid-1', 'node-a')
+
+        self.pub_sub._do_publish_internal(self.activity('remove'))
+        self.assertEqual([None], [routing_key for routing_key, _ in environ.env.internal_publisher.published])
+
+    def test_broadcast_if_already_sent_around(self):
+        environ.env.db.sids[PubSubDirectedTest.USER_ID] = ['sid-1']
+        environ.env.cache.set_node_for_sid('sid-1', 'node-a')
+
+        activity = self.activity('kick')
+        activity['revision'] = 0
+        self.pub_sub._do_publish_internal(activity)
+        self.assertEqual([None], [routing_key for routing_key, _ in environ.env.internal_publisher.published])
+
+    def activity(self, verb: str) -> dict:
+        return {
+            'actor': {
+                'id': '0'
+            },
+            'verb': verb,
+            'object': {
+                'id': PubSubDirectedTest.USER_ID
+            },
+            'target': {
+                'url': '/ws'
+            },
+            'id': str(uuid())
+        }
@@ -134,3 +134,56 @@ class SocketsTest(unittest.TestCase):
         }
         sockets.socketio.server = MockServer()
         sockets.queue_handler.handle_server_activity(activity, as_parser(activity))
+
+    def test_directed_kick_for_user_not_on_node_is_broadcast(self):
+        published = list()
+        self.addCleanup(setattr, environ.env, 'publish', environ.env.publish)
+        environ.env.publish = lambda message, external=False: published.append(message)
+
+        activity = {
+            'actor': {
+                'id': '1234',
+                'summary': 'good-guy'
+            },
+            'verb': 'kick',
+            'object': {
+                'id': '4321',
+                'summary': '5m'
+            },
+            'target': {
+                'url': '/chat'
+            },
+            'id': str(uuid()),
+            'directed': True
+        }
+        sockets.socketio.server = MockServer()
+        sockets.queue_handler.handle_server_activity(activity, as_parser(activity))
+
+        self.assertEqual(1, len(published))
+        self.assertEqual(0, published[0]['revision'])
+        self.assertNotIn('directed', published[0])
+
+    def test_ban_for_user_not_on_node_is_not_published_again(self):
+        published = list()
+        self.addCleanup(setattr, environ.env, 'publish', environ.env.publish)
+        environ.env.publish = lambda message, external=False: published.append(message)
+
+        activity = {
+            'actor': {
+                'id': '1234',
+                'summary': 'good-guy'
+            },
+            'verb': 'ban',
+            'object': {
+                'id': '4321',
+                'summary': '5m'
+            },
+            'target': {
+                'url': '/chat'
+            },
+            'id': str(uuid())
+        }
+        sockets.socketio.server = MockServer()
+        sockets.queue_handler.handle_server_activity(activity, as_parser(activity))
+
+        self.assertEqual(0, len(published))
@@ -0,0 +1,156 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from unittest import TestCase
+
+from activitystreams import parse as as_parser
+
+from dino.config import ConfigKeys
+from dino.environ import ConfigDict
+from dino.stats.statsd import MockStatsd
+from dino.utils import b64e
+from dino.utils.blacklist import BlackListChecker
+from dino.utils.blacklist import WordMatcher
+from dino.utils.blacklist import REBUILD_AFTER_N_CHANGES
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+
+class WordMatcherTest(TestCase):
+    def test_contains_word(self):
+        matcher = WordMatcher({'he', 'she', 'his', 'hers'})
+        self.assertTrue(matcher.contains_any('ushers'))
+        self.assertTrue(matcher.contains_any('ahishers'))
+        self.assertFalse(matcher.contains_any('shhh'))
+
+    def test_word_is_suffix_of_failed_match(self):
+        matcher = WordMatcher({'abcd', 'bc'})
+        self.assertTrue(matcher.contains_any('abce'))
+
+    def test_phrase(self):
+        matcher = WordMatcher({'the donald'})
+        self.assertFalse(matcher.contains_any('the one called donald'))
+        self.assertTrue(matcher.contains_any('hail the donald'))
+
+    def test_empty_word_matches_everything(self):
+        self.assertTrue(WordMatcher({''}).contains_any('anything'))
+
+    def test_same_as_linear_scan(self):
+        words = {'abc', 'bca', 'cab', 'aa', 'bb', 'abcabc', 'cc'}
+        matcher = WordMatcher(words)
+
+        for text in ['a', 'ab', 'abab', 'acacac', 'bcbcb', 'aabb', 'cbacba', 'xcabx', 'bacbac', '']:
+            self.assertEqual(any(word in text for word in words), matcher.contains_any(text), text)
+
+
+class BlackListCheckerTest(TestCase):
+    class FakeDb(object):
+        def __init__(self):
+            self.blacklist = set()
+
+        def get_black_list(self):
+            return self.blacklist
+
+    class FakeCache(object):
+        def __init__(self):
+            self.version = 0
+
+        def get_black_list_version(self):
+            return self.version
+
+    class FakeEnv(object):
+        def __init__(self):
+            self.config = ConfigDict()
+            self.config.set(ConfigKeys.TESTING, True)
+            self.stats = MockStatsd()
+            self.db = BlackListCheckerTest.FakeDb()
+            self.cache = BlackListCheckerTest.FakeCache()
+
+    def setUp(self):
+        self.env = BlackListCheckerTest.FakeEnv()
+        self.checker = BlackListChecker(self.env)
+
+    def set_blacklist(self, words: set) -> None:
+        # a new object, as when the cached blacklist has been reset
+        self.env.db.blacklist = set(words)
+        self.env.cache.version += 1
+
+    def check(self, message: str):
+        return self.checker.contains_blacklisted_word(as_parser({
+            'actor': {'id': '1234'},
+            'verb': 'send',
+            'object': {'content': b64e(message)}
+        }))
+
+    def test_no_blacklist(self):
+        self.assertIsNone(self.check('anything'))
+
+    def test_returns_matched_word(self):
+        self.set_blacklist({'the donald', 'badword'})
+        self.assertEqual('the donald', self.check('Hail The Donald!'))
+        self.assertIsNone(self.check('donald'))
+        self.assertIsNotNone(self.checker.matcher)
+
+    def test_added_words_are_matched_before_rebuild(self):
+        self.set_blacklist({'badword'})
+        self.check('hello')
+        matcher = self.checker.matcher
+
+        self.set_blacklist({'badword', 'newword'})
+        self.assertEqual('newword', self.check('a newword'))
+        self.assertIs(matcher, self.checker.matcher)
+
+    def test_removed_words_are_not_matched_before_rebuild(self):
+        self.set_blacklist({'badword', 'oldword'})
+        self.check('hello')
+        matcher = self.checker.matcher
+
+        self.set_blacklist({'badword'})
+        self.assertIsNone(self.check('an oldword'))
+        self.assertIs(matcher, self.checker.matcher)
+
+    def test_rebuilt_after_many_changes(self):
+        self.set_blacklist({'badword'})
+        self.check('hello')
+        matcher = self.checker.matcher
+
+        self.set_blacklist({'<word-%s>' % i for i in range(REBUILD_AFTER_N_CHANGES)})
+        self.assertEqual('<word-42>', self.check('a <word-42>'))
+        self.assertIsNot(matcher, self.checker.matcher)
+        self.assertEqual(0, len(self.checker.added) + len(self.checker.removed))
+
+    def test_word_added_in_place_is_matched(self):
+        self.set_blacklist({'badword'})
+        self.check('hello')
+
+        # the cache adds words to the cached set itself
+        self.env.db.blacklist.add('newword')
+        self.env.cache.version += 1
+        self.assertEqual('newword', self.check('a newword'))
+
+    def test_not_compared_again_if_version_is_the_same(self):
+        self.set_blacklist({'badword'})
+        self.check('hello')
+
+        # e.g. the db returns a new set for every call
+        blacklist = self.env.db.blacklist
+        self.env.db.blacklist = {'badword'}
+        self.assertIsNone(self.check('hello'))
+        self.assertIs(blacklist, self.checker.blacklist)
+
+    def test_changes_noticed_without_version(self):
+        self.env.cache.version = None
+        self.env.db.blacklist = {'badword'}
+        self.check('hello')
+
+        self.env.db.blacklist = {'badword', 'newword'}
+        self.assertEqual('newword', self.check('a newword'))
@@ -0,0 +1,89 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from dino.utils.spool import Spool
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+
+class SpoolTest(TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def files(self) -> list:
+        return sorted(os.listdir(self.path))
+
+    def test_entries_are_recovered_after_restart(self):
+        spool = Spool(self.path, 'test')
+        spool.append({'a': 1})
+        spool.append({'b': 2})
+
+        self.assertEqual([{'a': 1}, {'b': 2}], Spool(self.path, 'test').recover())
+
+    def test_sync_before_and_after_append(self):
+        spool = Spool(self.path, 'test')
+        spool.sync()
+        spool.append({'a': 1})
+        spool.sync()
+
+        self.assertEqual([{'a': 1}], Spool(self.path, 'test').recover())
+
+    def test_done_segments_are_removed(self):
+        spool = Spool(self.path, 'test', segment_size=2)
+        first = spool.append({'a': 1})
+        spool.append({'b': 2})
+        third = spool.append({'c': 3})
+        self.assertEqual(2, len(self.files()))
+
+        spool.done(first, 2)
+        self.assertEqual(1, len(self.files()))
+        self.assertEqual([{'c': 3}], Spool(self.path, 'test').recover())
+
+        spool.done(third)
+        self.assertEqual(0, len(self.files()))
+
+        spool.append({'d': 4})
+        self.assertEqual([{'d': 4}], Spool(self.path, 'test').recover())
+
+    def test_full_segment_done_before_rotation_is_removed_on_rotation(self):
+        spool = Spool(self.path, 'test', segment_size=1)
+        spool.done(spool.append({'a': 1}))
+        spool.append({'b': 2})
+        self.assertEqual([{'b': 2}], Spool(self.path, 'test').recover())
+
+    def test_partially_written_line_is_ignored(self):
+        spool = Spool(self.path, 'test')
+        spool.append({'a': 1})
+        spool.file.write('{"b": ')
+        spool.file.flush()
+
+        self.assertEqual([{'a': 1}], Spool(self.path, 'test').recover())
+
+    def test_remove_recovered(self):
+        Spool(self.path, 'test').append({'a': 1})
+
+        spool = Spool(self.path, 'test')
+        spool.append({'b': 2})
+        spool.remove_recovered()
+        self.assertEqual([{'b': 2}], Spool(self.path, 'test').recover())
+
+    def test_other_names_are_ignored(self):
+        Spool(self.path, 'other').append({'a': 1})
+        self.assertEqual([], Spool(self.path, 'test').recover())
@@ -18,6 +18,8 @@ from activitystreams import parse as as_parser
 
 from dino import environ
 from dino import utils
+from dino.cache.redis import CacheRedis
+from dino.environ import ConfigDict
 from dino.config import ConfigKeys
 from dino.config import ApiActions
 from dino.exceptions import NoOriginRoomException
@@ -457,3 +459,83 @@ class UtilsBanDurationTest(TestCase):
 
     def test_ban_duration_invalid_unit(self):
         self.assertRaises(ValueError, utils.ban_duration_to_timestamp, '5u')
+
+
+class UtilsRecentHistoryTest(TestCase):
+    ROOM_ID = '4567'
+
+    class FakeStorage(object):
+        def __init__(self):
+            self.messages = list()
+            self.n_reads = 0
+
+        def get_history(self, room_id: str, limit: int=100) -> list:
+            self.n_reads += 1
+            return self.messages[:limit]
+
+    def setUp(self):
+        self.old = environ.env.config, environ.env.cache, environ.env.storage
+
+        environ.env.config = ConfigDict()
+        environ.env.config.set(ConfigKeys.TESTING, True)
+        environ.env.config.set(ConfigKeys.HISTORY, {
+            ConfigKeys.TYPE: ConfigKeys.HISTORY_TYPE_TOP,
+            ConfigKeys.LIMIT: 2,
+            ConfigKeys.RECENT_HISTORY_CACHE: True
+        })
+        environ.env.cache = CacheRedis(environ.env, 'mock')
+        environ.env.cache._flushall()
+        environ.env.storage = UtilsRecentHistoryTest.FakeStorage()
+
+    def tearDown(self):
+        environ.env.config, environ.env.cache, environ.env.storage = self.old
+
+    def send(self, message_id: str):
+        activity = as_parser({
+            'id': message_id,
+            'verb': 'send',
+            'published': '2017-01-26T04:58:33Z',
+            'actor': {'id': '1234', 'displayName': utils.b64e('batman')},
+            'target': {'id': UtilsRecentHistoryTest.ROOM_ID, 'objectType': 'room'},
+            'object': {'content': utils.b64e('hi')}
+        })
+        environ.env.storage.messages.insert(0, {'message_id': message_id})
+        utils.add_to_recent_history(activity)
+
+    def history_ids(self) -> list:
+        history = utils.get_history_for_room(UtilsRecentHistoryTest.ROOM_ID, '1234')
+        return [message['message_id'] for message in history]
+
+    def test_history_read_from_storage_once(self):
+        self.send('1')
+        self.assertEqual(['1'], self.history_ids())
+        self.assertEqual(['1'], self.history_ids())
+        self.assertEqual(1, environ.env.storage.n_reads)
+
+    def test_new_messages_added_to_cached_history(self):
+        self.send('1')
+        self.history_ids()
+
+        self.send('2')
+        self.send('3')
+        self.assertEqual(['3', '2'], self.history_ids())
+        self.assertEqual(1, environ.env.storage.n_reads)
+
+        cached = environ.env.cache.get_recent_history(UtilsRecentHistoryTest.ROOM_ID, 2)
+        self.assertEqual('hi', cached[0]['body'])
+        self.assertEqual('batman', cached[0]['from_user_name'])
+
+    def test_history_read_from_storage_after_removed(self):
+        self.history_ids()
+        utils.remove_recent_history(UtilsRecentHistoryTest.ROOM_ID)
+        self.history_ids()
+        self.assertEqual(2, environ.env.storage.n_reads)
+
+    def test_not_cached_when_disabled(self):
+        environ.env.config.set(ConfigKeys.HISTORY, {
+            ConfigKeys.TYPE: ConfigKeys.HISTORY_TYPE_TOP,
+            ConfigKeys.LIMIT: 2
+        })
+        self.history_ids()
+        self.history_ids()
+        self.assertEqual(2, environ.env.storage.n_reads)